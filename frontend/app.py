@@ -3,8 +3,11 @@ import re
 import socket
 import json
 import traceback
-import math
 import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
 from collections import Counter
@@ -13,7 +16,7 @@ import numpy as np
 import tensorflow as tf
 import pickle
 import h5py  
-from flask import Flask, jsonify, request, render_template, session, flash, redirect, url_for, send_file
+from flask import Flask, jsonify, request, render_template, session, flash, redirect, url_for, send_file, Response, stream_with_context
 from werkzeug.middleware.proxy_fix import ProxyFix
 import ssl
 from sklearn.preprocessing import StandardScaler
@@ -24,8 +27,10 @@ import flask
 from dotenv import load_dotenv
 
 load_dotenv()
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: structured records written by a background thread
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from request_logging import configure_logging, init_request_logging, log_payload, get_logging_stats
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Attempt to import Firebase 
@@ -67,7 +72,27 @@ except ImportError:
 # Import model service - using direct path instead of package import
 import os.path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from model_service import get_model, get_scaler, get_status, predict
+from model_service import (get_model, get_scaler, get_status, predict, get_model_version, get_input_width,
+                           get_inference_model, get_inference_precision, get_inference_backend,
+                           get_warmup_status, is_ready, configure_threads)
+from feature_schema import FEATURE_SCHEMA, FeatureSchemaError
+from feature_store import configure_feature_store, host_of, registrable_domain
+from single_flight import SingleFlight
+from circuit_breaker import configure_breaker, guarded_call, get_breaker_status, fresh_error, ProviderUnavailableError
+from job_queue import JobQueue, JobWorkerPool, JobError
+from history_writer import HistoryWriter
+from history_schema import HistoryDetailStore, build_history_record, content_hash
+from token_cache import create_firebase_token_cache
+from provider_archive import configure_provider_archive
+from feature_explainer import explain_prediction
+from model_attributions import get_attributor, get_attribution_stats
+from url_lexer import scan_url, scan_host, entropy_from_counts, cache_info as lexer_cache_info
+from brand_lookalike import find_lookalike, lookalike_features
+from tls_cache import TLSCertCache, TLS_CACHE_MODE
+import metrics
+from metrics import stage_duration, outbound_calls, cache_lookups, tiered_scoring
+import timing
+from timing import span, timed
 
 # Add Beautiful Soup import
 try:
@@ -83,15 +108,22 @@ except ImportError:
 app = Flask(__name__)
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'default-secret-key')
+# Correlation ids and one access record per request
+init_request_logging(app)
+# Request counts, latency and in-flight gauges for /metrics
+metrics.init_app(app)
+metrics.start()
+# Opt-in span trees (?timings=1 or X-Timings: 1) on the analysis endpoints
+timing.init_app(app, endpoints=("predict", "analyze", "api_analyze_url"))
 
 # Initialize Firebase only if it's available
 if firebase_available:
     try:
         # Debug: Print the credential path and check if it exists
         cred_path = os.environ.get('FIREBASE_CREDENTIALS_PATH')
-        logger.info(f"FIREBASE_CREDENTIALS_PATH: {cred_path}")
+        logger.info("FIREBASE_CREDENTIALS_PATH: %s", cred_path)
         if cred_path:
-            logger.info(f"Credential file exists: {os.path.exists(cred_path)}")
+            logger.info("Credential file exists: %s", os.path.exists(cred_path))
         # Check if Firebase app is already initialized
         default_app = firebase_admin.get_app()
         logger.info("Using existing Firebase app")
@@ -103,17 +135,321 @@ if firebase_available:
             if cred_path and os.path.exists(cred_path):
                 cred = credentials.Certificate(cred_path)
                 firebase_admin.initialize_app(cred)
-                logger.info(f"Initialized Firebase with credentials from {cred_path}")
+                logger.info("Initialized Firebase with credentials from %s", cred_path)
             else:
                 # Initialize with default configuration
                 firebase_admin.initialize_app()
                 logger.info("Initialized Firebase with default configuration")
         except Exception as e:
-            logger.warning(f"Failed to initialize Firebase: {e}")
+            logger.warning("Failed to initialize Firebase: %s", e)
             logger.warning("Continuing without Firebase authentication")
 else:
     logger.warning("Firebase not available, authentication features will be limited")
 
+# Verified ID tokens are served from memory until they expire
+token_cache = None
+if firebase_available:
+    try:
+        project_id = os.environ.get('FIREBASE_PROJECT_ID') or os.environ.get('GOOGLE_CLOUD_PROJECT')
+        if not project_id:
+            project_id = getattr(firebase_admin.get_app(), 'project_id', None)
+        token_cache = create_firebase_token_cache(auth, project_id)
+    except Exception as e:
+        logger.warning("ID token cache unavailable, verifying every request: %s", e)
+
+# Circuit breakers for external enrichment providers (latency thresholds in seconds)
+configure_breaker("dns", latency_threshold=2.0)
+configure_breaker("geo", latency_threshold=3.0)
+configure_breaker("whois", latency_threshold=5.0)
+configure_breaker("ct", latency_threshold=5.0)
+
+# python-whois raises this for unregistered domains - an answer, not an outage
+whois_not_found_errors = ()
+if whois_available:
+    try:
+        from whois.parser import PywhoisError
+        whois_not_found_errors = (PywhoisError,)
+    except ImportError:
+        pass
+
+# Per-request memo of provider results, active inside enrichment_scope()
+_enrichment_memo = contextvars.ContextVar('enrichment_memo', default=None)
+
+@contextmanager
+def enrichment_scope():
+    """
+    Share provider results between all steps of one analysis.
+
+    Inside the scope each DNS, geo, WHOIS, CT, TLS and page lookup is performed
+    at most once per key; repeated calls return (or re-raise) the first outcome.
+    """
+    token = _enrichment_memo.set({})
+    try:
+        yield
+    finally:
+        _enrichment_memo.reset(token)
+
+# Stage names used in latency metrics for each provider
+PROVIDER_STAGES = {"page": "page_fetch"}
+
+def _observed(provider, seam):
+    """
+    Wrap a provider seam so its calls are observed in the stage latency histogram.
+
+    Only calls that reach the provider are observed; memo, negative-cache and
+    TLS cache hits and open breakers answer in microseconds and would drag
+    the histogram toward zero.
+    """
+    stage = PROVIDER_STAGES.get(provider, provider)
+
+    def call(*args, **kwargs):
+        with stage_duration.time(stage):
+            return seam(*args, **kwargs)
+    return call
+
+# Providers that failed while a stored feature group was computed, active inside stored_features()
+_provider_failures = contextvars.ContextVar('provider_failures', default=None)
+
+def _note_provider_failure(provider, error, not_found_errors=()):
+    failures = _provider_failures.get()
+    # "Does not exist" answers are results; anything else means the features are degraded
+    if failures is not None and not isinstance(error, not_found_errors):
+        failures.append(provider)
+
+def _memoized(provider, key, func, *args, **kwargs):
+    memo = _enrichment_memo.get()
+    if memo is not None:
+        entry = memo.get((provider, key))
+        if entry is not None:
+            cache_lookups.inc("enrichment_memo", "hit")
+            with span(PROVIDER_STAGES.get(provider, provider), cached=True):
+                pass
+            value, error = entry
+            if error is not None:
+                _note_provider_failure(provider, error, kwargs.get('not_found_errors', ()))
+                raise fresh_error(error)
+            return value
+        cache_lookups.inc("enrichment_memo", "miss")
+    stage = PROVIDER_STAGES.get(provider, provider)
+    try:
+        with span(stage):
+            value = func(*args, **kwargs)
+    except Exception as e:
+        _note_provider_failure(provider, e, kwargs.get('not_found_errors', ()))
+        if memo is not None:
+            memo[(provider, key)] = (None, e)
+        raise
+    if memo is not None:
+        memo[(provider, key)] = (value, None)
+    return value
+
+# Resolver answers meaning the name does not exist; anything else (e.g. EAI_AGAIN) is a failure
+DNS_NOT_FOUND_CODES = {code for code in (getattr(socket, 'EAI_NONAME', None), getattr(socket, 'EAI_NODATA', None))
+                       if code is not None}
+
+class DomainNotFoundError(socket.gaierror):
+    """Raised when the resolver answers that a domain does not exist"""
+
+def _resolve_dns(domain):
+    try:
+        return _request_dns(domain)
+    except socket.gaierror as e:
+        if e.errno in DNS_NOT_FOUND_CODES:
+            raise DomainNotFoundError(*e.args) from None
+        raise
+
+def resolve_host(domain):
+    """
+    Resolve a hostname to an IPv4 address through the DNS circuit breaker
+    
+    Args:
+        domain (str): Hostname to resolve
+        
+    Returns:
+        str: IP address
+        
+    Raises:
+        DomainNotFoundError: The domain does not exist (negatively cached)
+        socket.gaierror: The lookup failed, e.g. a temporary resolver failure
+        ProviderUnavailableError: The DNS breaker is open
+    """
+    return _memoized("dns", domain, guarded_call, "dns", domain, _observed("dns", _resolve_dns), domain,
+                     not_found_errors=(DomainNotFoundError,))
+
+# The _request_* functions (and _probe_ssl_certificate) are the only places that
+# touch the network; benchmarks and record/replay swap them out
+
+def _request_dns(domain):
+    return socket.gethostbyname(domain)
+
+def _request_geo(ip_address):
+    response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=5)
+    # 5xx answers are provider failures and should count against the breaker
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response
+
+def fetch_geo(ip_address):
+    """Query ip-api.com for an IP address through the geo circuit breaker"""
+    return _memoized("geo", ip_address, guarded_call, "geo", ip_address, _observed("geo", _request_geo), ip_address)
+
+def fetch_whois(domain):
+    """Run a WHOIS lookup through the WHOIS circuit breaker"""
+    return _memoized("whois", domain, guarded_call, "whois", domain, _observed("whois", _request_whois), domain,
+                     not_found_errors=whois_not_found_errors)
+
+def _request_whois(domain):
+    return whois.whois(domain)
+
+def _request_ct(domain):
+    response = requests.get(f"https://crt.sh/?q={domain}&output=json", timeout=5)
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response
+
+def fetch_ct_entries(domain):
+    """Query crt.sh for a domain through the CT circuit breaker"""
+    return _memoized("ct", domain, guarded_call, "ct", domain, _observed("ct", _request_ct), domain)
+
+def _request_page(url):
+    try:
+        response = requests.get(url, timeout=10,
+                                headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'})
+    except Exception:
+        outbound_calls.inc("page", "error")
+        raise
+    outbound_calls.inc("page", "success")
+    return response.text
+
+def fetch_page(url):
+    """
+    Fetch the HTML of the page being analyzed
+    
+    Args:
+        url: URL of the page
+        
+    Returns:
+        str: Page HTML
+    """
+    return _memoized("page", url, _observed("page", _request_page), url)
+
+# Host, domain and IP level feature groups persist across requests and workers
+feature_store = configure_feature_store()
+
+# Identical concurrent analyses and enrichment lookups run once; COALESCE_LOCK_DIR extends this across workers
+url_flight = SingleFlight("url")
+enrichment_flight = SingleFlight("enrichment")
+
+# Entries loaded in bulk and entries waiting to be written, active inside feature_store_batch()
+_store_batch = contextvars.ContextVar('feature_store_batch', default=None)
+
+def stored_features(group, key, compute, *args):
+    """
+    Get a feature group from the feature store, computing and storing it when missing or stale.
+    
+    Concurrent requests for the same group and key share one computation.
+    Groups computed while a provider was failing, or carrying an error, are
+    returned but not stored, so an outage is not remembered past the request.
+    
+    Args:
+        group: Feature group name (its freshness is configured in the store)
+        key: Registrable domain, host or IP the group describes
+        compute: Function computing the group
+        *args: Arguments of compute
+        
+    Returns:
+        dict: The feature group
+    """
+    if not key:
+        return compute(*args)
+    batch = None
+    if feature_store is not None:
+        batch = _store_batch.get()
+        loaded = batch[0].get(group, {}) if batch is not None else {}
+        if key in loaded:
+            return json.loads(json.dumps(loaded[key]))
+        # Keys of a batch were already looked up in bulk
+        if batch is None or key not in batch[2].get(group, ()):
+            try:
+                cached = feature_store.get(group, key)
+            except Exception as e:
+                logger.warning("Feature store lookup failed: %s", e)
+                cached = None
+            if cached is not None:
+                return cached
+
+    value, failures = enrichment_flight.do(f"{group}:{key}", _compute_feature_group, group, key, compute, args, batch)
+    if failures:
+        outer = _provider_failures.get()
+        if outer is not None:
+            outer.extend(failures)
+    return value
+
+def _compute_feature_group(group, key, compute, args, batch):
+    failures = []
+    token = _provider_failures.set(failures)
+    try:
+        value = compute(*args)
+    finally:
+        _provider_failures.reset(token)
+    if failures or feature_store is None or not isinstance(value, dict) or "error" in value:
+        return value, failures
+    if batch is not None:
+        # A copy, so callers changing the returned dict do not change what gets written
+        stored = json.loads(json.dumps(value))
+        batch[0].setdefault(group, {})[key] = stored
+        batch[1].setdefault(group, {})[key] = stored
+    else:
+        try:
+            feature_store.put(group, key, value)
+        except Exception as e:
+            logger.warning("Feature store write failed: %s", e)
+    return value, failures
+
+@contextmanager
+def feature_store_batch(urls):
+    """
+    Load the stored groups of a batch of URLs with one query per group and
+    write the newly computed ones in one transaction per group at the end.
+    
+    Args:
+        urls: URLs about to be analyzed
+    """
+    if feature_store is None:
+        yield
+        return
+    netlocs = [urlparse(url).netloc.lower() for url in urls]
+    hosts = [host_of(netloc) for netloc in netlocs]
+    loaded = {}
+    queried = {}
+    try:
+        queried["domain_info"] = set(hosts)
+        loaded["domain_info"] = feature_store.get_many("domain_info", hosts)
+        queried["ct"] = set(netlocs)
+        loaded["ct"] = feature_store.get_many("ct", netlocs)
+        queried["whois"] = {registrable_domain(netloc) for netloc in netlocs}
+        loaded["whois"] = feature_store.get_many("whois", queried["whois"])
+        # Reputation is keyed by domain and IP; the IP is known for hosts with stored domain info
+        queried["reputation"] = {
+            f"{registrable_domain(netloc)}|{loaded['domain_info'][host].get('ip_address')}"
+            for netloc, host in zip(netlocs, hosts) if host in loaded["domain_info"]
+        }
+        loaded["reputation"] = feature_store.get_many("reputation", queried["reputation"])
+    except Exception as e:
+        logger.warning("Feature store bulk lookup failed: %s", e)
+        loaded, queried = {}, {}
+    pending = {}
+    token = _store_batch.set((loaded, pending, queried))
+    try:
+        yield
+    finally:
+        _store_batch.reset(token)
+        for group, entries in pending.items():
+            try:
+                feature_store.put_many(group, entries)
+            except Exception as e:
+                logger.warning("Feature store write failed: %s", e)
+
 # Global variables for model and scaler access
 def get_model_instance():
     return get_model()
@@ -159,17 +495,21 @@ def calculate_entropy(string):
     if not string:
         return 0
     
-    # Count character occurrences
-    counts = Counter(string)
-    # Calculate frequencies
-    frequencies = [count/len(string) for count in counts.values()]
-    # Calculate entropy
-    entropy = -sum(f * math.log2(f) for f in frequencies)
-    
-    return entropy
+    return entropy_from_counts(Counter(string), len(string))
 
-def check_suspicious_patterns(url):
-    """Check for suspicious patterns in a URL that may indicate phishing"""
+@timed()
+def check_suspicious_patterns(url, resolve=True):
+    """
+    Check for suspicious patterns in a URL that may indicate phishing
+    
+    Args:
+        url: URL to check
+        resolve: Fall back to a DNS lookup when no lexical pattern matched.
+            Pass False to keep the check purely lexical (no network).
+        
+    Returns:
+        list: Suspicious pattern dictionaries
+    """
     suspicious_patterns = []
     
     try:
@@ -218,6 +558,16 @@ def check_suspicious_patterns(url):
                     "risk_score": 5
                 })
         
+        # Check for hosts imitating a protected brand; brand-plus-words combosquats weigh less
+        lookalike = find_lookalike(domain)
+        if lookalike:
+            suspicious_patterns.append({
+                "pattern": f"Lookalike of {lookalike.brand} ({lookalike.technique.replace('_', ' ')})",
+                "severity": lookalike.severity,
+                "explanation": f"'{lookalike.matched}' in the domain imitates {lookalike.brand_domain}, a common trick to make a phishing site look like the real one.",
+                "risk_score": 20 if lookalike.severity == "high" else 10
+            })
+        
         # Check for URL shortening services
         shortening_services = ['bit.ly', 'tinyurl.com', 'goo.gl', 't.co', 'is.gd', 
                               'buff.ly', 'ow.ly', 'rebrand.ly', 'tr.im']
@@ -245,7 +595,8 @@ def check_suspicious_patterns(url):
         suspicious_words = ['login', 'signin', 'verify', 'secure', 'account', 'update', 'confirm',
                             'password', 'credential', 'wallet', 'authenticate', 'verification',
                             'banking', 'security', 'alert', 'suspended', 'unusual']
-        found_words = [word for word in suspicious_words if word in url.lower()]
+        lexical = scan_url(url)
+        found_words = [word for word in suspicious_words if word in lexical.keywords]
         if found_words:
             words_str = ', '.join(found_words)
             suspicious_patterns.append({
@@ -256,7 +607,7 @@ def check_suspicious_patterns(url):
             })
             
         # Check for IP address as domain
-        if re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', domain):
+        if lexical.host.is_ip:
             suspicious_patterns.append({
                 "pattern": "IP address used as domain",
                 "severity": "high",
@@ -292,7 +643,7 @@ def check_suspicious_patterns(url):
             })
             
         # Check for excessive number of special characters
-        special_char_count = sum(c in '!@#$%^&*()_+-={}[]|\\:;"\'<>,.?/' for c in url)
+        special_char_count = lexical.whole.special
         if special_char_count > 15:
             suspicious_patterns.append({
                 "pattern": "Excessive special characters",
@@ -302,23 +653,27 @@ def check_suspicious_patterns(url):
             })
             
         # If no patterns were found but domain can't be resolved
-        if not suspicious_patterns:
+        if not suspicious_patterns and resolve:
             try:
-                socket.gethostbyname(domain)
-            except:
+                resolve_host(domain)
+            except DomainNotFoundError:
                 suspicious_patterns.append({
                     "pattern": "Domain does not resolve",
                     "severity": "high",
                     "explanation": "The domain cannot be resolved to an IP address, which means it may not exist or may be newly registered for phishing.",
                     "risk_score": 20
                 })
+            except (ProviderUnavailableError, socket.gaierror) as e:
+                # An unavailable resolver says nothing about the domain
+                logger.debug("Skipping the resolution check for %s: %s", domain, e)
         
-        logger.info(f"Suspicious patterns found for {url}: {len(suspicious_patterns)}")
+        logger.info("Suspicious patterns found for %s: %s", url, len(suspicious_patterns))
         return suspicious_patterns
     except Exception as e:
-        logger.error(f"Error checking suspicious patterns: {e}")
+        logger.error("Error checking suspicious patterns: %s", e)
         return []
 
+@timed()
 def rule_based_prediction(url, scaled_features=None):
     """
     Rule-based prediction when model is unavailable
@@ -332,9 +687,10 @@ def rule_based_prediction(url, scaled_features=None):
     """
     try:
         # Parse the URL
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc.lower()
-        path = parsed_url.path.lower()
+        lexical = scan_url(url)
+        parsed_url = lexical.parsed
+        domain = lexical.host.host
+        path = lexical.path
         
         # Initialize risk score
         risk_score = 0
@@ -350,7 +706,7 @@ def rule_based_prediction(url, scaled_features=None):
             }
         
         # 2. Domain-based checks (part of URL features - 40%)
-        if re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', domain):
+        if lexical.host.is_ip:
             # IP address as domain
             risk_score += 25
             risk_factors["ip_as_domain"] = {
@@ -402,7 +758,7 @@ def rule_based_prediction(url, scaled_features=None):
                             'password', 'credential', 'wallet', 'authenticate', 'verification']
         keyword_count = 0
         for word in suspicious_words:
-            if word in url.lower():
+            if word in lexical.keywords:
                 keyword_count += 1
                 risk_score += 5
                 # Cap keyword penalty at 30
@@ -417,7 +773,7 @@ def rule_based_prediction(url, scaled_features=None):
             }
         
         # Check special characters
-        special_char_count = sum(c in '!@#$%^&*()_+-={}[]|\\:;"\'<>,.?/' for c in url)
+        special_char_count = lexical.whole.special
         risk_score += min(special_char_count, 15)
         
         if special_char_count > 5:
@@ -498,7 +854,7 @@ def rule_based_prediction(url, scaled_features=None):
                     "contribution": html_risk
                 }
         except Exception as e:
-            logger.error(f"Error checking HTML security: {e}")
+            logger.error("Error checking HTML security: %s", e)
         
         # Ensure final score is within 0-100 range
         final_score = max(0, min(100, risk_score))
@@ -517,7 +873,7 @@ def rule_based_prediction(url, scaled_features=None):
         
         return result
     except Exception as e:
-        logger.error(f"Error in rule_based_prediction: {e}")
+        logger.error("Error in rule_based_prediction: %s", e)
         # Default moderate risk on error
         return {
             "status": "error",
@@ -528,12 +884,17 @@ def rule_based_prediction(url, scaled_features=None):
             "error": str(e)
         }
 
-def is_trusted_domain(url):
+# Trusted domains whose subdomains are sites of their users, not of the company
+SHARED_HOSTING_DOMAINS = {'wordpress.com', 'shopify.com'}
+
+def is_trusted_domain(url, first_party_only=False):
     """
     Check if a URL belongs to a trusted domain
     
     Args:
         url (str): URL to check
+        first_party_only (bool): Don't trust user-hosted subdomains of shared
+            hosting domains (e.g. someone.wordpress.com)
         
     Returns:
         bool: True if the domain is trusted, False otherwise
@@ -561,11 +922,171 @@ def is_trusted_domain(url):
         ]
         
         # Check if domain ends with any trusted domain
-        return any(domain == td or domain.endswith('.' + td) for td in trusted_domains)
+        for td in trusted_domains:
+            if domain == td:
+                return True
+            if domain.endswith('.' + td):
+                return not (first_party_only and td in SHARED_HOSTING_DOMAINS)
+        return False
     except Exception as e:
-        logger.error(f"Error in is_trusted_domain: {e}")
+        logger.error("Error in is_trusted_domain: %s", e)
         return False
 
+# Tiered scoring: a lexical first stage that can decide the verdict on its own
+TIERED_SCORING = os.environ.get('TIERED_SCORING', 'False').lower() == 'true'
+
+def _parse_band(value, default):
+    try:
+        low, high = (float(part) for part in value.split(','))
+        return (low, high)
+    except (AttributeError, ValueError):
+        return default
+
+# Preliminary confidences inside [low, high) are uncertain and trigger network enrichment
+LEXICAL_UNCERTAINTY_BAND = _parse_band(os.environ.get('LEXICAL_UNCERTAINTY_BAND'), (0.0, 0.85))
+
+_tier_stats = {"lexical": 0, "full": 0}
+_tier_stats_lock = threading.Lock()
+
+@timed()
+def lexical_prescore(url):
+    """
+    Stage one of tiered scoring: score a URL from its string alone (no network).
+
+    Lexical evidence can prove risk but not safety, so confidence grows with
+    the score; only decisive rules (IP host with an @ trick, URL shorteners,
+    first-party trusted domains) are confident on their own; user sites on
+    shared hosting domains always get enriched.
+
+    Args:
+        url: URL to score
+
+    Returns:
+        dict: Preliminary score (0-100), confidence (0-1), deciding rule and
+            the lexical suspicious patterns
+    """
+    parsed_url = urlparse(url)
+    host = (parsed_url.hostname or '').lower()
+
+    suspicious_patterns = check_suspicious_patterns(url, resolve=False)
+    pattern_score = sum(p.get("risk_score", 0) for p in suspicious_patterns)
+    pattern_names = {p["pattern"] for p in suspicious_patterns}
+
+    score = min(100, pattern_score)
+    confidence = round(min(1.0, score / 100), 2)
+    rule = None
+
+    if is_ip(host) and '@' in parsed_url.netloc:
+        # user@1.2.3.4 style URLs disguise a bare IP behind a fake host name
+        score = max(score, 90)
+        confidence = 0.95
+        rule = "ip_host_with_at_symbol"
+    elif "URL shortening service" in pattern_names:
+        # The destination is hidden; enriching the shortener itself tells us nothing
+        confidence = 0.9
+        rule = "url_shortener"
+    elif is_trusted_domain(url, first_party_only=True) and '@' not in parsed_url.netloc:
+        score = max(0, score - 40)
+        confidence = 0.95
+        rule = "trusted_domain"
+
+    return {
+        "score": score,
+        "confidence": confidence,
+        "rule": rule,
+        "suspicious_patterns": suspicious_patterns
+    }
+
+def needs_enrichment(confidence):
+    """Check whether a preliminary confidence falls inside the uncertainty band"""
+    low, high = LEXICAL_UNCERTAINTY_BAND
+    return low <= confidence < high
+
+def tiered_analysis(url, full_analysis):
+    """
+    Score a URL with the lexical fast path, running the full pipeline only when needed
+
+    Args:
+        url: URL to analyze (with scheme)
+        full_analysis: Callable returning the full result for a URL
+
+    Returns:
+        dict: Result annotated with the tier that decided the verdict
+    """
+    prescore = lexical_prescore(url)
+    tier_info = {
+        "preliminary_score": prescore["score"],
+        "preliminary_confidence": prescore["confidence"],
+        "decision_rule": prescore["rule"]
+    }
+
+    if needs_enrichment(prescore["confidence"]):
+        with _tier_stats_lock:
+            _tier_stats["full"] += 1
+        tiered_scoring.inc("enriched")
+        result = full_analysis(url)
+        result["scoring_tier"] = "full"
+        result.update(tier_info)
+        return result
+
+    with _tier_stats_lock:
+        _tier_stats["lexical"] += 1
+    tiered_scoring.inc("skipped")
+    logger.info("Lexical fast path decided %s: score %s, confidence %s", url, prescore['score'], prescore['confidence'])
+
+    parsed_url = urlparse(url)
+    score = prescore["score"]
+    return {
+        "status": "success",
+        "url": url,
+        "domain": parsed_url.netloc,
+        "protocol": parsed_url.scheme,
+        "analysis_date": datetime.now().isoformat(),
+        "score": score,
+        "fraud_score": score,
+        "risk_level": get_risk_level(score),
+        "is_suspicious": score > 50,
+        "suspicious_patterns": prescore["suspicious_patterns"],
+        "risk_factors": {
+            p["pattern"]: {
+                "description": p["explanation"],
+                "impact": p["severity"],
+                "contribution": p["risk_score"]
+            } for p in prescore["suspicious_patterns"]
+        },
+        "domain_info": {"domain": parsed_url.hostname or parsed_url.netloc},
+        "feature_contributions": [],
+        "feature_table": [],
+        "scoring_tier": "lexical",
+        **tier_info
+    }
+
+def use_tiered_scoring(req):
+    """Check the per-request 'scoring' override (tiered|full), defaulting to TIERED_SCORING"""
+    mode = req.args.get('scoring', '').lower()
+    if mode in ('tiered', 'full'):
+        return mode == 'tiered'
+    return TIERED_SCORING
+
+def get_tiered_scoring_stats():
+    """
+    Get fast-path counters.
+
+    Returns:
+        dict: Verdict counts per tier and the enrichment skip rate
+    """
+    with _tier_stats_lock:
+        lexical = _tier_stats["lexical"]
+        full = _tier_stats["full"]
+    total = lexical + full
+    return {
+        "enabled": TIERED_SCORING,
+        "uncertainty_band": list(LEXICAL_UNCERTAINTY_BAND),
+        "lexical_verdicts": lexical,
+        "full_verdicts": full,
+        "skip_rate": round(lexical / total, 4) if total else 0.0
+    }
+
 # Create a custom InputLayer that can handle batch_shape
 class CompatibleInputLayer(tf.keras.layers.InputLayer):
     def __init__(self, **kwargs):
@@ -595,25 +1116,59 @@ def tld_risk_score(tld: str) -> float:
     }
     return risky_tlds.get(tld.lower(), 0.2)
 
-def extract_features(url: str):
+# Feature positions come from the declared schema; check it against the loaded model once at startup
+try:
+    FEATURE_SCHEMA.validate(get_input_width())
+    logger.info("Feature schema %s: %s features, model input %s", FEATURE_SCHEMA.version, len(FEATURE_SCHEMA), FEATURE_SCHEMA.width)
+except FeatureSchemaError as e:
+    logger.error("Feature schema does not match the model: %s", e)
+
+# Gradient attributions from the model itself, next to the rule-based contributions
+MODEL_ATTRIBUTIONS = os.environ.get('MODEL_ATTRIBUTIONS', 'False').lower() == 'true'
+
+def attribute_prediction(feature_vector):
+    """
+    Attribute a model prediction to its input features.
+    
+    Args:
+        feature_vector: The model input vector
+        
+    Returns:
+        list: Largest attributions first, each with name, value, attribution and share
+    """
+    try:
+        attributor = get_attributor(get_model_instance(), get_model_version(), get_scaler_instance())
+        return attributor.explain(feature_vector.reshape(1, -1), [FEATURE_SCHEMA.names])[0]
+    except Exception as e:
+        logger.warning("Could not compute model attributions: %s", e)
+        return []
+
+@timed()
+def extract_features(url: str, out=None):
     """
     Extract features from a URL for machine learning prediction
     
     Args:
         url: URL to analyze
+        out: Optional preallocated float32 row (e.g. a row of FEATURE_SCHEMA.new_batch)
+            to write the model input into
         
     Returns:
         tuple: (feature_dict, feature_array)
     """
-    logger.info(f"Extracting features for URL: {url}")
+    logger.info("Extracting features for URL: %s", url)
+    
+    # Model input row; every feature group is written into its schema positions
+    feature_array = FEATURE_SCHEMA.reset(out) if out is not None else FEATURE_SCHEMA.new_row()
     
     try:
-        # Parse the URL
-        parsed_url = urlparse(url)
+        # Parse the URL; character statistics come from one shared lexical scan
+        lexical = scan_url(url)
+        parsed_url = lexical.parsed
         
         # Basic URL components
-        domain = parsed_url.netloc.lower()
-        path = parsed_url.path.lower()
+        domain = lexical.host.host
+        path = lexical.path
         query = parsed_url.query.lower()
         fragment = parsed_url.fragment.lower()
         
@@ -630,36 +1185,33 @@ def extract_features(url: str):
         subdomain_count = max(0, subdomain_count)  # Ensure non-negative
         
         # Path-based features
-        path_depth = path.count('/') if path else 0
+        path_depth = lexical.path_stats.slashes
         
         # Get TLD risk score
         tld = domain.split('.')[-1] if '.' in domain else ''
         tld_score = tld_risk_score(tld)
         
         # Calculate entropy as a measure of randomness
-        domain_entropy = calculate_entropy(domain)
+        domain_entropy = lexical.host.entropy
         
         # Security features
         https_present = 1 if parsed_url.scheme == 'https' else 0
         
         # Character-based features
-        special_char_count = sum(c in '!@#$%^&*()_+-={}[]|\\:;"\'<>,.?/' for c in url)
-        digit_count = sum(c.isdigit() for c in url)
-        letter_count = sum(c.isalpha() for c in url)
-        
-        digit_percentage = (digit_count / len(url)) * 100 if len(url) > 0 else 0
-        letter_percentage = (letter_count / len(url)) * 100 if len(url) > 0 else 0
+        special_char_count = lexical.whole.special
+        digit_percentage = lexical.whole.digit_percentage
+        letter_percentage = lexical.whole.letter_percentage
         
         # Check if path is all numeric
-        numeric_path = 1 if path and all(c.isdigit() or c == '/' for c in path) else 0
+        numeric_path = 1 if lexical.numeric_path else 0
         
         # Suspicious patterns
-        ip_url = 1 if re.match(r'\d+\.\d+\.\d+\.\d+', domain) else 0
+        ip_url = 1 if lexical.host.ip_prefix else 0
         
         # Looking for suspicious keywords
         suspicious_keywords = ['login', 'signin', 'account', 'secure', 'update', 'verify', 
                               'confirm', 'banking', 'payment', 'wallet', 'ebay', 'paypal']
-        keyword_count = sum(1 for keyword in suspicious_keywords if keyword in url.lower())
+        keyword_count = sum(1 for keyword in suspicious_keywords if keyword in lexical.keywords)
         
         # Create a dictionary of basic feature names and values
         basic_features = {
@@ -685,19 +1237,22 @@ def extract_features(url: str):
         domain_info = get_domain_info(url)
         ip_address = domain_info.get("ip_address", "Unknown")
         
-        # NEW: Extract enhanced features
-        whois_features = extract_whois_features(domain)
+        # NEW: Extract enhanced features (WHOIS and reputation describe the registrable domain)
+        site = registrable_domain(domain)
+        if whois_available:
+            whois_features = stored_features("whois", site, extract_whois_features, domain)
+        else:
+            whois_features = extract_whois_features(domain)
         nlp_features = extract_nlp_features(domain)
-        reputation_features = extract_reputation_features(domain, ip_address)
+        reputation_features = stored_features("reputation", f"{site}|{ip_address}",
+                                              extract_reputation_features, domain, ip_address)
         
         # Try to get content features - might fail if site is down
         content_features = {}
         html_security = {}
         try:
             # Reuse HTML content if we can get it once
-            response = requests.get(url, timeout=10, 
-                                  headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'})
-            html_content = response.text
+            html_content = fetch_page(url)
             
             # Extract content features from the HTML
             content_features = extract_content_features(url, html_content)
@@ -712,77 +1267,63 @@ def extract_features(url: str):
                     "has_obfuscated_js": 1 if any("obfuscated" in rf.lower() for rf in html_security_data.get("risk_factors", [])) else 0
                 }
         except Exception as content_error:
-            logger.warning(f"Could not extract content features: {content_error}")
+            logger.warning("Could not extract content features: %s", content_error)
             content_features = extract_content_features(url)  # Empty defaults
             html_security = {"security_score": 0, "risk_factor_count": 0, "has_password_field": 0, "has_obfuscated_js": 0}
             
         # Try to get certificate transparency log features
-        ct_features = extract_ct_log_features(domain)
+        ct_features = stored_features("ct", domain, extract_ct_log_features, domain)
         
-        # Combine all features into a single dictionary
-        all_features = {**basic_features}
+        # Brand lookalikes (reported, not model inputs; see OBSERVED_FEATURE_SPECS)
+        lookalike_group = lookalike_features(domain)
         
-        # Add new feature groups with prefixes to avoid name collisions
-        for key, value in whois_features.items():
-            all_features[f"whois_{key}"] = value
-            
-        for key, value in nlp_features.items():
-            all_features[f"nlp_{key}"] = value
-            
-        for key, value in reputation_features.items():
-            all_features[f"rep_{key}"] = value
-            
-        for key, value in content_features.items():
-            all_features[f"content_{key}"] = value
-            
-        for key, value in html_security.items():
-            all_features[f"html_{key}"] = value
-            
-        for key, value in ct_features.items():
-            all_features[f"ct_{key}"] = value
-            
-        # Add additional domain info features
-        all_features["geo_suspicious_country"] = 1 if domain_info.get("country") in ["RU", "CN", "IR", "KP"] else 0
-            
-        # Convert feature dictionary to array for the model
-        # Extract values in a stable order for the model
-        basic_feature_values = list(basic_features.values())
-        
-        # Create a list of values for the additional features
-        additional_values = []
-        for key in sorted(all_features.keys()):
-            if key not in basic_features:
-                additional_values.append(all_features[key])
-        
-        # Full feature array - basic features plus new features
-        full_features = basic_feature_values + additional_values
-        
-        # Convert to numpy array
-        base_features = np.array(full_features, dtype=np.float32)
-        
-        # Pad to expected size for model compatibility (should be 96 for your model)
-        # Adjust padding as needed based on your model's expectations
-        padding_size = max(0, 96 - len(full_features))
-        if padding_size > 0:
-            padding = np.zeros(padding_size, dtype=np.float32)
-            feature_array = np.concatenate([base_features, padding])
-        else:
-            # If we have more features than expected, truncate to 96
-            feature_array = base_features[:96]
+        # Additional domain info features
+        geo_features = {
+            "suspicious_country": 1 if domain_info.get("country") in ["RU", "CN", "IR", "KP"] else 0
+        }
+        
+        # Combine all features into a single dictionary and write them into the model input
+        all_features = {**basic_features}
+        with span("feature_vector"):
+            FEATURE_SCHEMA.write(feature_array, basic_features)
+            
+            # Feature groups carry prefixes to avoid name collisions
+            for prefix, group in (("whois_", whois_features), ("nlp_", nlp_features),
+                                  ("rep_", reputation_features), ("content_", content_features),
+                                  ("html_", html_security), ("ct_", ct_features), ("geo_", geo_features),
+                                  ("lookalike_", lookalike_group)):
+                FEATURE_SCHEMA.write(feature_array, group, prefix)
+                for key, value in group.items():
+                    all_features[prefix + key] = value
         
         # Log feature count
-        logger.info(f"Extracted {len(full_features)} features, adjusted to {len(feature_array)} for model compatibility")
+        logger.info("Extracted %s features, adjusted to %s for model compatibility", len(all_features), len(feature_array))
         
         return all_features, feature_array
         
     except Exception as e:
-        logger.error(f"Error extracting features: {e}")
+        logger.error("Error extracting features: %s", e)
         logger.error(traceback.format_exc())
         # Return default values in case of error
         feature_dict = {"error": str(e)}
-        feature_array = np.zeros(96, dtype=np.float32)
-        return feature_dict, feature_array
+        return feature_dict, FEATURE_SCHEMA.reset(feature_array)
 
+def extract_features_batch(urls):
+    """
+    Extract features for several URLs into one model input matrix.
+    
+    Args:
+        urls: URLs to analyze
+        
+    Returns:
+        tuple: (list of feature_dicts, (len(urls), width) float32 matrix)
+    """
+    matrix = FEATURE_SCHEMA.new_batch(len(urls))
+    with feature_store_batch(urls):
+        feature_dicts = [extract_features(url, out=matrix[i])[0] for i, url in enumerate(urls)]
+    return feature_dicts, matrix
+
+@timed()
 def check_html_security(url, html_content=None):
     """
     Check HTML content for suspicious or malicious patterns
@@ -804,12 +1345,11 @@ def check_html_security(url, html_content=None):
     try:
         # Get the HTML content if not provided) 
         if html_content is None:
-            response = requests.get(url, timeout=10, 
-                                  headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'})
-            html_content = response.text
+            html_content = fetch_page(url)
         
         # Parse HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
+        with stage_duration.time("html_parse"), span("html_parse"):
+            soup = BeautifulSoup(html_content, 'html.parser')
         
         # Initialize security data
         security_data = {
@@ -891,13 +1431,14 @@ def check_html_security(url, html_content=None):
         
         return security_data
     except Exception as e:
-        logger.error(f"Error checking HTML security: {e}")
+        logger.error("Error checking HTML security: %s", e)
         return {
             "error": str(e),
             "content_score": 0,
             "risk_factors": [f"Error analyzing HTML content: {str(e)}"]
         }
 
+@timed()
 def predict_with_model(url, features=None):
     """
     Make a prediction using the loaded model.
@@ -911,14 +1452,14 @@ def predict_with_model(url, features=None):
         dict: Prediction result with risk score and details
     """
     try:
-        logger.info(f"Making prediction for URL: {url}")
+        logger.info("Making prediction for URL: %s", url)
         
         # Extract features if not provided
         if features is None:
             logger.info("No features provided, extracting new features")
             features, feature_vector = extract_features(url)
         else:
-            logger.info(f"Features provided, type: {type(features)}")
+            logger.info("Features provided, type: %s", type(features))
             # The feature parameter might be just the dictionary without the feature_vector
             # Always re-extract to get the proper numpy array
             _, feature_vector = extract_features(url)
@@ -940,23 +1481,25 @@ def predict_with_model(url, features=None):
             try:
                 # Ensure feature_vector is a numpy array before reshaping
                 if not isinstance(feature_vector, np.ndarray):
-                    logger.error(f"feature_vector is not a numpy array: {type(feature_vector)}")
+                    logger.error("feature_vector is not a numpy array: %s", type(feature_vector))
                     # Fall back to rule-based prediction
                     return rule_based_prediction(url, features)
                 
                 # Prepare feature vector for prediction
                 features_reshaped = feature_vector.reshape(1, -1)
-                logger.info(f"Feature shape: {features_reshaped.shape}")
+                logger.info("Feature shape: %s", features_reshaped.shape)
                 
                 # Scale features if scaler is available
-                scaled_features = get_scaler_instance().transform(features_reshaped)
+                with stage_duration.time("scaler"), span("scaler"):
+                    scaled_features = get_scaler_instance().transform(features_reshaped)
                 
                 # Make prediction
-                prediction = get_model_instance().predict(scaled_features)
+                with stage_duration.time("model"), span("model"):
+                    prediction = get_inference_model().predict(scaled_features)
                 raw_score = float(prediction[0][0]) if hasattr(prediction, 'shape') else float(prediction)
                 score = raw_score * 100  # Convert to percentage
                 
-                logger.info(f"Model prediction raw score: {raw_score}, scaled: {score}")
+                logger.info("Model prediction raw score: %s, scaled: %s", raw_score, score)
                 
                 # Set result fields
                 result["score"] = score
@@ -971,7 +1514,7 @@ def predict_with_model(url, features=None):
                     original_score = score
                     score = min(100, score + domain_penalty)  # Cap at 100
                     result["score"] = score
-                    logger.info(f"Domain could not be resolved, applying penalty: {original_score} -> {score}")
+                    logger.info("Domain could not be resolved, applying penalty: %s -> %s", original_score, score)
                     
                     # Add a risk factor for unresolvable domain
                     if "risk_factors" not in result:
@@ -982,211 +1525,13 @@ def predict_with_model(url, features=None):
                         "contribution": domain_penalty
                     }
                 
-                # Feature name mapping to user-friendly names
-                feature_name_map = {
-                    "url_length": "URL Length",
-                    "domain_length": "Domain Length",
-                    "path_length": "Path Length",
-                    "query_length": "Query Parameters Length",
-                    "fragment_length": "Fragment Length",
-                    "subdomain_count": "Number of Subdomains",
-                    "path_depth": "Path Depth",
-                    "tld_score": "Risky TLD Score",
-                    "domain_entropy": "Domain Entropy",
-                    "https_present": "Security Weights",
-                    "special_char_count": "Special Characters",
-                    "digit_percentage": "Digit Percentage",
-                    "letter_percentage": "Letter Percentage",
-                    "numeric_path": "Numeric Path Present",
-                    "ip_url": "IP as Domain",
-                    "keyword_count": "Suspicious Keywords",
-                    # Content feature friendly names
-                    "content_page_size_bytes": "Page Size",
-                    "content_external_resources_count": "External Resource Count",
-                    "content_form_count": "Form Count",
-                    "content_password_field_count": "Password Fields",
-                    "content_js_to_html_ratio": "JavaScript to HTML Ratio",
-                    "content_title_brand_mismatch": "Title-Domain Mismatch",
-                    "content_favicon_exists": "Favicon Present",
-                    "content_similar_domain_redirect": "Similar Domain Redirect",
-                    # HTML security feature friendly names
-                    "html_security_score": "HTML Security Score",
-                    "html_risk_factor_count": "Security Risk Factor Count",
-                    "html_has_password_field": "Contains Password Field",
-                    "html_has_obfuscated_js": "Contains Obfuscated JavaScript",
-                    # SSL certificate feature friendly names
-                    "ct_suspicious_cert_pattern": "Suspicious Certificate Pattern",
-                    # Geographic feature friendly names
-                    "geo_suspicious_country": "Suspicious Country"
-                }
-                
-                # Add feature contributions
-                result["feature_contributions"] = []
-                if isinstance(features, dict):
-                    for name, value in features.items():
-                        if name != "error":
-                            # Estimate contribution based on feature value and type
-                            contribution = 0.0
-                            section = "Key Risk Factors"  # Default section
-                            
-                            # ====== Core URL & Domain Features (High Impact) ======
-                            if name == "url_length" and value > 50:
-                                contribution = 0.1 * (value / 100)
-                                section = "Key Risk Factors"
-                            elif name == "domain_length" and value > 15:
-                                contribution = 0.15 * (value / 30)
-                                section = "Key Risk Factors"
-                            elif name == "domain_entropy" and value > 0:
-                                contribution = 0.1 * min(value / 3.0, 1.0)
-                                section = "Key Risk Factors"
-                            elif name == "special_char_count" and value > 3:
-                                contribution = 0.1 * (value / 10)
-                                section = "Key Risk Factors"
-                            elif name == "tld_score" and value > 0:
-                                contribution = 0.15 * value / 0.5  # Scale based on value
-                                section = "Key Risk Factors"
-                            elif name == "https_present" and value < 1:
-                                contribution = 24.6  # Fixed percentage for consistency
-                                section = "Key Risk Factors"
-                            
-                            # ====== Domain Reputation & WHOIS Features (Important) ======
-                            elif name == "rep_domain_age_category" and value < 2:
-                                contribution = 0.15 * (2 - value) / 2  # Newer domains are riskier
-                                section = "Domain Information"
-                            elif name == "rep_suspicious_tld_category" and value > 0:
-                                contribution = 0.15 * value  # TLD category risk
-                                section = "Domain Information"
-                            elif name == "rep_suspicious_country" and value > 0:
-                                contribution = 0.15  # Suspicious country
-                                section = "Domain Information"
-                            elif name == "whois_recently_registered" and value > 0:
-                                contribution = 0.2  # Recently registered domains are highly suspicious
-                                section = "Domain Information"
-                            
-                            # ====== Critical HTML Content Features (Highest Impact) ======
-                            elif name == "content_form_count" and value > 0:
-                                contribution = 0.15 * min(value / 2, 1.0)  # Forms are key phishing indicators
-                                section = "Suspicious Patterns"
-                            elif name == "content_password_field_count" and value > 0:
-                                contribution = 0.3 * min(value / 2.0, 1.0)  # Password fields are critical for phishing
-                                section = "Suspicious Patterns"
-                            elif name == "content_external_resources_count" and value > 3:
-                                contribution = 0.12 * min(value / 15, 1.0)  # External resources
-                                section = "Suspicious Patterns"
-                            elif name == "content_js_to_html_ratio" and value > 0.3:
-                                contribution = 0.15 * min(value / 0.5, 1.0)  # High JS ratio can indicate obfuscation
-                                section = "Suspicious Patterns"
-                            elif name == "content_title_brand_mismatch" and value > 0:
-                                contribution = 0.2  # Title not matching domain is suspicious
-                                section = "Suspicious Patterns"
-                            elif name == "content_similar_domain_redirect" and value > 0:
-                                contribution = 0.35  # Redirects to similar domains are highly suspicious
-                                section = "Suspicious Patterns"
-                            elif name == "content_favicon_exists" and value < 1:
-                                contribution = 0.08  # Missing favicon often indicates phishing
-                                section = "Key Risk Factors"
-                            
-                            # ====== HTML Security Metrics (High Impact) ======
-                            elif name == "html_security_score" and value > 0:
-                                contribution = 0.2 * min(value / 50, 1.0)  # Overall security score
-                                section = "Suspicious Patterns"
-                            elif name == "html_risk_factor_count" and value > 0:
-                                contribution = 0.15 * min(value / 3, 1.0)  # Number of risks found
-                                section = "Suspicious Patterns"
-                            elif name == "html_has_password_field" and value > 0:
-                                contribution = 0.25  # Password fields in HTML are suspicious
-                                section = "Suspicious Patterns"
-                            elif name == "html_has_obfuscated_js" and value > 0:
-                                contribution = 0.3  # Obfuscated JavaScript is highly suspicious
-                                section = "Suspicious Patterns"
-                            
-                            # ====== SSL Certificate Features (Medium Impact) ======
-                            elif name == "ct_suspicious_cert_pattern" and value > 0:
-                                contribution = 0.15  # Suspicious certificate patterns
-                                section = "Domain Information"
-                            
-                            # ====== Geographic Features (Medium Impact) ======
-                            elif name == "geo_suspicious_country" and value > 0:
-                                contribution = 0.15  # Suspicious country
-                                section = "Domain Information"
-                            
-                            # Use friendly name if available
-                            display_name = feature_name_map.get(name, name.replace("_", " ").title())
-                            
-                            # Determine color based on contribution
-                            color_class = "success"  # Default green
-                            if contribution > 60:
-                                color_class = "danger"  # Red for high risk
-                            elif contribution > 20:
-                                color_class = "warning"  # Orange for medium risk
-                            
-                            result["feature_contributions"].append({
-                                "name": name,
-                                "value": value,
-                                "contribution": contribution,
-                                "direction": "increases" if contribution > 0 else "decreases",
-                                "percentage": contribution,  # No need to convert for HTTPS present
-                                "feature_name": display_name,
-                                "color_class": color_class,
-                                "section": section  # Add section to each feature
-                            })
-                    
-                # Normalize contributions to match total risk score, but preserve HTTPS percentage
-                if result["feature_contributions"]:
-                    # Sort by contribution (descending)
-                    result["feature_contributions"].sort(key=lambda x: -x["percentage"])
-                    
-                    # Get total of all contributions
-                    total_contribution = sum(item["percentage"] for item in result["feature_contributions"] 
-                                           if item["name"] != "https_present")
-                    https_contribution = next((item["percentage"] for item in result["feature_contributions"] 
-                                             if item["name"] == "https_present"), 0)
-                    
-                    # Calculate what's left for other features
-                    remaining_score = max(0, score - https_contribution)
-                    
-                    # If total is > 0, normalize the remaining features
-                    if total_contribution > 0 and remaining_score > 0:
-                        normalization_factor = remaining_score / total_contribution
-                        for item in result["feature_contributions"]:
-                            if item["name"] != "https_present":
-                                item["percentage"] = round(item["percentage"] * normalization_factor, 1)
-                    
-                    # Calculate section totals based on fixed weights
-                    # URL features (40%), Domain info (10%), Suspicious patterns (50%)
-                    section_weights = {
-                        "Key Risk Factors": 40.0,  # URL features (40%)
-                        "Domain Information": 10.0,  # Domain information (10%)
-                        "Suspicious Patterns": 50.0  # Suspicious patterns (50%)
-                    }
-                    
-                    # Use fixed weights but distribute actual feature contributions within them
-                    total_feature_impact = sum(item["percentage"] for item in result["feature_contributions"])
-                    if total_feature_impact > 0:
-                        # Normalize all feature impacts to a 0-100 scale
-                        normalization_factor = score / total_feature_impact
-                        for item in result["feature_contributions"]:
-                            item["percentage"] = round(item["percentage"] * normalization_factor, 1)
-                    
-                    # Calculate actual section distribution based on feature categorization
-                    actual_section_totals = {
-                        "Key Risk Factors": 0,
-                        "Domain Information": 0,
-                        "Suspicious Patterns": 0
-                    }
-                    
-                    for item in result["feature_contributions"]:
-                        section = item["section"]
-                        if section in actual_section_totals:
-                            actual_section_totals[section] += item["percentage"]
-                    
-                    # Ensure the overall risk score is preserved 
-                    result["section_totals"] = {
-                        # Use fixed weights but make sure they sum to the overall score
-                        "Key Risk Factors": round((section_weights["Key Risk Factors"] / 100) * score, 1),
-                        "Domain Information": round((section_weights["Domain Information"] / 100) * score, 1),
-                        "Suspicious Patterns": round((section_weights["Suspicious Patterns"] / 100) * score, 1)
-                    }
+                # Contributions, section totals and the feature table come from the compiled rule engine
+                explanation = explain_prediction(features, score)
+                result["feature_contributions"] = explanation["feature_contributions"]
+                if "section_totals" in explanation:
+                    result["section_totals"] = explanation["section_totals"]
+                if MODEL_ATTRIBUTIONS:
+                    result["model_attributions"] = attribute_prediction(feature_vector)
                     
                 # Get suspicious patterns
                 suspicious_patterns = check_suspicious_patterns(url)
@@ -1204,7 +1549,7 @@ def predict_with_model(url, features=None):
                     # Try to get more domain info using socket
                     if not domain_info.get("organization"):
                         try:
-                            ip = socket.gethostbyname(domain)
+                            ip = resolve_host(domain)
                             domain_info["ip_address"] = ip
                             
                             # Try to determine organization and location from IP
@@ -1213,9 +1558,9 @@ def predict_with_model(url, features=None):
                             domain_info["country"] = "Unknown Country"
                             domain_info["city"] = "Unknown City"
                         except Exception as e:
-                            logger.warning(f"Could not enhance domain info: {e}")
+                            logger.warning("Could not enhance domain info: %s", e)
                 except Exception as e:
-                    logger.warning(f"Error enhancing domain info: {e}")
+                    logger.warning("Error enhancing domain info: %s", e)
                 
                 result["domain_info"] = domain_info
                 
@@ -1225,65 +1570,15 @@ def predict_with_model(url, features=None):
                     html_security = check_html_security(url)
                     result["html_security"] = html_security
                 except Exception as e:
-                    logger.error(f"Error checking HTML security: {e}")
+                    logger.error("Error checking HTML security: %s", e)
                 
                 # Explicitly add feature_table for UI
-                result['feature_table'] = []
-                
-                # Process features and organize by category
-                for key, value in features.items():
-                    if key != "error":
-                        # Find the corresponding contribution
-                        impact = 0.0
-                        color_class = "success"
-                        
-                        for contrib in result["feature_contributions"]:
-                            if contrib["name"] == key:
-                                impact = contrib["percentage"]
-                                color_class = contrib["color_class"]
-                                break
-                        
-                        # Use friendly name if available
-                        display_name = feature_name_map.get(key, key.replace("_", " ").title())
-                        
-                        # Always include HTTPS with fixed impact
-                        if key == "https_present" and value < 1:
-                            result['feature_table'].append({
-                                'feature': "Security Weights",
-                                'value': "No" if value < 1 else "Yes",
-                                'impact': 24.6,  # Fixed percentage
-                                'color_class': "danger"
-                            })
-                        # Only include features with significant impact or specifically important ones
-                        elif impact > 3 or key in ["tld_score", "content_password_field_count", 
-                                               "content_form_count", "html_security_score", 
-                                               "domain_entropy", "content_favicon_exists", 
-                                               "rep_domain_age_category"]:
-                            # Format value based on type
-                            formatted_value = value  # Default value
-                            if isinstance(value, bool) or (isinstance(value, (int, float)) and value in [0, 1]):
-                                formatted_value = "No" if value == 0 or value is False else "Yes"
-                            elif isinstance(value, float) and value < 1:
-                                formatted_value = round(value, 2)
-                            
-                            # Append to feature table
-                            result['feature_table'].append({
-                                'feature': display_name,
-                                'value': formatted_value,
-                                'impact': impact,
-                                'color_class': color_class
-                            })
-                
-                # Sort feature_table by impact (descending)
-                result['feature_table'] = sorted(
-                    result['feature_table'],
-                    key=lambda x: -x['impact']
-                )
+                result['feature_table'] = explanation["feature_table"]
                 
                 return result
                 
             except Exception as e:
-                logger.error(f"Error making prediction with model: {e}")
+                logger.error("Error making prediction with model: %s", e)
                 logger.error(traceback.format_exc())
                 # Fall back to rule-based prediction
                 
@@ -1292,7 +1587,7 @@ def predict_with_model(url, features=None):
         return rule_based_prediction(url, features)
         
     except Exception as e:
-        logger.error(f"Unexpected error in predict_with_model: {e}")
+        logger.error("Unexpected error in predict_with_model: %s", e)
         logger.error(traceback.format_exc())
         return {
             "status": "error",
@@ -1305,6 +1600,24 @@ def predict_with_model(url, features=None):
             "suspicious_patterns": check_suspicious_patterns(url)
         }
 
+def predict_url(url):
+    """
+    Extract features for a URL and score them with the model
+    
+    Concurrent predictions of the same URL share one run.
+    
+    Args:
+        url: URL to predict
+        
+    Returns:
+        dict: Prediction result
+    """
+    return url_flight.do(f"predict:{url}", _predict_url, url)
+
+def _predict_url(url):
+    features, feature_vector = extract_features(url)
+    return predict_with_model(url, features)
+
 def get_risk_level(score):
     """
     Convert numerical risk score to categorical risk level
@@ -1324,6 +1637,7 @@ def get_risk_level(score):
     else:
         return "critical"
 
+@timed()
 def get_domain_info(url):
     """
     Get information about a domain
@@ -1334,6 +1648,9 @@ def get_domain_info(url):
     Returns:
         dict: Domain information including IP, organization, location
     """
+    return stored_features("domain_info", host_of(urlparse(url).netloc), _lookup_domain_info, url)
+
+def _lookup_domain_info(url):
     try:
         # Parse the URL to extract domain
         parsed_url = urlparse(url)
@@ -1358,12 +1675,12 @@ def get_domain_info(url):
         
         # Try to get IP address
         try:
-            ip_address = socket.gethostbyname(domain)
+            ip_address = resolve_host(domain)
             domain_info["ip_address"] = ip_address
             
             # Use ip-api.com for geolocation data
             try:
-                geo_response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=5)
+                geo_response = fetch_geo(ip_address)
                 if geo_response.status_code == 200:
                     geo_data = geo_response.json()
                     if geo_data.get("status") == "success":
@@ -1375,30 +1692,34 @@ def get_domain_info(url):
                         domain_info["region"] = geo_data.get("regionName", "Unknown")
                         domain_info["timezone"] = geo_data.get("timezone", "Unknown")
                         domain_info["as"] = geo_data.get("as", "Unknown")
-                        logger.info(f"Retrieved geolocation data for {ip_address}: {geo_data}")
+                        logger.debug("Retrieved geolocation data for %s", ip_address)
+                        log_payload(logger, "geolocation payload", ip_address=ip_address, geo=geo_data)
                     else:
-                        logger.warning(f"Failed to get geolocation data: {geo_data}")
+                        logger.warning("Failed to get geolocation data: %s", geo_data)
                         # Fall back to default coordinates if geolocation fails
                         domain_info["latitude"] = 40.7128  # Default latitude (New York)
                         domain_info["longitude"] = -74.0060  # Default longitude (New York)
                 else:
-                    logger.warning(f"Failed to get geolocation data, status code: {geo_response.status_code}")
+                    logger.warning("Failed to get geolocation data, status code: %s", geo_response.status_code)
                     # Fall back to default coordinates if geolocation fails
                     domain_info["latitude"] = 40.7128
                     domain_info["longitude"] = -74.0060
             except Exception as geo_error:
-                logger.error(f"Error getting geolocation data: {geo_error}")
+                logger.error("Error getting geolocation data: %s", geo_error)
                 # Fall back to default coordinates if geolocation fails
                 domain_info["latitude"] = 40.7128
                 domain_info["longitude"] = -74.0060
                 
         except socket.gaierror:
             domain_info["ip_address"] = "Could not resolve"
+        except ProviderUnavailableError as e:
+            # DNS provider is failing - fast-fail with the default values
+            logger.warning("Skipping domain lookup: %s", e)
         
         return domain_info
         
     except Exception as e:
-        logger.error(f"Error getting domain info: {e}")
+        logger.error("Error getting domain info: %s", e)
         return {
             "domain": urlparse(url).netloc,
             "error": str(e),
@@ -1409,6 +1730,7 @@ def get_domain_info(url):
             "longitude": 0
         }
 
+@timed()
 def check_ssl_certificate(domain):
     """
     Check SSL certificate information for a domain
@@ -1419,6 +1741,9 @@ def check_ssl_certificate(domain):
     Returns:
         dict: SSL certificate information
     """
+    return _memoized("tls", domain, tls_cache.get, domain)
+
+def _probe_ssl_certificate(domain):
     ssl_info = {
         "has_ssl": False,
         "issuer": "Unknown",
@@ -1430,7 +1755,9 @@ def check_ssl_certificate(domain):
     try:
         # Try to connect with TLS/SSL
         context = ssl.create_default_context()
-        with socket.create_connection((domain, 443), timeout=5) as sock:
+        # Resolve through the DNS breaker so unresolvable hosts fail fast
+        ip_address = resolve_host(domain)
+        with socket.create_connection((ip_address, 443), timeout=5) as sock:
             with context.wrap_socket(sock, server_hostname=domain) as ssock:
                 # Get certificate
                 cert = ssock.getpeercert()
@@ -1454,8 +1781,16 @@ def check_ssl_certificate(domain):
     except Exception as e:
         ssl_info["error"] = str(e)
     
+    outbound_calls.inc("tls", "success" if ssl_info["has_ssl"] else "error")
     return ssl_info
 
+# Certificates are kept per host until shortly before they expire; the lambda looks the
+# seam up on every call so stubs and replay still answer the probes
+tls_cache = TLSCertCache(lambda domain: _observed("tls", _probe_ssl_certificate)(domain),
+                         enabled=TLS_CACHE_MODE != 'off')
+tls_cache.start()
+
+@timed()
 def extract_whois_features(domain):
     """Extract features from WHOIS data for a domain"""
     whois_features = {
@@ -1470,7 +1805,7 @@ def extract_whois_features(domain):
         return whois_features
     
     try:
-        w = whois.whois(domain)
+        w = fetch_whois(domain)
         
         # Calculate domain age
         if w.creation_date:
@@ -1500,9 +1835,10 @@ def extract_whois_features(domain):
             
         return whois_features
     except Exception as e:
-        logger.error(f"Error getting WHOIS data: {e}")
+        logger.error("Error getting WHOIS data: %s", e)
         return whois_features
 
+@timed()
 def extract_ct_log_features(domain):
     """Extract features from Certificate Transparency logs"""
     ct_features = {
@@ -1513,7 +1849,7 @@ def extract_ct_log_features(domain):
     
     try:
         # Use crt.sh API to check certificate history
-        response = requests.get(f"https://crt.sh/?q={domain}&output=json", timeout=5)
+        response = fetch_ct_entries(domain)
         if response.status_code == 200:
             try:
                 certs = response.json()
@@ -1537,9 +1873,10 @@ def extract_ct_log_features(domain):
                     
         return ct_features
     except Exception as e:
-        logger.error(f"Error getting certificate data: {e}")
+        logger.error("Error getting certificate data: %s", e)
         return ct_features
 
+@timed()
 def extract_content_features(url, html_content=None):
     """Extract features from webpage content"""
     content_features = {
@@ -1560,16 +1897,15 @@ def extract_content_features(url, html_content=None):
         # Get the HTML content if not provided
         if html_content is None:
             try:
-                response = requests.get(url, timeout=10, 
-                                     headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'})
-                html_content = response.text
+                html_content = fetch_page(url)
                 content_features["page_size_bytes"] = len(html_content)
             except Exception as req_error:
-                logger.error(f"Error fetching HTML content: {req_error}")
+                logger.error("Error fetching HTML content: %s", req_error)
                 return content_features
         
         # Parse HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
+        with stage_duration.time("html_parse"), span("html_parse"):
+            soup = BeautifulSoup(html_content, 'html.parser')
         
         # Count forms and password fields
         content_features["form_count"] = len(soup.find_all("form"))
@@ -1631,9 +1967,10 @@ def extract_content_features(url, html_content=None):
         
         return content_features
     except Exception as e:
-        logger.error(f"Error extracting content features: {e}")
+        logger.error("Error extracting content features: %s", e)
         return content_features
 
+@timed()
 def extract_nlp_features(domain):
     """Extract NLP-based features from the domain name"""
     nlp_features = {
@@ -1646,43 +1983,36 @@ def extract_nlp_features(domain):
         }
     
     try:
-        # Remove TLD for analysis
-        domain_parts = domain.split('.')
-        domain_without_tld = '.'.join(domain_parts[:-1]) if len(domain_parts) > 1 else domain_parts[0]
+        # Statistics of the domain without its TLD, from the shared lexical scan
+        name = scan_host(domain).name
         
         # Character distribution (normalized entropy)
-        entropy = calculate_entropy(domain_without_tld)
-        nlp_features["character_distribution"] = entropy / 4.7  # Normalize, 4.7 is max entropy for English text
+        nlp_features["character_distribution"] = name.entropy / 4.7  # Normalize, 4.7 is max entropy for English text
         
         # Vowel to consonant ratio
-        vowels = sum(c.lower() in 'aeiou' for c in domain_without_tld)
-        consonants = sum(c.lower() in 'bcdfghjklmnpqrstvwxyz' for c in domain_without_tld)
-        nlp_features["vowel_consonant_ratio"] = vowels / consonants if consonants > 0 else 0
+        nlp_features["vowel_consonant_ratio"] = name.vowels / name.consonants if name.consonants > 0 else 0
         
         # Contains digits
-        nlp_features["contains_digits"] = 1 if any(c.isdigit() for c in domain_without_tld) else 0
+        nlp_features["contains_digits"] = 1 if name.has_digits else 0
         
         # Contains repeated characters (3 or more)
-        if re.search(r'(.)\1{2,}', domain_without_tld):
+        if name.repeated_chars:
             nlp_features["contains_repeated_chars"] = 1
             
-        # N-gram probability score (approximated)
-        common_english_bigrams = ["th", "he", "in", "er", "an", "re", "on", "at", "en", "nd", "ti", "es", "or"]
-        bigram_count = sum(domain_without_tld.lower().count(bigram) for bigram in common_english_bigrams)
-        domain_length = len(domain_without_tld)
-        nlp_features["ngram_score"] = bigram_count / (domain_length - 1) if domain_length > 1 else 0
+        # N-gram probability score (approximated): common English bigrams per character pair
+        domain_length = len(name.text)
+        nlp_features["ngram_score"] = name.bigram_count / (domain_length - 1) if domain_length > 1 else 0
         
         # Average word length if domain has words
-        words = re.findall(r'[a-zA-Z]+', domain_without_tld)
-        if words:
-            avg_word_length = sum(len(word) for word in words) / len(words)
-            nlp_features["word_length_avg"] = avg_word_length
+        if name.word_count:
+            nlp_features["word_length_avg"] = name.word_letters / name.word_count
             
         return nlp_features
     except Exception as e:
-        logger.error(f"Error extracting NLP features: {e}")
+        logger.error("Error extracting NLP features: %s", e)
         return nlp_features
 
+@timed()
 def extract_reputation_features(domain, ip_address):
     """Extract reputation-based features from various sources"""
     reputation_features = {
@@ -1697,7 +2027,7 @@ def extract_reputation_features(domain, ip_address):
         # Domain age categorization (if whois is available)
         if whois_available:
             try:
-                w = whois.whois(domain)
+                w = fetch_whois(domain)
                 if w.creation_date:
                     creation_date = w.creation_date
                     if isinstance(creation_date, list):
@@ -1711,7 +2041,7 @@ def extract_reputation_features(domain, ip_address):
                     else:
                         reputation_features["domain_age_category"] = 3  # Established
             except Exception as whois_error:
-                logger.warning(f"Whois error for reputation features: {whois_error}")
+                logger.warning("Whois error for reputation features: %s", whois_error)
             
         # Check for blacklisted IP (simplified - would use an actual API)
         high_risk_countries = ["RU", "CN", "IR", "KP", "NG"]
@@ -1720,7 +2050,7 @@ def extract_reputation_features(domain, ip_address):
         # Get IP geolocation
         if ip_address and ip_address != "Unknown" and ip_address != "Could not resolve":
             try:
-                geo_response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=5)
+                geo_response = fetch_geo(ip_address)
                 if geo_response.status_code == 200:
                     geo_data = geo_response.json()
                     if geo_data.get("status") == "success":
@@ -1733,7 +2063,7 @@ def extract_reputation_features(domain, ip_address):
                         if any(org.lower() in asn_org for org in suspicious_asn_orgs):
                             reputation_features["ip_blacklisted"] = 0.5  # Partial flag
             except Exception as geo_error:
-                logger.warning(f"Error getting geolocation for reputation: {geo_error}")
+                logger.warning("Error getting geolocation for reputation: %s", geo_error)
                 
         # Check TLD risk category
         tld = domain.split('.')[-1] if '.' in domain else ''
@@ -1747,26 +2077,32 @@ def extract_reputation_features(domain, ip_address):
             
         return reputation_features
     except Exception as e:
-        logger.error(f"Error extracting reputation features: {e}")
+        logger.error("Error extracting reputation features: %s", e)
         return reputation_features
 
+@timed()
 def analyze_url(url):
     """
     Comprehensive URL analysis function that combines multiple checks
     
+    Concurrent analyses of the same URL share one run.
+    
     Args:
         url: URL to analyze
         
     Returns:
         dict: Comprehensive analysis result
     """
-    logger.info(f"Analyzing URL: {url}")
+    logger.info("Analyzing URL: %s", url)
     
     # Ensure URL has a scheme
     if not url.startswith(('http://', 'https://')):
         url = 'http://' + url
-        logger.info(f"Added scheme to URL: {url}")
+        logger.info("Added scheme to URL: %s", url)
     
+    return url_flight.do(f"analyze:{url}", _analyze_url, url)
+
+def _analyze_url(url):
     try:
         # Extract features and make prediction
         features, feature_vector = extract_features(url)
@@ -1782,6 +2118,7 @@ def analyze_url(url):
         parsed_url = urlparse(url)
         domain = parsed_url.netloc
         scheme = parsed_url.scheme
+        lookalike = find_lookalike(domain)
         
         # Get domain information if available
         domain_info = get_domain_info(url)
@@ -1802,6 +2139,7 @@ def analyze_url(url):
             "risk_factors": prediction_result.get("risk_factors", {}),
             "feature_values": features,
             "domain_info": domain_info,
+            "lookalike": lookalike.as_dict() if lookalike else None,
             "feature_contributions": prediction_result.get("feature_contributions", []),
             "feature_table": prediction_result.get("feature_table", []),
             "section_totals": prediction_result.get("section_totals", {})
@@ -1843,20 +2181,20 @@ def analyze_url(url):
             result["score"] = adjusted_score
             result["fraud_score"] = adjusted_score
             result["risk_level"] = get_risk_level(adjusted_score)
-            logger.info(f"Adjusted score due to no suspicious patterns: {original_score} -> {adjusted_score}")
+            logger.info("Adjusted score due to no suspicious patterns: %s -> %s", original_score, adjusted_score)
         
         # Add SSL info if available
         try:
             ssl_info = check_ssl_certificate(domain)
             result["ssl_info"] = ssl_info
         except Exception as e:
-            logger.warning(f"Unable to check SSL certificate: {str(e)}")
+            logger.warning("Unable to check SSL certificate: %s", e)
             result["ssl_info"] = {"error": str(e)}
         
-        logger.info(f"Analysis complete for {url} - Risk score: {result['score']}")
+        logger.info("Analysis complete for %s - Risk score: %s", url, result['score'])
         return result
     except Exception as e:
-        logger.error(f"Error analyzing URL: {str(e)}")
+        logger.error("Error analyzing URL: %s", e)
         logger.error(traceback.format_exc())
         return {
             "status": "error",
@@ -1868,6 +2206,9 @@ def analyze_url(url):
             "suspicious_patterns": check_suspicious_patterns(url)
         }
 
+# Record provider traffic to, or replay it from, an archive (PROVIDER_ARCHIVE_MODE=record|replay)
+provider_archive = configure_provider_archive(sys.modules[__name__])
+
 @app.route("/")
 @app.route("/index.html")
 def home():
@@ -1875,7 +2216,7 @@ def home():
     try:
         return render_template("index.html")
     except Exception as e:
-        logger.error(f"Error rendering index.html: {e}")
+        logger.error("Error rendering index.html: %s", e)
         return f"Error: {str(e)}", 500
 
 @app.route("/about")
@@ -1893,9 +2234,16 @@ def health_check():
         "status": "healthy",
         "message": "Integrated Flask app is running",
         "model_loaded": get_model_instance() is not None,
-        "scaler_loaded": get_scaler_instance() is not None
+        "scaler_loaded": get_scaler_instance() is not None,
+        "ready": is_ready()
     })
 
+@app.route("/ready")
+def ready():
+    """Readiness probe: 503 until the model warmup has finished"""
+    warmup = get_warmup_status()
+    return jsonify({"ready": is_ready(), "warmup": warmup}), 200 if is_ready() else 503
+
 @app.route("/predict", methods=["POST", "OPTIONS"])
 def predict():
     # Handle CORS preflight requests
@@ -1908,10 +2256,11 @@ def predict():
     
     if request.method == 'POST':
         try:
-            # Log request headers for debugging
-            logger.info(f"Request headers: {dict(request.headers)}")
-            logger.info(f"Request content type: {request.content_type}")
-            logger.info(f"Raw request data: {request.data.decode('utf-8', errors='replace') if request.data else 'None'}")
+            # Full request details only for sampled requests
+            log_payload(logger, "predict request",
+                        headers=lambda: dict(request.headers),
+                        content_type=request.content_type,
+                        body=lambda: request.get_data(as_text=True))
             
             # Extract URL from request
             url = None
@@ -1919,20 +2268,15 @@ def predict():
             # Try different methods to extract the URL
             if request.is_json:
                 data = request.get_json(force=True)
-                logger.info(f"JSON data: {data}")
                 url = data.get('url', '')
             elif request.form:
-                logger.info(f"Form data: {dict(request.form)}")
                 url = request.form.get('url', '')
             elif request.data:
                 try:
                     data = json.loads(request.data.decode('utf-8'))
-                    logger.info(f"Parsed JSON from raw data: {data}")
                     url = data.get('url', '')
                 except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse raw data as JSON: {e}")
-            
-            logger.info(f"Extracted URL: {url}")
+                    logger.warning("Failed to parse raw data as JSON: %s", e)
             
             if not url or len(url.strip()) == 0:
                 logger.error("No URL provided in request")
@@ -1945,25 +2289,18 @@ def predict():
             # Ensure URL has a scheme
             if not url.startswith(('http://', 'https://')):
                 url = 'http://' + url
-                logger.info(f"Added http:// prefix to URL: {url}")
-            
-            # Process the URL directly without backend API call
-            logger.info("Processing prediction request directly")
-            
-            # Extract features
-            features, feature_vector = extract_features(url)
             
-            # Get prediction
-            result = predict_with_model(url, features)
+            # Get prediction, letting the lexical fast path decide when it is confident
+            if use_tiered_scoring(request):
+                result = tiered_analysis(url, predict_url)
+            else:
+                result = predict_url(url)
             
             # Save to Firestore history if user is authenticated
             user_id = get_user_id_from_request(request)
             if user_id:
                 save_history_to_firestore(user_id, url, result)
             
-            # For debugging the feature display issue
-            logger.info(f"Feature contributions: {result.get('feature_contributions', [])}")
-            
             # Explicitly add this field for the UI
             if 'feature_table' not in result:
                 result['feature_table'] = []
@@ -1982,11 +2319,11 @@ def predict():
                         key=lambda x: (x['value'] == 0, x['value'])
                     )
             
-            logger.info(f"Feature table: {result.get('feature_table', [])}")
-            logger.info(f"Prediction result: {result}")
+            logger.info("Predicted %s: score=%s risk_level=%s", url, result.get('score'), result.get('risk_level'))
+            log_payload(logger, "predict result", url=url, result=result)
             return jsonify(result)
         except Exception as e:
-            logger.error(f"Unexpected error in predict route: {e}")
+            logger.error("Unexpected error in predict route: %s", e)
             logger.error(traceback.format_exc())
             return jsonify({
                 "status": "error",
@@ -2072,7 +2409,7 @@ def analyze():
             params['format'] = report_format
             
         # Send the request to the backend
-        logger.info(f"Forwarding analyze request to backend: {backend_url}")
+        logger.info("Forwarding analyze request to backend: %s", backend_url)
             
         if request.method == 'POST':
             response = requests.post(
@@ -2102,11 +2439,11 @@ def analyze():
                 return response.text, 200, {'Content-Type': 'text/html'}
         else:
             # If the backend returned an error, log it and fall back to local analysis
-            logger.warning(f"Backend returned error {response.status_code}: {response.text}")
+            logger.warning("Backend returned error %s: %s", response.status_code, response.text)
             logger.info("Using local analysis as fallback")
             
             # Fall back to local implementation using analyze_url
-            analysis_result = analyze_url(url)
+            analysis_result = tiered_analysis(url, analyze_url) if use_tiered_scoring(request) else analyze_url(url)
             # Save to Firestore history if user is authenticated
             user_id = get_user_id_from_request(request)
             if user_id:
@@ -2114,11 +2451,11 @@ def analyze():
             return jsonify(analysis_result)
             
     except requests.RequestException as e:
-        logger.error(f"Error connecting to backend API: {e}")
+        logger.error("Error connecting to backend API: %s", e)
         logger.info("Using local analysis as fallback")
         
         # Fall back to local implementation using analyze_url
-        analysis_result = analyze_url(url)
+        analysis_result = tiered_analysis(url, analyze_url) if use_tiered_scoring(request) else analyze_url(url)
         # Save to Firestore history if user is authenticated
         user_id = get_user_id_from_request(request)
         if user_id:
@@ -2126,7 +2463,7 @@ def analyze():
         return jsonify(analysis_result)
         
     except Exception as e:
-        logger.error(f"Error generating analysis: {e}")
+        logger.error("Error generating analysis: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({
             "status": "error", 
@@ -2157,10 +2494,40 @@ def model_status():
         "scaler_loaded": get_scaler_instance() is not None,
         "status": "operational" if get_model_instance() is not None and get_scaler_instance() is not None else "error",
         "model_type": str(type(get_model_instance())) if get_model_instance() else "None",
-        "using_fallback": hasattr(get_model_instance(), 'summary') and get_model_instance().summary() == "Fallback model (SimpleModel)"
+        "using_fallback": hasattr(get_model_instance(), 'summary') and get_model_instance().summary() == "Fallback model (SimpleModel)",
+        "backend": get_inference_backend(),
+        "precision": get_inference_precision(),
+        "threads": configure_threads(),
+        "warmup": get_warmup_status(),
+        "providers": get_breaker_status(),
+        "tiered_scoring": get_tiered_scoring_stats(),
+        "job_queue": {
+            "tasks": job_queue.stats() if job_queue else None,
+            "workers": job_workers.status() if job_workers else None
+        },
+        "history_writer": history_writer.stats() if history_writer else None,
+        "token_cache": token_cache.stats() if token_cache else None,
+        "logging": get_logging_stats(),
+        "provider_archive": provider_archive.stats() if provider_archive else None,
+        "attributions": get_attribution_stats(),
+        "lexer_cache": lexer_cache_info(),
+        "tls_cache": tls_cache.stats(),
+        "feature_schema": {**FEATURE_SCHEMA.describe(), "model_input_width": get_input_width()},
+        "feature_store": feature_store.stats() if feature_store else None,
+        "coalescing": {"url": url_flight.stats(), "enrichment": enrichment_flight.stats()}
     }
     return jsonify(status)
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of stage latencies, provider calls, cache hits and in-flight requests"""
+    return Response(metrics.generate_latest(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/provider-status', methods=['GET'])
+def provider_status():
+    """Circuit breaker state and negative cache statistics for enrichment providers"""
+    return jsonify(get_breaker_status())
+
 @app.route('/debug', methods=['GET'])
 def debug():
     """Debug endpoint showing environment and configuration"""
@@ -2205,7 +2572,7 @@ def safe_decode_model_config(raw_config):
         # Re-encode as JSON string
         return json.dumps(config)
     except Exception as e:
-        logger.error(f"Error processing model config: {e}")
+        logger.error("Error processing model config: %s", e)
         # Return original if processing failed
         return raw_config
 
@@ -2241,7 +2608,7 @@ def build_compatible_model(model_path):
                 logger.error("No model config found in H5 file")
                 return None
     except Exception as e:
-        logger.error(f"Error building compatible model: {e}")
+        logger.error("Error building compatible model: %s", e)
         return None
 
 @app.route('/debug-connection', methods=['GET', 'POST'])
@@ -2277,7 +2644,7 @@ def debug_connection():
                 "timestamp": datetime.now().isoformat()
             })
     except Exception as e:
-        logger.error(f"Error in debug-connection endpoint: {e}")
+        logger.error("Error in debug-connection endpoint: %s", e)
         return jsonify({
             "status": "error",
             "message": str(e),
@@ -2315,8 +2682,10 @@ def api_analyze_url():
     
     if request.method == 'POST':
         try:
-            # Log request details for debugging
-            logger.info(f"API analyze-url request received")
+            # Full request details only for sampled requests
+            log_payload(logger, "analyze-url request",
+                        content_type=request.content_type,
+                        body=lambda: request.get_data(as_text=True))
             
             # Extract URL from request
             url = None
@@ -2324,20 +2693,15 @@ def api_analyze_url():
             
             if request.is_json:
                 data = request.get_json(force=True)
-                logger.info(f"JSON data: {data}")
                 url = data.get('url', '')
             elif request.form:
-                logger.info(f"Form data: {dict(request.form)}")
                 url = request.form.get('url', '')
             elif request.data:
                 try:
                     data = json.loads(request.data.decode('utf-8'))
-                    logger.info(f"Parsed JSON from raw data: {data}")
                     url = data.get('url', '')
                 except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse raw data as JSON: {e}")
-            
-            logger.info(f"Extracted URL for analysis: {url}")
+                    logger.warning("Failed to parse raw data as JSON: %s", e)
             
             if not url or len(url.strip()) == 0:
                 logger.error("No URL provided in request")
@@ -2350,24 +2714,22 @@ def api_analyze_url():
             # Ensure URL has a scheme
             if not url.startswith(('http://', 'https://')):
                 url = 'http://' + url
-                logger.info(f"Added http:// prefix to URL: {url}")
-            
-            # Process the URL using the analyze_url function
-            logger.info(f"Analyzing URL: {url}")
             
             # Call analyze_url to get complete analysis
-            analysis_result = analyze_url(url)
+            analysis_result = tiered_analysis(url, analyze_url) if use_tiered_scoring(request) else analyze_url(url)
             
             # Save to Firestore history if user is authenticated
             user_id = get_user_id_from_request(request)
             if user_id:
                 save_history_to_firestore(user_id, url, analysis_result)
             
-            logger.info(f"Analysis complete for {url}")
+            logger.info("Analyzed %s: score=%s risk_level=%s", url, analysis_result.get('score'),
+                        analysis_result.get('risk_level'))
+            log_payload(logger, "analyze-url result", url=url, result=analysis_result)
             return jsonify(analysis_result)
             
         except Exception as e:
-            logger.error(f"Error in API analyze-url: {e}")
+            logger.error("Error in API analyze-url: %s", e)
             logger.error(traceback.format_exc())
             return jsonify({
                 "status": "error",
@@ -2375,27 +2737,274 @@ def api_analyze_url():
                 "details": str(e)
             }), 500
 
+# Worker threads running the enrichment steps of streamed analyses
+stream_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('STREAM_WORKERS', 16)),
+                                     thread_name_prefix='stream-enrichment')
+
+def _json_default(value):
+    # numpy scalars and datetimes that end up in result dictionaries
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+def format_sse(event, data):
+    """
+    Format one Server-Sent Events message
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload
+
+    Returns:
+        str: SSE message
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+def stream_analysis(url, user_id=None):
+    """
+    Analyze a URL, yielding SSE messages as each stage completes.
+
+    The lexical score is sent immediately, the enrichment steps (DNS/geo,
+    WHOIS, HTML security, CT, TLS) run concurrently and are pushed as they
+    finish, and the final model result reuses their memoized provider data.
+
+    Args:
+        url: URL to analyze (with scheme)
+        user_id: Firebase user id for saving history, if authenticated
+
+    Yields:
+        str: SSE messages
+    """
+    with enrichment_scope():
+        parsed_url = urlparse(url)
+        domain = parsed_url.netloc.lower()
+
+        prescore = lexical_prescore(url)
+        yield format_sse("lexical", {
+            "url": url,
+            "domain": parsed_url.netloc,
+            "protocol": parsed_url.scheme,
+            "score": prescore["score"],
+            "confidence": prescore["confidence"],
+            "decision_rule": prescore["rule"],
+            "suspicious_patterns": prescore["suspicious_patterns"]
+        })
+
+        def html_step():
+            html_security = check_html_security(url)
+            return {"html_security": html_security, "content_features": extract_content_features(url)}
+
+        steps = {
+            "domain_info": lambda: {"domain_info": get_domain_info(url)},
+            "whois": lambda: {"whois": extract_whois_features(domain)},
+            "html_security": html_step,
+            "ct": lambda: {"ct": extract_ct_log_features(domain)},
+            "ssl": lambda: {"ssl_info": check_ssl_certificate(domain)}
+        }
+        # Each worker needs its own copy of the context to see the shared memo
+        futures = {
+            stream_executor.submit(contextvars.copy_context().run, step): name
+            for name, step in steps.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                yield format_sse(name, future.result())
+            except Exception as e:
+                logger.warning("Streaming step %s failed for %s: %s", name, url, e)
+                yield format_sse("step_error", {"step": name, "message": str(e)})
+
+        result = analyze_url(url)
+        if user_id:
+            save_history_to_firestore(user_id, url, result)
+        yield format_sse("result", result)
+
+@app.route('/api/analyze-url/stream', methods=['GET', 'POST', 'OPTIONS'])
+def api_analyze_url_stream():
+    """Progressive URL analysis over Server-Sent Events"""
+    # Handle CORS preflight requests
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'success'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
+        return response
+
+    # Extract URL from request (GET for EventSource clients, POST for fetch streaming)
+    url = None
+    if request.method == 'POST':
+        if request.is_json:
+            data = request.get_json(force=True)
+            url = data.get('url', '')
+        elif request.form:
+            url = request.form.get('url', '')
+    else:
+        url = request.args.get('url', '')
+
+    if not url or len(url.strip()) == 0:
+        return jsonify({
+            "status": "error",
+            "message": "No URL provided",
+            "details": "Please enter a valid URL to analyze"
+        }), 400
+
+    # Ensure URL has a scheme
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'http://' + url
+
+    user_id = get_user_id_from_request(request)
+
+    def generate():
+        try:
+            yield from stream_analysis(url, user_id)
+        except Exception as e:
+            logger.error("Error streaming analysis for %s: %s", url, e)
+            logger.error(traceback.format_exc())
+            yield format_sse("error", {"status": "error", "message": "An error occurred while analyzing the URL", "details": str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def run_job_task(url, options):
+    """
+    Analyze one URL for the background job queue
+    
+    Args:
+        url: URL to analyze
+        options: Job options ('scoring' mode, 'user_id' for history)
+        
+    Returns:
+        dict: Analysis result
+        
+    Raises:
+        RuntimeError: The analysis failed and should be retried
+    """
+    scoring = options.get('scoring')
+    tiered = TIERED_SCORING if scoring not in ('tiered', 'full') else scoring == 'tiered'
+    result = tiered_analysis(url, analyze_url) if tiered else analyze_url(url)
+    if result.get("status") == "error":
+        raise RuntimeError(result.get("message", "Analysis failed"))
+    
+    user_id = options.get('user_id')
+    if user_id:
+        save_history_to_firestore(user_id, url, result)
+    return result
+
+# Persistent job queue and the in-process workers draining it
+try:
+    job_queue = JobQueue()
+except Exception as e:
+    logger.error("Failed to open job queue: %s", e)
+    job_queue = None
+
+job_workers = None
+if job_queue is not None and int(os.environ.get('JOB_WORKERS', 2)) > 0:
+    # Tasks claimed together share the feature store's bulk reads and writes
+    job_workers = JobWorkerPool(job_queue, run_job_task,
+                                workers=int(os.environ.get('JOB_WORKERS', 2)),
+                                mode=os.environ.get('JOB_WORKER_MODE', 'thread'),
+                                batch_context=feature_store_batch)
+    job_workers.start()
+
+@app.route('/api/jobs', methods=['POST', 'OPTIONS'])
+def submit_job():
+    """Enqueue one URL or a batch for background analysis and return a job id"""
+    # Handle CORS preflight requests
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'success'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        return response
+    
+    if job_queue is None:
+        return jsonify({"status": "error", "message": "Job queue is not available"}), 503
+    
+    data = request.get_json(force=True, silent=True) or {}
+    urls = data.get('urls')
+    if urls is None and data.get('url'):
+        urls = [data.get('url')]
+    if not isinstance(urls, list) or not all(isinstance(u, str) and u.strip() for u in urls):
+        return jsonify({
+            "status": "error",
+            "message": "No URL provided",
+            "details": "Provide 'url' or a non-empty list of 'urls'"
+        }), 400
+    
+    # Ensure URLs have a scheme
+    urls = [u.strip() if u.strip().startswith(('http://', 'https://')) else 'http://' + u.strip() for u in urls]
+    
+    options = {}
+    if data.get('scoring') in ('tiered', 'full'):
+        options['scoring'] = data['scoring']
+    user_id = get_user_id_from_request(request)
+    if user_id:
+        options['user_id'] = user_id
+    
+    try:
+        job_id, deduplicated = job_queue.submit(urls, callback_url=data.get('callback_url'), options=options)
+    except JobError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    if not deduplicated and len(urls) > 1:
+        # Certificates of the batch are probed concurrently while the workers start on it
+        tls_cache.prefetch(urlparse(u).netloc for u in urls)
+    
+    logger.info("Queued job %s with %s URL(s) (deduplicated: %s)", job_id, len(urls), deduplicated)
+    return jsonify({
+        "status": "accepted",
+        "job_id": job_id,
+        "deduplicated": deduplicated,
+        "status_url": url_for('job_status', job_id=job_id)
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a background job; add ?results=0 to omit per-URL results"""
+    if job_queue is None:
+        return jsonify({"status": "error", "message": "Job queue is not available"}), 503
+    
+    include_results = request.args.get('results', '1') != '0'
+    job = job_queue.get_job(job_id, include_results=include_results)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job)
+
 if firebase_available:
     from firebase_admin import firestore
     db = firestore.client()
 else:
     db = None
 
+# Full results behind the compact history documents, for the lazy details endpoint
+history_details = None
+if db:
+    try:
+        history_details = HistoryDetailStore()
+    except Exception as e:
+        logger.error("History detail store unavailable: %s", e)
+
+# Scan history is written off the request path in Firestore batches
+history_writer = HistoryWriter(db, detail_store=history_details) if db else None
+if history_writer:
+    history_writer.start()
+
 def save_history_to_firestore(user_id, url, result):
-    if not db:
+    if not history_writer:
         logger.warning("Firestore not available, cannot save history")
         return
-    try:
-        # Save to the same path the frontend expects
-        doc_ref = db.collection('users').document(user_id).collection('scans').document()
-        doc_ref.set({
-            'url': url,
-            'result': result,
-            'timestamp': datetime.utcnow()
-        })
-        logger.info(f"Saved analysis for {url} to history for user {user_id}")
-    except Exception as e:
-        logger.error(f"Error saving history to Firestore: {e}")
+    # Only the summary goes to Firestore; the feature vector is packed so scores can be recomputed
+    features = result.get("feature_values")
+    layout = vector = None
+    if isinstance(features, dict) and "error" not in features:
+        layout = FEATURE_SCHEMA.names
+        vector = FEATURE_SCHEMA.row_from_dict(features)[:len(layout)]
+    doc = build_history_record(url, result, get_model_version(), layout, vector)
+    history_writer.enqueue(user_id, doc, details=result)
+    logger.info("Queued analysis for %s for history of user %s", url, user_id)
 
 def get_user_id_from_request(request):
     auth_header = request.headers.get('Authorization', '')
@@ -2403,14 +3012,62 @@ def get_user_id_from_request(request):
         return None
     id_token = auth_header.split(' ')[1]
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        if token_cache:
+            decoded_token = token_cache.verify(id_token)
+        else:
+            decoded_token = auth.verify_id_token(id_token)
         return decoded_token['uid']
     except Exception as e:
-        logger.error(f"Invalid Firebase ID token: {e}")
+        logger.error("Invalid Firebase ID token: %s", e)
         return None
 
+@app.route('/api/history/<scan_id>/details', methods=['GET', 'OPTIONS'])
+def history_details_route(scan_id):
+    """
+    Get the full result behind a compact history document.
+    
+    Served from the local detail store when the stored result matches the
+    document's content hash; otherwise the URL is analyzed again.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
+        return response
+    
+    if not db:
+        return jsonify({"status": "error", "message": "Firestore not available"}), 503
+    user_id = get_user_id_from_request(request)
+    if not user_id:
+        return jsonify({"status": "error", "message": "Authentication required"}), 401
+    
+    snapshot = db.collection('users').document(user_id).collection('scans').document(scan_id).get()
+    if not snapshot.exists:
+        return jsonify({"status": "error", "message": "Scan not found"}), 404
+    doc = snapshot.to_dict()
+    
+    # Documents written before the compact schema still embed the whole result
+    if "result" in doc:
+        return jsonify({"status": "success", "source": "legacy", "result": doc["result"]})
+    
+    digest = doc.get("contentHash")
+    result = history_details.get(digest) if (history_details and digest) else None
+    if result is not None:
+        return jsonify({"status": "success", "source": "stored", "result": result})
+    
+    result = analyze_url(doc["url"])
+    return jsonify({
+        "status": "success",
+        "source": "recomputed",
+        "matches_original": content_hash(result) == digest,
+        "model_version": get_model_version(),
+        "original_model_version": doc.get("modelVersion"),
+        "result": result
+    })
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5001))
     debug = os.environ.get("DEBUG", "False").lower() == "true"
-    logger.info(f"Starting application on port {port}")
+    logger.info("Starting application on port %s", port)
     app.run(host="0.0.0.0", port=port, debug=debug)
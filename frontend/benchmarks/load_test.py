@@ -0,0 +1,501 @@
+"""
+Open-loop HTTP load test of /predict, /analyze and /api/analyze-url.
+
+Starts the app with stubbed providers (benchmarks/stubbed_app.py) under
+gunicorn for every combination of worker and thread counts, sends requests
+at a fixed arrival rate regardless of how fast the server answers, and
+reports throughput, latency percentiles, error rates and per-worker CPU and
+RSS over time as JSON.
+
+    python benchmarks/load_test.py --workers 1,2,4 --threads 1,8 --rate 10 --duration 60 -o load.json
+    python benchmarks/load_test.py --mix predict=0.7,api=0.3 --provider-latency dns=0.02,whois=0.3,page=0.25
+    python benchmarks/load_test.py --target http://127.0.0.1:5001 --rate 2 --duration 30
+
+Latency is measured from the moment a request was scheduled, so a server
+that falls behind shows up as growing latency instead of a slower sender.
+Requests that cannot be sent because --max-inflight requests are already
+waiting are counted as dropped. /analyze is pointed at a closed local port
+as its backend, so it always takes the local analysis fallback.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+from collections import Counter
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    import psutil
+    psutil_available = True
+except ImportError:
+    psutil = None
+    psutil_available = False
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, FRONTEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from run_benchmarks import summarize, _git_commit
+
+# Mix name -> (method, path)
+ENDPOINTS = {
+    "predict": ("POST", "/predict"),
+    "analyze": ("POST", "/analyze"),
+    "api": ("POST", "/api/analyze-url"),
+}
+DEFAULT_MIX = "predict=0.5,api=0.3,analyze=0.2"
+# Nothing listens here; /analyze falls back to local analysis immediately
+CLOSED_BACKEND_URL = "http://127.0.0.1:9"
+
+
+def parse_weights(text, allowed=None):
+    """
+    Parse "name=weight,..." into a list of (name, weight).
+
+    Raises:
+        ValueError: Unknown name or no positive weight
+    """
+    weights = []
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if allowed is not None and name not in allowed:
+            raise ValueError(f"Unknown endpoint {name!r} (choose from {', '.join(sorted(allowed))})")
+        weights.append((name, float(weight or 1)))
+    if not weights or sum(weight for _, weight in weights) <= 0:
+        raise ValueError(f"No positive weights in {text!r}")
+    return weights
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """
+    The app with stubbed providers in a child process.
+
+    Args:
+        server: "gunicorn" or "flask" (threaded development server, one process)
+        workers: gunicorn worker processes
+        threads: Threads per gunicorn worker
+        env: Extra environment variables for the app
+    """
+    def __init__(self, server="gunicorn", workers=1, threads=1, env=None):
+        self.server = server
+        self.workers = workers
+        self.threads = threads
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.env = {**os.environ, "JOB_WORKERS": "0", "LOG_LEVEL": "WARNING",
+                    "BACKEND_URL": CLOSED_BACKEND_URL, "MODEL_WORKERS": str(workers), **(env or {})}
+        self.process = None
+
+    def start(self, ready_timeout=180):
+        if self.server == "gunicorn":
+            command = ["gunicorn", "--chdir", BENCH_DIR, "-w", str(self.workers), "--threads", str(self.threads),
+                       "-b", f"127.0.0.1:{self.port}", "--timeout", "120", "stubbed_app:app"]
+        else:
+            command = [sys.executable, os.path.join(BENCH_DIR, "stubbed_app.py")]
+            self.env["PORT"] = str(self.port)
+        self.process = subprocess.Popen(command, env=self.env, cwd=FRONTEND_DIR,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + ready_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.server} exited with status {self.process.returncode}")
+            try:
+                # /ready answers 200 once the model is warmed up
+                if requests.get(self.base_url + "/ready", timeout=2).status_code == 200:
+                    return self.base_url
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"App did not become ready within {ready_timeout}s")
+
+    def worker_pids(self):
+        """Processes that serve requests: the gunicorn workers, or the single flask process"""
+        if self.process is None or not psutil_available:
+            return []
+        try:
+            parent = psutil.Process(self.process.pid)
+            if self.server == "gunicorn":
+                return [child.pid for child in parent.children()]
+            return [parent.pid]
+        except psutil.NoSuchProcess:
+            return []
+
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class ResourceSampler:
+    """
+    Samples CPU and RSS of the worker processes at a fixed interval.
+
+    Args:
+        pids: Callable returning the current worker pids
+        interval: Seconds between samples
+    """
+    def __init__(self, pids, interval=1.0):
+        self.pids = pids
+        self.interval = interval
+        self.samples = []
+        self._processes = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def start(self):
+        if not psutil_available:
+            return
+        self._started = time.perf_counter()
+        self._sample(record=False)
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self, record=True):
+        workers = []
+        for pid in self.pids():
+            process = self._processes.get(pid)
+            try:
+                if process is None:
+                    # cpu_percent needs a previous call to measure against
+                    process = self._processes[pid] = psutil.Process(pid)
+                    process.cpu_percent(None)
+                    continue
+                workers.append({
+                    "pid": pid,
+                    "cpu_percent": round(process.cpu_percent(None), 1),
+                    "rss_mb": round(process.memory_info().rss / (1024 * 1024), 1)
+                })
+            except psutil.NoSuchProcess:
+                self._processes.pop(pid, None)
+        if record:
+            self.samples.append({"t": round(time.perf_counter() - self._started, 2), "workers": workers})
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def summary(self):
+        per_worker = {}
+        for sample in self.samples:
+            for worker in sample["workers"]:
+                entry = per_worker.setdefault(str(worker["pid"]), {"cpu": [], "rss": []})
+                entry["cpu"].append(worker["cpu_percent"])
+                entry["rss"].append(worker["rss_mb"])
+        return {
+            "available": psutil_available,
+            "interval": self.interval,
+            "workers": {
+                pid: {
+                    "cpu_percent_mean": round(sum(values["cpu"]) / len(values["cpu"]), 1),
+                    "cpu_percent_max": max(values["cpu"]),
+                    "rss_mb_start": values["rss"][0],
+                    "rss_mb_max": max(values["rss"])
+                } for pid, values in per_worker.items()
+            },
+            "samples": self.samples
+        }
+
+
+def arrival_times(rate, duration, arrival, rng):
+    """
+    Scheduled send offsets in seconds.
+
+    Args:
+        rate: Mean requests per second
+        duration: Seconds of load
+        arrival: "poisson" (exponential gaps) or "constant"
+    """
+    times = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+def run_load(base_url, mix, urls, rate, duration, arrival="poisson", max_inflight=256, timeout=60.0, seed=1):
+    """
+    Send requests open-loop and collect one record per scheduled request.
+
+    Returns:
+        tuple: (records, wall seconds from first send to last completion)
+    """
+    rng = random.Random(seed)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    schedule = [(offset, rng.choices(names, weights)[0], rng.choice(urls))
+                for offset in arrival_times(rate, duration, arrival, rng)]
+
+    local = threading.local()
+    records = []
+    records_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max_inflight)
+
+    def send(offset, endpoint, url, scheduled):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path = ENDPOINTS[endpoint]
+        record = {"endpoint": endpoint, "offset": offset, "status": None, "error": None}
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json={"url": url}, timeout=timeout)
+            record["status"] = response.status_code
+            if response.status_code >= 400:
+                record["error"] = f"http_{response.status_code}"
+            else:
+                try:
+                    data = response.json()
+                    if isinstance(data, dict) and data.get("status") == "error":
+                        record["error"] = "app_error"
+                except ValueError:
+                    record["error"] = "invalid_json"
+        except requests.Timeout:
+            record["error"] = "timeout"
+        except requests.RequestException as e:
+            record["error"] = type(e).__name__
+        finally:
+            slots.release()
+        finished = time.perf_counter()
+        record["latency"] = finished - scheduled
+        record["service_time"] = finished - started
+        record["finished"] = finished
+        with records_lock:
+            records.append(record)
+
+    dropped = []
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        start = time.perf_counter()
+        for offset, endpoint, url in schedule:
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if not slots.acquire(blocking=False):
+                dropped.append({"endpoint": endpoint, "offset": offset, "error": "dropped"})
+                continue
+            executor.submit(send, offset, endpoint, url, scheduled)
+    finished = max((record["finished"] for record in records), default=time.perf_counter())
+    return records + dropped, finished - start
+
+
+def _latency(records):
+    durations = [record["latency"] for record in records if record.get("latency") is not None]
+    return summarize(durations) if durations else None
+
+
+def _error_summary(records):
+    errors = sum(1 for record in records if record["error"])
+    return {
+        "requests": len(records),
+        "errors": errors,
+        "error_rate": round(errors / len(records), 4) if records else None
+    }
+
+
+def report(records, elapsed, duration):
+    """
+    Aggregate request records.
+
+    Returns:
+        dict: Totals, throughput, latency percentiles (all completed
+            requests), per-endpoint breakdown and a per-second timeline
+    """
+    completed = [record for record in records if record["error"] != "dropped"]
+    successful = [record for record in completed if not record["error"]]
+    timeline = []
+    for second in range(int(duration) + 1):
+        bucket = [record for record in completed if second <= record["offset"] < second + 1]
+        if not bucket:
+            continue
+        latency = _latency(bucket)
+        timeline.append({
+            "second": second,
+            "sent": len(bucket),
+            "errors": sum(1 for record in bucket if record["error"]),
+            "p50_ms": latency["p50_ms"],
+            "p95_ms": latency["p95_ms"]
+        })
+    return {
+        "totals": {
+            **_error_summary(records),
+            "completed": len(completed),
+            "successful": len(successful),
+            "dropped": len(records) - len(completed),
+            "elapsed_seconds": round(elapsed, 3)
+        },
+        "throughput_rps": round(len(successful) / elapsed, 2) if elapsed > 0 else None,
+        "latency": _latency(completed),
+        "service_time": summarize([record["service_time"] for record in completed]) if completed else None,
+        "endpoints": {
+            endpoint: {**_error_summary(subset), "latency": _latency(subset)}
+            for endpoint in ENDPOINTS
+            for subset in [[record for record in records if record["endpoint"] == endpoint]]
+            if subset
+        },
+        "status_codes": dict(Counter(str(record["status"]) for record in completed)),
+        "errors": dict(Counter(record["error"] for record in records if record["error"])),
+        "timeline": timeline
+    }
+
+
+def run_configuration(args, mix, urls, workers, threads):
+    """Start the app with one worker/thread setting, warm it up, load it and stop it"""
+    env = {}
+    if args.provider_latency:
+        env["STUB_PROVIDER_LATENCY"] = args.provider_latency
+    if args.replay:
+        env.update({"PROVIDER_ARCHIVE_MODE": "replay", "PROVIDER_ARCHIVE": os.path.abspath(args.replay),
+                    "PROVIDER_REPLAY_LATENCY": str(args.replay_latency)})
+
+    server = None
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        server = AppServer(args.server, workers, threads, env)
+        print(f"starting {args.server} with {workers} workers x {threads} threads ...", file=sys.stderr)
+        base_url = server.start()
+
+    try:
+        if args.warmup > 0:
+            run_load(base_url, mix, urls, args.rate, args.warmup, args.arrival, args.max_inflight,
+                     args.timeout, seed=args.seed + 1)
+        sampler = ResourceSampler(server.worker_pids if server else (lambda: []), args.sample_interval)
+        sampler.start()
+        print(f"  {args.rate} req/s for {args.duration}s ...", file=sys.stderr)
+        records, elapsed = run_load(base_url, mix, urls, args.rate, args.duration, args.arrival,
+                                    args.max_inflight, args.timeout, seed=args.seed)
+        sampler.stop()
+    finally:
+        if server:
+            server.stop()
+
+    result = {
+        "config": {
+            "server": "external" if args.target else args.server,
+            "target": base_url if args.target else None,
+            "workers": None if args.target else workers,
+            "threads": None if args.target else threads,
+            "rate": args.rate,
+            "duration": args.duration,
+            "arrival": args.arrival,
+            "mix": dict(mix),
+            "urls": len(urls),
+            "providers": f"replay:{args.replay}" if args.replay else "stubs",
+            "provider_latency": args.provider_latency or None
+        },
+        **report(records, elapsed, args.duration),
+        "resources": sampler.summary()
+    }
+    totals = result["totals"]
+    latency = result["latency"] or {}
+    print(f"  {result['throughput_rps']} req/s ok, p50 {latency.get('p50_ms')} ms, p95 {latency.get('p95_ms')} ms, "
+          f"p99 {latency.get('p99_ms')} ms, errors {totals['error_rate']}, dropped {totals['dropped']}",
+          file=sys.stderr)
+    return result
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(',') if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Open-loop load test of the analysis endpoints")
+    parser.add_argument("-o", "--output", help="Write the JSON result here (default: stdout)")
+    parser.add_argument("--server", choices=["gunicorn", "flask"], default="gunicorn",
+                        help="How to run the app (default gunicorn)")
+    parser.add_argument("--target", help="Load an already running app at this base URL instead")
+    parser.add_argument("--workers", type=_int_list, default=[2], help="gunicorn worker counts, e.g. 1,2,4")
+    parser.add_argument("--threads", type=_int_list, default=[4], help="Threads per worker, e.g. 1,8")
+    parser.add_argument("--rate", type=float, default=5.0, help="Mean requests per second (default 5)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of measured load (default 30)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of unmeasured load first (default 5)")
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--urls", help="File with one URL per line (default: the benchmark fixture URLs)")
+    parser.add_argument("--provider-latency", help="Stub delay per provider call, e.g. dns=0.02,whois=0.3")
+    parser.add_argument("--replay", help="Serve providers from this recorded archive instead of the stubs")
+    parser.add_argument("--replay-latency", type=float, default=1.0,
+                        help="Multiplier for recorded latency with --replay (default 1)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Concurrent requests before dropping")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Seconds between CPU/RSS samples")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_weights(args.mix, ENDPOINTS)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.server == "gunicorn" and not args.target and shutil.which("gunicorn") is None:
+        parser.error("gunicorn is not installed; use --server flask or --target")
+    if not psutil_available:
+        print("psutil is not installed; CPU/RSS samples are skipped", file=sys.stderr)
+
+    if args.urls:
+        with open(args.urls, 'r') as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    elif args.replay:
+        from provider_archive import ProviderArchive
+        urls = ProviderArchive(args.replay).keys("page")
+    else:
+        with open(os.path.join(BENCH_DIR, 'fixtures', 'providers.json'), 'r') as f:
+            urls = json.load(f)["urls"]
+    if not urls:
+        parser.error("No URLs to request")
+
+    configurations = [(None, None)] if args.target else [(w, t) for w in args.workers for t in args.threads]
+    runs = [run_configuration(args, mix, urls, workers, threads) for workers, threads in configurations]
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "git_commit": _git_commit(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "runs": runs
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,462 @@
+"""
+Offline benchmark suite for the analysis pipeline.
+
+Runs the hot functions of app.py against recorded HTML pages and stubbed DNS,
+geo, WHOIS, CT and TLS providers, so numbers are repeatable and free of
+network noise. Measures each stage on its own, single-URL latency
+percentiles of analyze_url, batch throughput and peak memory, and writes the
+results as JSON.
+
+    python benchmarks/run_benchmarks.py -o bench.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --tolerance 0.15
+
+With --replay the providers answer from an archive recorded by the app
+(PROVIDER_ARCHIVE_MODE=record) instead of the bundled fixtures; the URLs are
+the pages captured in it and --replay-latency reproduces recorded delays.
+
+With --baseline the run is compared against a stored result and the exit
+status is 1 when any tracked metric regressed by more than the tolerance.
+Baselines are machine-specific; record one on the machine that compares.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tracemalloc
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.dirname(BENCH_DIR)
+
+# Tracked metrics: (path into the result, True if higher is better)
+TRACKED_METRICS = [
+    ("functions.*.mean_ms", False),
+    ("functions.*.p95_ms", False),
+    ("single_url.p50_ms", False),
+    ("single_url.p95_ms", False),
+    ("single_url.p99_ms", False),
+    ("batch.urls_per_sec", True),
+    ("attributions.p95_ms", False),
+    ("backends.*.single_p95_ms", False),
+    ("backends.*.batch_rows_per_sec", True),
+    ("memory.tracemalloc_peak_mb", False),
+]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(durations):
+    """
+    Summarize per-call durations.
+
+    Args:
+        durations: Call durations in seconds
+
+    Returns:
+        dict: calls, mean/min/max and p50/p95/p99 in milliseconds, ops_per_sec
+    """
+    values = sorted(durations)
+    total = sum(values)
+    return {
+        "calls": len(values),
+        "mean_ms": round(total / len(values) * 1000, 4),
+        "min_ms": round(values[0] * 1000, 4),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 4),
+        "max_ms": round(values[-1] * 1000, 4),
+        "ops_per_sec": round(len(values) / total, 2) if total else None
+    }
+
+
+def time_calls(func, argument_sets, iterations, warmup):
+    """
+    Time func over a cycle of argument tuples.
+
+    Args:
+        func: Function to call
+        argument_sets: List of argument tuples, used round-robin
+        iterations: Timed calls
+        warmup: Untimed calls made first (caches, lazy imports, model graph)
+
+    Returns:
+        list: Durations in seconds
+    """
+    for i in range(warmup):
+        func(*argument_sets[i % len(argument_sets)])
+    durations = []
+    for i in range(iterations):
+        args = argument_sets[i % len(argument_sets)]
+        start = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def fixtures_from_archive(archive):
+    """
+    Build the benchmark inputs from a recorded provider archive.
+
+    Returns:
+        dict: urls (every page the app tried to fetch) and pages (URL -> HTML
+            of the successful fetches)
+    """
+    pages = {}
+    for url in archive.keys("page", outcome="ok"):
+        outcome, html, _ = archive.next_interaction("page", url)
+        pages[url] = html
+    return {"urls": archive.keys("page"), "pages": pages}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=FRONTEND_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _max_rss_mb():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 2)
+
+
+def _metadata(app):
+    import numpy as np
+    try:
+        import tensorflow as tf
+        tf_version = tf.__version__
+    except ImportError:
+        tf_version = None
+    from model_service import get_model_version
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "tensorflow": tf_version,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "model_version": get_model_version(),
+        "model_loaded": app.get_model_instance() is not None
+    }
+
+
+def run_attribution_benchmark(app, urls, iterations, warmup):
+    """
+    Time uncached model attributions for one batch of all fixture URLs.
+
+    Returns:
+        dict: Timing summary with the method, steps and whether p95 stays
+            within the attribution latency budget; None without a model
+    """
+    from model_service import get_model_version
+    from model_attributions import ModelAttributor
+
+    if app.get_model_instance() is None:
+        return None
+    # cache_size=0: every call recomputes, as for vectors never seen before
+    attributor = ModelAttributor(app.get_model_instance(), get_model_version(),
+                                 scaler=app.get_scaler_instance(), cache_size=0)
+    _, vectors = app.extract_features_batch(urls)
+    result = summarize(time_calls(attributor.attribute, [(vectors,)], iterations, warmup))
+    result.update({
+        "rows": len(urls),
+        "method": attributor.method,
+        "steps": attributor.steps,
+        "budget_ms": attributor.budget_ms,
+        "within_budget": result["p95_ms"] <= attributor.budget_ms
+    })
+    return result
+
+
+def run_backend_benchmark(app, urls, iterations):
+    """
+    Compare the available inference backends on the fixture feature vectors.
+
+    Backends that cannot be loaded (no export, no runtime) are skipped.
+
+    Returns:
+        dict: backend -> single-row p50/p95 and batch rows per second; None without a model
+    """
+    import numpy as np
+    from model_service import get_model_version
+    from model_backends import BACKENDS, load_backends, benchmark
+
+    if app.get_model_instance() is None:
+        return None
+    _, vectors = app.extract_features_batch(urls)
+    # A batch of some thousand rows, as a bulk scoring job would send
+    inputs = app.get_scaler_instance().transform_rows(np.tile(vectors, (max(1, 4096 // len(vectors)), 1)))
+    backends = load_backends(BACKENDS, get_model_version(), app.get_model_instance())
+    return benchmark(backends, inputs, iterations)
+
+
+def run_benchmarks(app, fixtures, iterations=50, warmup=3, batch_repeat=5, threads=4, providers="fixtures"):
+    """
+    Run the whole suite.
+
+    Args:
+        app: The app module with stub providers installed
+        fixtures: Provider fixtures (URLs and recorded pages)
+        iterations: Timed calls per function
+        warmup: Untimed calls per function
+        batch_repeat: How often the URL list is repeated for the batch run
+        threads: Worker threads of the batch run
+        providers: Where provider answers come from, recorded in the result
+
+    Returns:
+        dict: Benchmark result
+    """
+    urls = fixtures["urls"]
+    pages = [(url, html) for url, html in fixtures["pages"].items()]
+    features = {url: app.extract_features(url)[0] for url in urls}
+
+    targets = {
+        "extract_features": (app.extract_features, [(url,) for url in urls]),
+        "check_suspicious_patterns": (app.check_suspicious_patterns, [(url,) for url in urls]),
+        "check_html_security": (app.check_html_security, pages),
+        "extract_content_features": (app.extract_content_features, pages),
+        "predict_with_model": (app.predict_with_model, [(url, features[url]) for url in urls]),
+        "explain_prediction": (app.explain_prediction, [(features[url], 50.0) for url in urls]),
+        "analyze_url": (app.analyze_url, [(url,) for url in urls]),
+    }
+
+    functions = {}
+    for name, (func, argument_sets) in targets.items():
+        print(f"  {name} ...", file=sys.stderr)
+        functions[name] = summarize(time_calls(func, argument_sets, iterations, warmup))
+
+    print("  model attributions ...", file=sys.stderr)
+    attributions = run_attribution_benchmark(app, urls, iterations, warmup)
+
+    print("  inference backends ...", file=sys.stderr)
+    backends = run_backend_benchmark(app, urls, iterations)
+
+    # Single-URL latency: every fixture URL analyzed one at a time
+    per_url = {}
+    all_durations = []
+    for url in urls:
+        durations = time_calls(app.analyze_url, [(url,)], max(5, iterations // len(urls)), 1)
+        per_url[url] = summarize(durations)
+        all_durations.extend(durations)
+    single_url = summarize(all_durations)
+    single_url["per_url"] = per_url
+
+    # Batch throughput: the URL list repeated, analyzed by a thread pool
+    batch = urls * batch_repeat
+    print(f"  batch of {len(batch)} URLs on {threads} threads ...", file=sys.stderr)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(app.analyze_url, batch))
+    elapsed = time.perf_counter() - start
+    batch_result = {
+        "urls": len(batch),
+        "threads": threads,
+        "seconds": round(elapsed, 4),
+        "urls_per_sec": round(len(batch) / elapsed, 2),
+        "errors": sum(1 for result in results if result.get("status") != "success")
+    }
+
+    # Peak memory of one pass over the URLs (tracemalloc slows calls down, so separately)
+    tracemalloc.start()
+    for url in urls:
+        app.analyze_url(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    memory = {
+        "tracemalloc_peak_mb": round(peak / (1024 * 1024), 3),
+        "max_rss_mb": _max_rss_mb()
+    }
+
+    return {
+        "meta": _metadata(app),
+        "config": {
+            "providers": providers,
+            "iterations": iterations,
+            "warmup": warmup,
+            "urls": len(urls),
+            "pages": len(pages),
+            "batch_repeat": batch_repeat,
+            "threads": threads
+        },
+        "functions": functions,
+        "single_url": single_url,
+        "batch": batch_result,
+        "attributions": attributions,
+        "backends": backends,
+        "memory": memory
+    }
+
+
+def _lookup(result, path):
+    """Resolve a dotted path; a * segment expands over dictionary keys"""
+    found = {"": result}
+    for segment in path.split("."):
+        expanded = {}
+        for prefix, value in found.items():
+            if not isinstance(value, dict):
+                continue
+            keys = value.keys() if segment == "*" else [segment]
+            for key in keys:
+                if key in value:
+                    expanded[f"{prefix}.{key}" if prefix else key] = value[key]
+        found = expanded
+    return {key: value for key, value in found.items() if isinstance(value, (int, float))}
+
+
+def compare(current, baseline, tolerance):
+    """
+    Compare tracked metrics against a baseline run.
+
+    Args:
+        current: Result of this run
+        baseline: Stored result
+        tolerance: Allowed relative slowdown, e.g. 0.2 for 20%
+
+    Returns:
+        dict: Per-metric ratios and the list of regressions
+    """
+    metrics = {}
+    regressions = []
+    for path, higher_is_better in TRACKED_METRICS:
+        before = _lookup(baseline, path)
+        for key, now in _lookup(current, path).items():
+            previous = before.get(key)
+            if not previous:
+                continue
+            # ratio > 1 always means "worse than the baseline"
+            ratio = previous / now if higher_is_better else now / previous
+            entry = {"baseline": previous, "current": now, "ratio": round(ratio, 4) if now else None}
+            if now == 0 and higher_is_better:
+                entry["ratio"] = None
+                regressions.append(key)
+            elif ratio > 1 + tolerance:
+                regressions.append(key)
+            metrics[key] = entry
+    return {
+        "baseline_commit": baseline.get("meta", {}).get("git_commit"),
+        "tolerance": tolerance,
+        "metrics": metrics,
+        "regressions": regressions
+    }
+
+
+def _print_summary(result):
+    print(f"{'function':<28}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}", file=sys.stderr)
+    for name, stats in result["functions"].items():
+        print(f"{name:<28}{stats['mean_ms']:>10.3f}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+              f"{stats['p99_ms']:>10.3f}{stats['ops_per_sec'] or 0:>10.1f}", file=sys.stderr)
+    single = result["single_url"]
+    print(f"analyze_url latency: p50 {single['p50_ms']:.2f} ms, p95 {single['p95_ms']:.2f} ms, "
+          f"p99 {single['p99_ms']:.2f} ms", file=sys.stderr)
+    batch = result["batch"]
+    print(f"batch: {batch['urls_per_sec']:.1f} URLs/s ({batch['urls']} URLs, {batch['threads']} threads, "
+          f"{batch['errors']} errors)", file=sys.stderr)
+    attributions = result.get("attributions")
+    if attributions:
+        print(f"attributions: {attributions['rows']} rows p95 {attributions['p95_ms']:.2f} ms "
+              f"({attributions['method']}, {attributions['steps']} steps, budget {attributions['budget_ms']:.0f} ms"
+              f"{'' if attributions['within_budget'] else ', OVER BUDGET'})", file=sys.stderr)
+    for name, stats in (result.get("backends") or {}).items():
+        print(f"backend {name}: single row p50 {stats['single_p50_ms']:.3f} ms, p95 {stats['single_p95_ms']:.3f} ms, "
+              f"batch {stats['batch_rows_per_sec'] or 0:.0f} rows/s", file=sys.stderr)
+    memory = result["memory"]
+    print(f"memory: tracemalloc peak {memory['tracemalloc_peak_mb']:.2f} MB, max RSS {memory['max_rss_mb']:.1f} MB",
+          file=sys.stderr)
+    comparison = result.get("comparison")
+    if comparison:
+        for key in comparison["regressions"]:
+            entry = comparison["metrics"].get(key, {})
+            print(f"REGRESSION {key}: {entry.get('baseline')} -> {entry.get('current')}", file=sys.stderr)
+        if not comparison["regressions"]:
+            print(f"no regressions against baseline {comparison['baseline_commit']} "
+                  f"(tolerance {comparison['tolerance']:.0%})", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the analysis pipeline")
+    parser.add_argument("-o", "--output", help="Write the JSON result here (default: stdout)")
+    parser.add_argument("--fixtures", help="Provider fixture file (default: benchmarks/fixtures/providers.json)")
+    parser.add_argument("--replay", help="Answer providers from this recorded archive instead of the fixtures")
+    parser.add_argument("--replay-latency", type=float, default=0.0,
+                        help="Multiplier for recorded provider latency during --replay (default 0)")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed calls per function")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed calls per function")
+    parser.add_argument("--batch-repeat", type=int, default=5, help="Repetitions of the URL list in the batch run")
+    parser.add_argument("--threads", type=int, default=4, help="Threads of the batch run")
+    parser.add_argument("--quick", action="store_true", help="Few iterations, for a smoke run")
+    parser.add_argument("--baseline", help="Compare against this stored result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default 0.2)")
+    parser.add_argument("--save-baseline", help="Also write the result to this baseline file")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.iterations, args.warmup, args.batch_repeat = 10, 1, 1
+
+    # Import the app the way bulk_score does: no job workers; the expected provider
+    # failures of the fixtures would otherwise flood stderr
+    os.environ['JOB_WORKERS'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+    # A persistent feature store would make results depend on earlier runs
+    os.environ.setdefault('FEATURE_STORE', 'off')
+    # Stubbed TLS probes are timed on every call, as for hosts seen for the first time
+    os.environ.setdefault('TLS_CACHE', 'off')
+    sys.path.insert(0, FRONTEND_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    import app
+    from stubs import load_fixtures, install_stub_providers
+    from provider_archive import ProviderArchive, install_replay
+
+    if args.replay:
+        archive = ProviderArchive(args.replay)
+        fixtures = fixtures_from_archive(archive)
+        if not fixtures["urls"]:
+            parser.error(f"{args.replay} has no recorded page fetches")
+        restore = install_replay(app, archive, latency_scale=args.replay_latency, miss="error")
+    else:
+        fixtures = load_fixtures(args.fixtures) if args.fixtures else load_fixtures()
+        restore = install_stub_providers(app, fixtures)
+    try:
+        result = run_benchmarks(app, fixtures, iterations=args.iterations, warmup=args.warmup,
+                                batch_repeat=args.batch_repeat, threads=args.threads,
+                                providers=f"replay:{args.replay}" if args.replay else "fixtures")
+    finally:
+        restore()
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            result["comparison"] = compare(result, json.load(f), args.tolerance)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        baseline = {key: value for key, value in result.items() if key != "comparison"}
+        with open(args.save_baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+
+    _print_summary(result)
+    return 1 if result.get("comparison", {}).get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+WSGI entry point serving the app with stubbed providers, for load tests.
+
+    gunicorn --chdir benchmarks -w 4 --threads 8 -b 127.0.0.1:5055 stubbed_app:app
+    PORT=5055 python benchmarks/stubbed_app.py
+
+STUB_PROVIDER_LATENCY adds a fixed delay per provider call to mimic real
+network time, e.g. "dns=0.02,geo=0.08,whois=0.3,ct=0.4,page=0.25,tls=0.1".
+With PROVIDER_ARCHIVE_MODE=replay the app answers from a recorded archive
+itself and no stubs are installed.
+"""
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+# Background job workers would compete with the load for CPU
+os.environ.setdefault('JOB_WORKERS', '0')
+# Every run starts cold unless a store is named explicitly
+os.environ.setdefault('FEATURE_STORE', 'off')
+
+import app as app_module
+from stubs import install_stub_providers
+
+
+def parse_latency(text):
+    """Parse "provider=seconds,..." into a dict"""
+    latency = {}
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        provider, _, seconds = item.partition('=')
+        latency[provider.strip()] = float(seconds)
+    return latency
+
+
+if os.environ.get('PROVIDER_ARCHIVE_MODE', '').lower() != 'replay':
+    install_stub_providers(app_module, latency=parse_latency(os.environ.get('STUB_PROVIDER_LATENCY')))
+
+app = app_module.app
+
+if __name__ == "__main__":
+    app.run(host="127.0.0.1", port=int(os.environ.get("PORT", 5055)), threaded=True)
@@ -0,0 +1,182 @@
+"""
+Offline stand-ins for the external providers the analysis talks to.
+
+install_stub_providers() swaps the app's network seams (_request_dns,
+_request_geo, _request_whois, _request_ct, _request_page and
+_probe_ssl_certificate) for functions answering from a fixture file, so the
+whole pipeline runs without network access and with repeatable results.
+"""
+import os
+import json
+import time
+import socket
+from datetime import datetime, timedelta
+
+import requests
+
+from provider_archive import install_providers
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+DEFAULT_FIXTURES = os.path.join(FIXTURES_DIR, 'providers.json')
+
+
+class StubResponse:
+    """The parts of requests.Response the app reads"""
+    def __init__(self, status_code, payload=None, text=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = text if text is not None else json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+
+class StubWhois:
+    """The parts of a python-whois result the app reads"""
+    def __init__(self, creation_date=None, expiration_date=None, registrar=None):
+        self.creation_date = creation_date
+        self.expiration_date = expiration_date
+        self.registrar = registrar
+
+
+def load_fixtures(path=DEFAULT_FIXTURES):
+    """
+    Load a provider fixture file.
+
+    Page entries name HTML files relative to fixtures/pages and are read
+    into memory here, so stubbed page fetches never touch the disk.
+
+    Returns:
+        dict: Fixture data with page HTML inlined
+    """
+    with open(path, 'r') as f:
+        fixtures = json.load(f)
+    pages_dir = os.path.join(os.path.dirname(os.path.abspath(path)), 'pages')
+    pages = {}
+    for url, filename in fixtures.get("pages", {}).items():
+        with open(os.path.join(pages_dir, filename), 'r', encoding='utf-8') as f:
+            pages[url] = f.read()
+    fixtures["pages"] = pages
+    return fixtures
+
+
+def _cert_date(value):
+    return value.strftime('%b %d %H:%M:%S %Y GMT')
+
+
+def build_stub_providers(fixtures, not_found_error=None, latency=None):
+    """
+    Build fake provider functions answering from fixtures.
+
+    Args:
+        fixtures: Data from load_fixtures
+        not_found_error: Exception type raised for domains without WHOIS data
+            (the app's not-found type); None returns an empty record instead
+        latency: Optional provider name -> seconds slept per call, to mimic
+            slow providers in load tests
+
+    Returns:
+        dict: Provider name to replacement function
+    """
+    latency = latency or {}
+
+    def delay(provider):
+        seconds = latency.get(provider)
+        if seconds:
+            time.sleep(seconds)
+
+    def request_dns(domain):
+        delay("dns")
+        ip_address = fixtures["dns"].get(domain)
+        if ip_address is None:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return ip_address
+
+    def request_geo(ip_address):
+        delay("geo")
+        payload = fixtures["geo"].get(ip_address, {"status": "fail", "message": "invalid query", "query": ip_address})
+        return StubResponse(200, payload)
+
+    def request_whois(domain):
+        delay("whois")
+        entry = fixtures["whois"].get(domain)
+        if entry is None:
+            if not_found_error is not None:
+                raise not_found_error(f"No match for \"{domain.upper()}\".")
+            return StubWhois()
+        now = datetime.now()
+        return StubWhois(
+            creation_date=now - timedelta(days=entry["created_days_ago"]),
+            expiration_date=now + timedelta(days=entry["expires_in_days"]),
+            registrar=entry.get("registrar")
+        )
+
+    def request_ct(domain):
+        delay("ct")
+        now = datetime.now()
+        certs = [{
+            "common_name": cert["common_name"],
+            "not_before": (now - timedelta(days=cert["not_before_days_ago"])).strftime("%Y-%m-%dT%H:%M:%S")
+        } for cert in fixtures["ct"].get(domain, [])]
+        return StubResponse(200, certs)
+
+    def request_page(url):
+        delay("page")
+        html = fixtures["pages"].get(url)
+        if html is None:
+            raise requests.ConnectionError(f"Failed to establish a new connection: {url}")
+        return html
+
+    def probe_ssl_certificate(domain):
+        delay("tls")
+        entry = fixtures["tls"].get(domain)
+        if entry is None:
+            return {
+                "has_ssl": False,
+                "issuer": "Unknown",
+                "valid_from": "Unknown",
+                "valid_until": "Unknown",
+                "days_until_expiry": 0,
+                "error": "[Errno 111] Connection refused"
+            }
+        now = datetime.now()
+        valid_until = now + timedelta(days=entry["expires_in_days"])
+        return {
+            "has_ssl": True,
+            "issuer": entry["issuer"],
+            "valid_from": _cert_date(valid_until - timedelta(days=entry["valid_days"])),
+            "valid_until": _cert_date(valid_until),
+            "days_until_expiry": entry["expires_in_days"]
+        }
+
+    return {
+        "dns": request_dns,
+        "geo": request_geo,
+        "whois": request_whois,
+        "ct": request_ct,
+        "page": request_page,
+        "tls": probe_ssl_certificate,
+    }
+
+
+def install_stub_providers(app_module, fixtures=None, latency=None):
+    """
+    Answer all provider calls of the app from fixtures.
+
+    Args:
+        app_module: The imported app module
+        fixtures: Data from load_fixtures (default: the bundled fixtures)
+        latency: Optional provider name -> seconds slept per call
+
+    Returns:
+        callable: Restores the original providers
+    """
+    if fixtures is None:
+        fixtures = load_fixtures()
+    not_found_errors = getattr(app_module, 'whois_not_found_errors', ())
+    providers = build_stub_providers(fixtures, not_found_errors[0] if not_found_errors else None, latency)
+    return install_providers(app_module, providers)
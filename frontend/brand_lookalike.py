@@ -0,0 +1,477 @@
+"""
+Brand lookalike and homoglyph detection for host names.
+
+Host names are decoded from punycode and reduced to a skeleton: Unicode
+compatibility forms and accents are folded, confusable Cyrillic/Greek letters
+and visual pairs ("rn" for "m") are mapped to the Latin letters they imitate,
+and digit substitutions ("paypa1") are undone. The skeletons of the
+registrable label, its hyphen-separated tokens and the subdomain labels are
+looked up in an index of protected brand labels: exact matches through a
+dictionary, near matches through a padded-bigram index with a bounded
+(optimal string alignment) edit distance. Postings are split by label
+length and candidates must share nearly all of the query's bigrams before
+any distance is computed, so a lookup stays well under a millisecond with
+thousands of protected brands.
+
+Protected brands come from DEFAULT_BRANDS plus the optional BRAND_LIST file,
+one brand per line: "Display Name: domain.com other-domain.com" (or just the
+domains). Domains a brand owns whose names are not worth protecting (CDNs,
+API hosts) are never reported; BRAND_OWNED_DOMAINS lists the defaults and a
+"+" marks them in the file ("Google: +google-analytics.com").
+
+    python brand_lookalike.py paypa1-secure.xyz xn--pypal-4ve.com
+"""
+import os
+import sys
+import logging
+import argparse
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from itertools import chain
+from typing import NamedTuple
+
+from feature_store import host_of, registrable_domain
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Extra protected brands, one "Name: domain domain ..." per line
+BRAND_LIST = os.environ.get('BRAND_LIST')
+# Hosts whose lookups are kept
+LOOKALIKE_CACHE_SIZE = int(os.environ.get('LOOKALIKE_CACHE_SIZE', 4096))
+
+# Brand -> official domains. Labels that are common words ("live", "office",
+# "visa", "zoom", "booking") are left out: they match too many unrelated sites.
+DEFAULT_BRANDS = {
+    "Google": ("google.com", "gmail.com", "youtube.com"),
+    "Facebook": ("facebook.com", "instagram.com", "whatsapp.com"),
+    "Twitter": ("twitter.com",),
+    "Microsoft": ("microsoft.com", "outlook.com", "microsoftonline.com", "linkedin.com"),
+    "Apple": ("apple.com", "icloud.com"),
+    "Amazon": ("amazon.com",),
+    "PayPal": ("paypal.com",),
+    "GitHub": ("github.com",),
+    "Dropbox": ("dropbox.com",),
+    "Netflix": ("netflix.com",),
+    "Spotify": ("spotify.com",),
+    "Wikipedia": ("wikipedia.org",),
+    "Adobe": ("adobe.com",),
+    "Cloudflare": ("cloudflare.com",),
+    "WordPress": ("wordpress.com",),
+    "Yahoo": ("yahoo.com",),
+    "Twitch": ("twitch.tv",),
+    "Reddit": ("reddit.com",),
+    "Pinterest": ("pinterest.com",),
+    "eBay": ("ebay.com",),
+    "Slack": ("slack.com",),
+    "Shopify": ("shopify.com",),
+    "Telegram": ("telegram.org",),
+    "Binance": ("binance.com",),
+    "Coinbase": ("coinbase.com",),
+    "Blockchain.com": ("blockchain.com",),
+    "MetaMask": ("metamask.io",),
+    "Chase": ("chase.com",),
+    "Wells Fargo": ("wellsfargo.com",),
+    "Bank of America": ("bankofamerica.com",),
+    "Citibank": ("citibank.com",),
+    "HSBC": ("hsbc.com",),
+    "Barclays": ("barclays.co.uk",),
+    "Santander": ("santander.com",),
+    "American Express": ("americanexpress.com",),
+    "Mastercard": ("mastercard.com",),
+    "DHL": ("dhl.com",),
+    "FedEx": ("fedex.com",),
+    "UPS": ("ups.com",),
+    "USPS": ("usps.com",),
+    "Steam": ("steampowered.com", "steamcommunity.com"),
+    "Roblox": ("roblox.com",),
+    "DocuSign": ("docusign.com",),
+    "Walmart": ("walmart.com",),
+    "Alibaba": ("alibaba.com", "aliexpress.com"),
+    "Airbnb": ("airbnb.com",),
+}
+
+# Brand -> further domains the brand owns. Hosts under them are the brand's own,
+# but their labels are not protected: "google-analytics" would read as a Google
+# combosquat and "apples" as a typo of Apple.
+BRAND_OWNED_DOMAINS = {
+    "Google": ("google-analytics.com", "googleapis.com", "gstatic.com", "googleusercontent.com",
+               "googletagmanager.com", "googlesyndication.com", "googleadservices.com", "googlevideo.com"),
+    "Facebook": ("fbcdn.net", "fb.com", "messenger.com"),
+    "Twitter": ("twimg.com", "x.com"),
+    "Microsoft": ("microsoftonline-p.com", "live.com", "office.com", "azureedge.net", "windows.net"),
+    "Apple": ("apples.com", "apple-cloudkit.com", "apple-dns.net", "cdn-apple.com", "mzstatic.com"),
+    "Amazon": ("amazonaws.com", "media-amazon.com", "ssl-images-amazon.com", "amazon-adsystem.com"),
+    "PayPal": ("paypalobjects.com", "paypal-community.com"),
+    "GitHub": ("githubusercontent.com", "githubassets.com", "github.io"),
+    "Dropbox": ("dropboxusercontent.com",),
+    "Netflix": ("nflxext.com", "nflxvideo.net"),
+    "Spotify": ("spotifycdn.com", "scdn.co"),
+    "Adobe": ("adobelogin.com", "typekit.net"),
+    "Cloudflare": ("cloudflare-dns.com", "cloudflareinsights.com"),
+    "WordPress": ("wp.com",),
+    "Yahoo": ("yimg.com",),
+    "Reddit": ("redditmedia.com", "redditstatic.com", "redd.it"),
+    "eBay": ("ebaystatic.com", "ebayimg.com"),
+    "Slack": ("slack-edge.com", "slack-imgs.com", "slack-redir.net", "slack-files.com"),
+    "Shopify": ("shopifycdn.com", "myshopify.com"),
+    "Steam": ("steamstatic.com",),
+    "DocuSign": ("docusign.net",),
+}
+
+# How a host imitates a brand; the index is the lookalike_technique feature value
+TECHNIQUES = ("none", "homoglyph", "digit_substitution", "typo", "combosquat", "subdomain")
+
+# Latin letters imitated by Cyrillic, Greek and other scripts (after NFKD folding)
+CONFUSABLES = str.maketrans({
+    # Cyrillic
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p', 'с': 'c',
+    'т': 't', 'у': 'y', 'х': 'x', 'ѕ': 's', 'і': 'i', 'ї': 'i', 'ј': 'j', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w',
+    'һ': 'h', 'ӏ': 'l', 'ɡ': 'g', 'ь': 'b', 'ү': 'y', 'ҝ': 'k', 'ո': 'n', 'ս': 'u', 'օ': 'o',
+    # Greek
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't',
+    'υ': 'u', 'χ': 'x', 'ϲ': 'c', 'ω': 'w', 'γ': 'y',
+    # Latin lookalikes
+    'ı': 'i', 'ȷ': 'j', 'ł': 'l', 'ø': 'o', 'đ': 'd', 'ħ': 'h', 'ŀ': 'l', 'ƅ': 'b', 'ɑ': 'a', 'ɩ': 'i',
+    'ʀ': 'r', 'ʏ': 'y', 'ᴄ': 'c', 'ᴅ': 'd', 'ᴇ': 'e', 'ᴋ': 'k', 'ᴍ': 'm', 'ᴏ': 'o', 'ᴘ': 'p', 'ᴛ': 't',
+    'ᴜ': 'u', 'ᴠ': 'v', 'ᴡ': 'w', 'ᴢ': 'z',
+})
+# Letter pairs that read as one letter
+VISUAL_PAIRS = (("rn", "m"), ("vv", "w"), ("cl", "d"))
+# Digits standing in for letters; "1" is tried as both "l" and "i"
+DIGIT_SUBSTITUTIONS = (str.maketrans("0134578", "oleastb"), str.maketrans("0134578", "oieastb"))
+
+
+class Brand(NamedTuple):
+    name: str
+    label: str
+    domains: tuple
+
+
+class Lookalike(NamedTuple):
+    """A host imitating a protected brand"""
+    brand: str
+    brand_domain: str
+    matched: str
+    distance: int
+    technique: str
+
+    @property
+    def severity(self):
+        """"medium" for combosquats, which legitimate sites also produce ("slack-tips"), "high" otherwise"""
+        return "medium" if self.technique == "combosquat" else "high"
+
+    def as_dict(self):
+        return {**self._asdict(), "severity": self.severity}
+
+
+def max_distance(length):
+    """Edit distance tolerated for a brand label of this length (short labels must match exactly)"""
+    if length < 5:
+        return 0
+    return 1 if length < 9 else 2
+
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions
+    and adjacent transpositions), cut off above limit.
+
+    Returns:
+        int: The distance, or limit + 1 when it exceeds limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    outside = limit + 1
+    for i in range(1, len(a) + 1):
+        # Only cells within limit of the diagonal can stay within limit
+        current = [i] + [outside] * len(b)
+        row_min = i
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+def _bigrams(text):
+    padded = f"^{text}$"
+    return [padded[i:i + 2] for i in range(len(padded) - 1)]
+
+
+def decode_host(host):
+    """Host with punycode (xn--) labels decoded; undecodable labels are kept"""
+    labels = []
+    for label in host.split('.'):
+        if label.startswith('xn--'):
+            try:
+                label = label[4:].encode('ascii').decode('punycode')
+            except (UnicodeError, ValueError):
+                pass
+        labels.append(label)
+    return '.'.join(labels)
+
+
+def skeleton(text):
+    """
+    Fold a label to the Latin letters it looks like.
+
+    Returns:
+        str: Lowercase skeleton; NFKC/NFKD folding strips compatibility forms and accents
+    """
+    folded = unicodedata.normalize('NFKD', unicodedata.normalize('NFKC', text).lower())
+    folded = ''.join(char for char in folded if not unicodedata.combining(char))
+    return folded.translate(CONFUSABLES)
+
+
+def variants(fragment):
+    """
+    Readings of a host fragment, with the technique that produced each.
+
+    Returns:
+        list: (text, technique) pairs, the plain lowercase reading first
+    """
+    plain = fragment.lower()
+    readings = [(plain, "none")]
+    folded = plain if plain.isascii() else skeleton(plain)
+    if folded != plain:
+        readings.append((folded, "homoglyph"))
+    for visual, letter in VISUAL_PAIRS:
+        if visual in folded:
+            readings.append((folded.replace(visual, letter), "homoglyph"))
+    if any(char.isdigit() for char in folded):
+        for table in DIGIT_SUBSTITUTIONS:
+            substituted = folded.translate(table)
+            if substituted != folded:
+                readings.append((substituted, "digit_substitution"))
+    seen = set()
+    return [(text, technique) for text, technique in readings if not (text in seen or seen.add(text))]
+
+
+class BrandIndex:
+    """
+    Protected brand labels with exact and bounded-distance lookup.
+
+    Args:
+        brands: Brand name -> official domains
+        owned: Brand name -> further domains the brand owns, exempt but not protected
+    """
+    def __init__(self, brands, owned=None):
+        self.brands = {}
+        self.official = set()
+        for domains in (owned or {}).values():
+            self.official.update(domain.strip().lower() for domain in domains if domain.strip())
+        for name, domains in brands.items():
+            for domain in domains:
+                domain = domain.strip().lower()
+                if not domain:
+                    continue
+                self.official.add(domain)
+                label = domain.split('.')[0]
+                self.brands.setdefault(label, Brand(name, label, (domain,)))
+        self.labels = list(self.brands)
+        self._gram_counts = [len(set(_bigrams(label))) for label in self.labels]
+        # label length -> bigram -> positions of the labels of that length containing it
+        postings = {}
+        for position, label in enumerate(self.labels):
+            if max_distance(len(label)):
+                by_gram = postings.setdefault(len(label), {})
+                for gram in set(_bigrams(label)):
+                    by_gram.setdefault(gram, []).append(position)
+        self._postings = postings
+
+    @classmethod
+    def from_file(cls, path, base=DEFAULT_BRANDS, base_owned=BRAND_OWNED_DOMAINS):
+        """
+        Build an index from DEFAULT_BRANDS plus a brand list file.
+
+        Args:
+            path: File with one "Name: domain domain ..." (or "domain ...") per line; # starts a
+                comment and a "+" prefix marks an owned, unprotected domain
+        """
+        brands = {name: tuple(domains) for name, domains in base.items()}
+        owned = {name: tuple(domains) for name, domains in base_owned.items()}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                name, _, domains = line.rpartition(':')
+                protected = [domain for domain in domains.split() if not domain.startswith('+')]
+                extra = [domain[1:] for domain in domains.split() if domain.startswith('+')]
+                if protected or extra:
+                    name = name.strip() or (protected or extra)[0].split('.')[0]
+                    brands[name] = brands.get(name, ()) + tuple(protected)
+                    owned[name] = owned.get(name, ()) + tuple(extra)
+        return cls(brands, owned)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def nearest(self, text):
+        """
+        Closest brand label within its tolerated edit distance.
+
+        Returns:
+            tuple: (Brand, distance), or None
+        """
+        brand = self.brands.get(text)
+        if brand is not None:
+            return brand, 0
+        if len(text) < 4:
+            return None
+        grams = set(_bigrams(text))
+        best = None
+        for length in range(len(text) - 2, len(text) + 3):
+            limit = max_distance(length)
+            by_gram = self._postings.get(length)
+            if not limit or not by_gram or abs(length - len(text)) > limit:
+                continue
+            # One edit changes at most 3 padded bigrams (a transposition), so two strings
+            # within distance k share all but 3k of the distinct bigrams of either
+            needed = len(grams) - 3 * limit
+            counts = Counter(chain.from_iterable(by_gram.get(gram, ()) for gram in grams))
+            for position, shared in counts.items():
+                if shared < needed or shared < self._gram_counts[position] - 3 * limit:
+                    continue
+                label = self.labels[position]
+                distance = edit_distance(text, label, limit)
+                if distance <= limit and (best is None or distance < best[1]):
+                    best = (self.brands[label], distance)
+        return best
+
+    def _match_fragment(self, fragment, fuzzy):
+        best = None
+        for text, technique in variants(fragment):
+            found = self.nearest(text) if fuzzy else ((self.brands[text], 0) if text in self.brands else None)
+            if found is None:
+                continue
+            brand, distance = found
+            if distance and technique == "none":
+                technique = "typo"
+            if best is None or distance < best[1]:
+                best = (brand, distance, technique)
+                if not distance:
+                    break
+        return best
+
+    def match(self, netloc):
+        """
+        Find the brand a host imitates.
+
+        Args:
+            netloc: Host name or URL netloc (punycode or Unicode)
+
+        Returns:
+            Lookalike: The best match, or None for unrelated and official hosts
+        """
+        return self._match_host(host_of(netloc))
+
+    @lru_cache(maxsize=LOOKALIKE_CACHE_SIZE)
+    def _match_host(self, host):
+        if not host:
+            return None
+        decoded = decode_host(host)
+        site = registrable_domain(decoded)
+        if site in self.official or registrable_domain(host) in self.official:
+            return None
+        label = site.split('.')[0]
+        subdomain = decoded[:-len(site)].rstrip('.') if decoded.endswith(site) and decoded != site else ''
+        tokens = [token for token in label.split('-') if token]
+
+        best = None
+        # The registrable label: a brand name on another TLD is taken as the brand's own site,
+        # any other reading of the whole label is a lookalike
+        found = self._match_fragment(label, fuzzy=True)
+        if found and not (found[1] == 0 and found[2] == "none"):
+            best = Lookalike(found[0].name, found[0].domains[0], label, found[1], found[2])
+        # Hyphenated tokens of the label: brand plus extra words
+        if len(tokens) > 1 and (best is None or best.distance):
+            for token in tokens:
+                found = self._match_fragment(token, fuzzy=True)
+                if found and (best is None or found[1] < best.distance):
+                    technique = "combosquat" if found[2] == "none" else found[2]
+                    best = Lookalike(found[0].name, found[0].domains[0], token, found[1], technique)
+                    if not best.distance:
+                        break
+        # Brand names in subdomains of an unrelated site (exact readings only)
+        if best is None or best.distance:
+            for part in chain.from_iterable(piece.split('-') for piece in subdomain.split('.')):
+                if len(part) < 4:
+                    continue
+                found = self._match_fragment(part, fuzzy=False)
+                if found:
+                    technique = "subdomain" if found[2] == "none" else found[2]
+                    best = Lookalike(found[0].name, found[0].domains[0], part, 0, technique)
+                    break
+        return best
+
+    def features(self, netloc):
+        """
+        Lookalike features of a host.
+
+        Returns:
+            dict: brand_match (1, 0.5 for medium-severity matches, 0 for none), distance,
+                technique (index into TECHNIQUES) and punycode (0/1)
+        """
+        found = self.match(netloc)
+        return {
+            "brand_match": (1 if found.severity == "high" else 0.5) if found else 0,
+            "distance": found.distance if found else 0,
+            "technique": TECHNIQUES.index(found.technique) if found else 0,
+            "punycode": 1 if 'xn--' in netloc.lower() else 0
+        }
+
+
+_index = None
+
+
+def get_brand_index():
+    """The index of DEFAULT_BRANDS and BRAND_LIST, built on first use"""
+    global _index
+    if _index is None:
+        index = None
+        if BRAND_LIST:
+            try:
+                index = BrandIndex.from_file(BRAND_LIST)
+            except OSError as e:
+                logger.error("Could not read brand list %s: %s", BRAND_LIST, e)
+        _index = index or BrandIndex(DEFAULT_BRANDS, BRAND_OWNED_DOMAINS)
+        logger.info("Brand lookalike index: %s brand labels", len(_index))
+    return _index
+
+
+def find_lookalike(netloc):
+    """The brand a host imitates (see BrandIndex.match), or None"""
+    return get_brand_index().match(netloc)
+
+
+def lookalike_features(netloc):
+    """Lookalike features of a host (see BrandIndex.features)"""
+    return get_brand_index().features(netloc)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check host names against the protected brands")
+    parser.add_argument("hosts", nargs="+")
+    args = parser.parse_args(argv)
+    for host in args.hosts:
+        found = find_lookalike(host)
+        print(f"{host}: " + (f"{found.brand} ({found.brand_domain}) via {found.technique}, "
+                             f"distance {found.distance}, matched {found.matched!r}" if found else "no brand match"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Offline bulk scoring of URL lists.
+
+Streams URLs from a file or stdin, scores them across a process pool with the
+same logic as the web app and writes JSONL or CSV results as it goes. Each
+worker scores a chunk of URLs at a time, reading their stored enrichment
+features with one feature store query per group and writing new ones in one
+transaction.
+
+    python bulk_score.py urls.txt -o results.jsonl --level lexical --workers 8
+    zcat proxy.log.gz | cut -f7 | python bulk_score.py - -o results.csv --format csv
+
+Progress is checkpointed next to the output file; rerunning with --resume
+continues after the last completed line.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from contextlib import nullcontext
+from itertools import islice
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ["line", "url", "status", "score", "risk_level", "scoring_tier", "error"]
+
+# Set in each pool worker by _init_worker
+_scorer = None
+_batch_context = None
+
+
+def _json_default(value):
+    # numpy scalars and datetimes that end up in result dictionaries
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _init_worker(level):
+    """Import the app once per worker process and pick the scoring function"""
+    global _scorer, _batch_context
+    # Workers only score; they must not start the app's background job workers
+    os.environ['JOB_WORKERS'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+    # Per-URL INFO logging from the app would dominate bulk runs
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if level == "lexical":
+        def score(url):
+            prescore = app.lexical_prescore(url)
+            return {
+                "status": "success",
+                "url": url,
+                "score": prescore["score"],
+                "confidence": prescore["confidence"],
+                "risk_level": app.get_risk_level(prescore["score"]),
+                "scoring_tier": "lexical",
+                "decision_rule": prescore["rule"],
+                "suspicious_patterns": [p["pattern"] for p in prescore["suspicious_patterns"]]
+            }
+    elif level == "tiered":
+        def score(url):
+            return app.tiered_analysis(url, app.analyze_url)
+    else:
+        def score(url):
+            result = app.analyze_url(url)
+            result.setdefault("scoring_tier", "full")
+            return result
+    _scorer = score
+    # The lexical level never reads enrichment features
+    _batch_context = app.feature_store_batch if level != "lexical" else None
+
+
+def _score_line(item):
+    line_number, url = item
+    try:
+        result = _scorer(url)
+    except Exception as e:
+        result = {"status": "error", "url": url, "error": str(e)}
+    result["line"] = line_number
+    return result
+
+
+def _score_chunk(chunk):
+    """Score (line_number, url) pairs inside one feature store batch"""
+    items = [(line_number, url if url.startswith(('http://', 'https://')) else 'http://' + url)
+             for line_number, url in chunk]
+    with _batch_context([url for _, url in items]) if _batch_context else nullcontext():
+        return [_score_line(item) for item in items]
+
+
+def read_urls(stream, skip=0):
+    """
+    Yield (line_number, url) pairs for lines after the already-processed ones.
+
+    Blank and comment lines yield a None url: they are not scored but still
+    advance the checkpoint, so line numbers stay stable across resumes.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if line_number <= skip:
+            continue
+        url = line.strip()
+        if url and not url.startswith('#'):
+            yield line_number, url
+        else:
+            yield line_number, None
+
+
+class ResultWriter:
+    """Append results to the output as JSONL or CSV"""
+    def __init__(self, stream, fmt, write_header):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, result):
+        if self.fmt == "csv":
+            row = dict(result)
+            if isinstance(row.get("score"), float):
+                row["score"] = round(row["score"], 2)
+            self._csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(result, default=_json_default) + "\n")
+
+    def flush(self):
+        self.stream.flush()
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(path, lines_done, output_offset, stats):
+    # Write-then-rename so an interrupted save never corrupts the checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"lines_done": lines_done, "output_offset": output_offset, **stats}, f)
+    os.replace(tmp_path, path)
+
+
+def run(args):
+    """
+    Score every URL in the input and write results incrementally.
+
+    Returns:
+        dict: Run statistics
+    """
+    checkpoint_path = args.checkpoint or (args.output + ".ckpt" if args.output else None)
+    checkpoint = load_checkpoint(checkpoint_path) if (args.resume and checkpoint_path) else None
+    lines_done = checkpoint["lines_done"] if checkpoint else 0
+    stats = {"scored": checkpoint.get("scored", 0) if checkpoint else 0,
+             "errors": checkpoint.get("errors", 0) if checkpoint else 0}
+
+    if args.output:
+        output = open(args.output, 'a+' if checkpoint else 'w', newline='')
+        if checkpoint:
+            # Drop anything written after the last checkpoint; it will be redone
+            output.seek(checkpoint["output_offset"])
+            output.truncate()
+        write_header = output.tell() == 0
+    else:
+        output = sys.stdout
+        write_header = True
+    writer = ResultWriter(output, args.format, write_header)
+
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8', errors='replace')
+    if lines_done:
+        logger.info("Resuming after line %s", lines_done)
+
+    # Bounded windows keep memory flat: Pool.imap would otherwise read the whole input
+    window_size = args.workers * args.chunksize * 4
+    items = read_urls(source, skip=lines_done)
+    start = time.monotonic()
+    last_report = start
+    scored_this_run = 0
+
+    with multiprocessing.get_context("spawn").Pool(args.workers, initializer=_init_worker,
+                                                   initargs=(args.level,)) as pool:
+        while True:
+            window = list(islice(items, window_size))
+            if not window:
+                break
+            urls = [item for item in window if item[1] is not None]
+            chunks = [urls[i:i + args.chunksize] for i in range(0, len(urls), args.chunksize)]
+            for results in pool.imap(_score_chunk, chunks):
+                for result in results:
+                    writer.write(result)
+                    stats["scored"] += 1
+                    scored_this_run += 1
+                    if result.get("status") == "error":
+                        stats["errors"] += 1
+            writer.flush()
+            lines_done = window[-1][0]
+
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, lines_done, output.tell(), stats)
+
+            now = time.monotonic()
+            if now - last_report >= args.report_interval:
+                rate = scored_this_run / (now - start)
+                logger.info("%s URLs scored (%s errors), line %s, %.1f URLs/s", stats['scored'], stats['errors'], lines_done, rate)
+                last_report = now
+
+    if source is not sys.stdin:
+        source.close()
+    if output is not sys.stdout:
+        output.close()
+
+    elapsed = time.monotonic() - start
+    stats.update({
+        "lines_done": lines_done,
+        "scored_this_run": scored_this_run,
+        "elapsed_seconds": round(elapsed, 2),
+        "urls_per_second": round(scored_this_run / elapsed, 2) if elapsed > 0 else 0.0
+    })
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score large URL lists offline with the fraud detection pipeline")
+    parser.add_argument("input", help="File with one URL per line, or - for stdin")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="Output format")
+    parser.add_argument("--level", choices=["lexical", "tiered", "full"], default="full",
+                        help="Enrichment level: lexical-only, tiered fast path, or the full analyze_url pipeline")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Worker processes")
+    parser.add_argument("--chunksize", type=int, default=16,
+                        help="URLs handed to a worker at a time; they share feature store reads and writes")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint of a previous run")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.ckpt)")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between throughput reports")
+    args = parser.parse_args(argv)
+
+    if args.resume and not args.output:
+        parser.error("--resume requires --output")
+
+    # Progress goes to stderr so stdout can carry results
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(message)s")
+    try:
+        stats = run(args)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; rerun with --resume to continue from the last checkpoint")
+        return 130
+    logger.info("Done: %s", json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+import os
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from metrics import outbound_calls, cache_lookups
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Defaults, overridable per deployment through the environment
+DEFAULT_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+DEFAULT_LATENCY_THRESHOLD = float(os.environ.get('BREAKER_LATENCY_THRESHOLD', 3.0))
+DEFAULT_RESET_TIMEOUT = float(os.environ.get('BREAKER_RESET_TIMEOUT', 30.0))
+NEGATIVE_CACHE_TTL = float(os.environ.get('NEGATIVE_CACHE_TTL', 120.0))
+NOT_FOUND_CACHE_TTL = float(os.environ.get('NXDOMAIN_CACHE_TTL', 900.0))
+NEGATIVE_CACHE_SIZE = int(os.environ.get('NEGATIVE_CACHE_SIZE', 10000))
+# Seconds a call waits for a free slot when a provider's concurrency is bounded
+CONCURRENCY_WAIT = float(os.environ.get('BREAKER_CONCURRENCY_WAIT', 10.0))
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when a provider call is rejected without touching the network"""
+
+    def __init__(self, provider, key, reason):
+        super().__init__(f"{provider} unavailable for {key}: {reason}")
+        self.provider = provider
+        self.key = key
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    Consecutive failures (errors, or calls slower than the latency threshold)
+    trip the breaker open. While open every call fails fast; after the reset
+    timeout a single trial call is let through in the half-open state, and its
+    outcome decides whether the breaker closes again or re-opens.
+
+    An optional max_concurrency bounds the number of in-flight calls to the
+    provider from this process.
+    """
+    def __init__(self, name, failure_threshold=None, latency_threshold=None, reset_timeout=None,
+                 max_concurrency=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or DEFAULT_FAILURE_THRESHOLD
+        self.latency_threshold = latency_threshold or DEFAULT_LATENCY_THRESHOLD
+        self.reset_timeout = reset_timeout or DEFAULT_RESET_TIMEOUT
+        self.max_concurrency = max_concurrency or None
+        self.slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "trips": 0}
+        self._last_error = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        # Caller holds the lock; promote OPEN to HALF_OPEN once the timeout elapsed
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self):
+        """
+        Decide whether a call may proceed.
+
+        Returns:
+            bool: True if the call may hit the provider
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self, elapsed):
+        """Record a completed call; calls over the latency threshold count as failures"""
+        if elapsed > self.latency_threshold:
+            with self._lock:
+                self._stats["slow_calls"] += 1
+            self.record_failure(f"slow call ({elapsed:.2f}s)")
+            return
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["successes"] += 1
+            self._consecutive_failures = 0
+            if self._state != CLOSED:
+                logger.info("Circuit breaker '%s' closed after successful trial call", self.name)
+            self._state = CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self, error=None):
+        """Record a failed call and trip the breaker if the threshold is reached"""
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["failures"] += 1
+            self._consecutive_failures += 1
+            self._last_error = str(error) if error is not None else None
+            state = self._current_state()
+            if state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if state != OPEN:
+                    self._stats["trips"] += 1
+                    logger.warning("Circuit breaker '%s' opened: %s", self.name, self._last_error)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give back a half-open trial slot whose call ended without a verdict"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def status(self):
+        """
+        Get the breaker status for status endpoints.
+
+        Returns:
+            dict: State, counters and time until the next trial call
+        """
+        with self._lock:
+            state = self._current_state()
+            retry_in = 0.0
+            if state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "latency_threshold": self.latency_threshold,
+                "reset_timeout": self.reset_timeout,
+                "max_concurrency": self.max_concurrency,
+                "retry_in_seconds": round(retry_in, 1),
+                "last_error": self._last_error,
+                **self._stats
+            }
+
+
+class NegativeCache:
+    """
+    Bounded TTL cache of recent provider failures and not-found answers.
+
+    Entries remember the exception that was raised so that a cached miss is
+    replayed to the caller exactly like the original failure.
+    """
+    def __init__(self, max_size=NEGATIVE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, provider, key):
+        """
+        Look up a cached failure.
+
+        Returns:
+            BaseException or None: The cached exception if still fresh
+        """
+        cache_key = (provider, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            expires_at, error = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return error
+
+    def put(self, provider, key, error, ttl):
+        """Cache a failure for ttl seconds"""
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[(provider, key)] = (time.monotonic() + ttl, error)
+            self._entries.move_to_end((provider, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            by_provider = {}
+            for provider, _ in self._entries:
+                by_provider[provider] = by_provider.get(provider, 0) + 1
+            return {"size": len(self._entries), "hits": self.hits, "by_provider": by_provider}
+
+
+# Global registry of breakers and the shared negative cache
+_breakers = {}
+_registry_lock = threading.Lock()
+negative_cache = NegativeCache()
+
+
+def configure_breaker(name, failure_threshold=None, latency_threshold=None, reset_timeout=None,
+                      max_concurrency=None):
+    """
+    Create (or replace) the breaker for a provider.
+
+    Per-provider environment variables such as BREAKER_WHOIS_LATENCY_THRESHOLD
+    or BREAKER_CT_MAX_CONCURRENCY take precedence over the arguments.
+
+    Returns:
+        CircuitBreaker: The configured breaker
+    """
+    prefix = f"BREAKER_{name.upper()}_"
+    failure_threshold = int(os.environ.get(prefix + 'FAILURE_THRESHOLD', failure_threshold or DEFAULT_FAILURE_THRESHOLD))
+    latency_threshold = float(os.environ.get(prefix + 'LATENCY_THRESHOLD', latency_threshold or DEFAULT_LATENCY_THRESHOLD))
+    reset_timeout = float(os.environ.get(prefix + 'RESET_TIMEOUT', reset_timeout or DEFAULT_RESET_TIMEOUT))
+    max_concurrency = int(os.environ.get(prefix + 'MAX_CONCURRENCY', max_concurrency or 0))
+    breaker = CircuitBreaker(name, failure_threshold, latency_threshold, reset_timeout, max_concurrency)
+    with _registry_lock:
+        _breakers[name] = breaker
+    return breaker
+
+
+def get_breaker(name):
+    """Get the breaker for a provider, creating one with defaults if needed"""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = configure_breaker(name)
+    return breaker
+
+
+def guarded_call(provider, key, func, *args, not_found_errors=(), **kwargs):
+    """
+    Call an external provider through its circuit breaker and the negative cache.
+
+    Args:
+        provider: Provider name (e.g. 'dns', 'geo', 'whois', 'ct')
+        key: Lookup key used for negative caching (domain, IP, ...)
+        func: Callable performing the network request
+        not_found_errors: Exception types meaning "the provider answered, the
+            key does not exist" (e.g. NXDOMAIN). They are negatively cached for
+            longer but do not count against the breaker.
+
+    Returns:
+        Whatever func returns
+
+    Raises:
+        ProviderUnavailableError: The breaker is open or no concurrency slot freed up
+        Exception: The original (or cached) provider error
+    """
+    cached_error = negative_cache.get(provider, key)
+    if cached_error is not None:
+        cache_lookups.inc("negative", "hit")
+        outbound_calls.inc(provider, "negative_cached")
+        raise fresh_error(cached_error)
+    cache_lookups.inc("negative", "miss")
+
+    breaker = get_breaker(provider)
+    if breaker.slots is None:
+        return _call_through_breaker(breaker, provider, key, func, args, kwargs, not_found_errors)
+
+    if not breaker.slots.acquire(timeout=CONCURRENCY_WAIT):
+        outbound_calls.inc(provider, "concurrency_limited")
+        raise ProviderUnavailableError(provider, key, "concurrency limit reached")
+    try:
+        return _call_through_breaker(breaker, provider, key, func, args, kwargs, not_found_errors)
+    finally:
+        breaker.slots.release()
+
+
+def fresh_error(error):
+    """
+    Copy of a shared exception for one caller to raise.
+
+    Raising the shared instance itself would grow its traceback on every raise,
+    mix the frames of concurrent callers and keep them all alive.
+
+    Returns:
+        BaseException: A copy without traceback (the original when it cannot be copied)
+    """
+    try:
+        return copy.copy(error).with_traceback(None)
+    except Exception:
+        # Types whose constructor does not take their args cannot be copied
+        return error.with_traceback(None)
+
+
+def _call_through_breaker(breaker, provider, key, func, args, kwargs, not_found_errors):
+    if not breaker.allow_request():
+        outbound_calls.inc(provider, "circuit_open")
+        raise ProviderUnavailableError(provider, key, "circuit open")
+
+    start = time.monotonic()
+    try:
+        result = func(*args, **kwargs)
+    except not_found_errors as e:
+        # The provider is healthy, the key simply does not exist
+        breaker.record_success(time.monotonic() - start)
+        negative_cache.put(provider, key, e, NOT_FOUND_CACHE_TTL)
+        outbound_calls.inc(provider, "not_found")
+        raise
+    except Exception as e:
+        breaker.record_failure(e)
+        negative_cache.put(provider, key, e, NEGATIVE_CACHE_TTL)
+        outbound_calls.inc(provider, "error")
+        raise
+    except BaseException:
+        breaker.release_trial()
+        raise
+
+    breaker.record_success(time.monotonic() - start)
+    outbound_calls.inc(provider, "success")
+    return result
+
+
+def get_breaker_status():
+    """
+    Get the state of every provider breaker and the negative cache.
+
+    Returns:
+        dict: Status information
+    """
+    with _registry_lock:
+        breakers = dict(_breakers)
+    return {
+        "breakers": {name: breaker.status() for name, breaker in breakers.items()},
+        "negative_cache": negative_cache.stats()
+    }
@@ -0,0 +1,332 @@
+"""
+Heuristic feature contributions for model predictions.
+
+The contribution rules, display names and report sections are compiled once
+per feature layout into arrays indexed by feature position. Contributions of
+one vector or a whole batch are then computed with array operations instead
+of evaluating a rule chain per feature. Normalization and rounding are done
+in the same order as the original per-feature code, so the output is
+identical to it.
+"""
+import logging
+import threading
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+KEY_RISK_FACTORS = "Key Risk Factors"
+DOMAIN_INFORMATION = "Domain Information"
+SUSPICIOUS_PATTERNS = "Suspicious Patterns"
+SECTIONS = (KEY_RISK_FACTORS, DOMAIN_INFORMATION, SUSPICIOUS_PATTERNS)
+
+# Share of the score shown for each section: URL features, domain information,
+# suspicious patterns + HTML content
+SECTION_WEIGHTS = {
+    KEY_RISK_FACTORS: 40.0,
+    DOMAIN_INFORMATION: 10.0,
+    SUSPICIOUS_PATTERNS: 50.0
+}
+
+# Missing HTTPS is always reported with this fixed percentage
+HTTPS_FEATURE = "https_present"
+HTTPS_CONTRIBUTION = 24.6
+
+# Contribution formulas; a and b are the rule parameters
+#   linear:   a * (value / b)
+#   scaled:   a * value / b
+#   capped:   a * min(value / b, 1.0)
+#   inverse:  a * (b - value) / b
+#   constant: a
+_KINDS = ("linear", "scaled", "capped", "inverse", "constant")
+
+# name: (comparison, threshold, formula, a, b, section)
+# A rule applies when "value <comparison> threshold"; otherwise the feature
+# contributes nothing and is reported under Key Risk Factors.
+CONTRIBUTION_RULES = {
+    # Core URL & domain features
+    "url_length": (">", 50, "linear", 0.1, 100, KEY_RISK_FACTORS),
+    "domain_length": (">", 15, "linear", 0.15, 30, KEY_RISK_FACTORS),
+    "domain_entropy": (">", 0, "capped", 0.1, 3.0, KEY_RISK_FACTORS),
+    "special_char_count": (">", 3, "linear", 0.1, 10, KEY_RISK_FACTORS),
+    "tld_score": (">", 0, "scaled", 0.15, 0.5, KEY_RISK_FACTORS),
+    HTTPS_FEATURE: ("<", 1, "constant", HTTPS_CONTRIBUTION, None, KEY_RISK_FACTORS),
+    # Domain reputation & WHOIS features
+    "rep_domain_age_category": ("<", 2, "inverse", 0.15, 2, DOMAIN_INFORMATION),
+    "rep_suspicious_tld_category": (">", 0, "scaled", 0.15, 1, DOMAIN_INFORMATION),
+    "rep_suspicious_country": (">", 0, "constant", 0.15, None, DOMAIN_INFORMATION),
+    "whois_recently_registered": (">", 0, "constant", 0.2, None, DOMAIN_INFORMATION),
+    # HTML content features
+    "content_form_count": (">", 0, "capped", 0.15, 2, SUSPICIOUS_PATTERNS),
+    "content_password_field_count": (">", 0, "capped", 0.3, 2.0, SUSPICIOUS_PATTERNS),
+    "content_external_resources_count": (">", 3, "capped", 0.12, 15, SUSPICIOUS_PATTERNS),
+    "content_js_to_html_ratio": (">", 0.3, "capped", 0.15, 0.5, SUSPICIOUS_PATTERNS),
+    "content_title_brand_mismatch": (">", 0, "constant", 0.2, None, SUSPICIOUS_PATTERNS),
+    "content_similar_domain_redirect": (">", 0, "constant", 0.35, None, SUSPICIOUS_PATTERNS),
+    "lookalike_brand_match": (">", 0, "scaled", 0.35, 1, SUSPICIOUS_PATTERNS),
+    "content_favicon_exists": ("<", 1, "constant", 0.08, None, KEY_RISK_FACTORS),
+    # HTML security metrics
+    "html_security_score": (">", 0, "capped", 0.2, 50, SUSPICIOUS_PATTERNS),
+    "html_risk_factor_count": (">", 0, "capped", 0.15, 3, SUSPICIOUS_PATTERNS),
+    "html_has_password_field": (">", 0, "constant", 0.25, None, SUSPICIOUS_PATTERNS),
+    "html_has_obfuscated_js": (">", 0, "constant", 0.3, None, SUSPICIOUS_PATTERNS),
+    # Certificate and geographic features
+    "ct_suspicious_cert_pattern": (">", 0, "constant", 0.15, None, DOMAIN_INFORMATION),
+    "geo_suspicious_country": (">", 0, "constant", 0.15, None, DOMAIN_INFORMATION),
+}
+
+# User-friendly feature names; others are derived from the feature name
+FEATURE_DISPLAY_NAMES = {
+    "url_length": "URL Length",
+    "domain_length": "Domain Length",
+    "path_length": "Path Length",
+    "query_length": "Query Parameters Length",
+    "fragment_length": "Fragment Length",
+    "subdomain_count": "Number of Subdomains",
+    "path_depth": "Path Depth",
+    "tld_score": "Risky TLD Score",
+    "domain_entropy": "Domain Entropy",
+    "https_present": "Security Weights",
+    "special_char_count": "Special Characters",
+    "digit_percentage": "Digit Percentage",
+    "letter_percentage": "Letter Percentage",
+    "numeric_path": "Numeric Path Present",
+    "ip_url": "IP as Domain",
+    "keyword_count": "Suspicious Keywords",
+    "content_page_size_bytes": "Page Size",
+    "content_external_resources_count": "External Resource Count",
+    "content_form_count": "Form Count",
+    "content_password_field_count": "Password Fields",
+    "content_js_to_html_ratio": "JavaScript to HTML Ratio",
+    "content_title_brand_mismatch": "Title-Domain Mismatch",
+    "content_favicon_exists": "Favicon Present",
+    "content_similar_domain_redirect": "Similar Domain Redirect",
+    "lookalike_brand_match": "Brand Lookalike Domain",
+    "html_security_score": "HTML Security Score",
+    "html_risk_factor_count": "Security Risk Factor Count",
+    "html_has_password_field": "Contains Password Field",
+    "html_has_obfuscated_js": "Contains Obfuscated JavaScript",
+    "ct_suspicious_cert_pattern": "Suspicious Certificate Pattern",
+    "geo_suspicious_country": "Suspicious Country"
+}
+
+# Shown in the feature table even when their impact is small
+ALWAYS_SHOWN_FEATURES = frozenset([
+    "tld_score", "content_password_field_count", "content_form_count", "html_security_score",
+    "domain_entropy", "content_favicon_exists", "rep_domain_age_category"
+])
+# Features with a smaller impact (in percent) are left out of the feature table
+TABLE_MIN_IMPACT = 3
+
+
+class CompiledLayout:
+    """
+    Rules of one feature order as arrays over the features that have a rule.
+
+    Attributes:
+        names: Feature names in layout order ("error" excluded)
+        rule_positions: Positions (into names) of the features with a rule
+        display_names: Display name per position
+    """
+    def __init__(self, names, rules, names_map):
+        self.names = tuple(names)
+        self.index = {name: position for position, name in enumerate(self.names)}
+        self.display_names = [names_map.get(name, name.replace("_", " ").title()) for name in self.names]
+        ruled = [(position, rules[name]) for position, name in enumerate(self.names) if name in rules]
+        self.rule_positions = np.array([position for position, _ in ruled], dtype=np.intp)
+        self.rule_names = [self.names[position] for position in self.rule_positions]
+        self.greater = np.array([rule[0] == ">" for _, rule in ruled], dtype=bool)
+        self.threshold = np.array([rule[1] for _, rule in ruled], dtype=np.float64)
+        self.kind = np.array([_KINDS.index(rule[2]) for _, rule in ruled], dtype=np.int8)
+        self.a = np.array([rule[3] for _, rule in ruled], dtype=np.float64)
+        # b is unused by constant rules; 1.0 keeps the unused branches finite
+        self.b = np.array([1.0 if rule[4] is None else rule[4] for _, rule in ruled], dtype=np.float64)
+        self.section = np.array([SECTIONS.index(rule[5]) for _, rule in ruled], dtype=np.int8)
+        self.https_position = self.index.get(HTTPS_FEATURE)
+
+
+class FeatureExplainer:
+    """
+    Turns feature values and a model score into feature contributions,
+    section totals and the feature table shown in the report.
+
+    Args:
+        rules: Feature name -> contribution rule (see CONTRIBUTION_RULES)
+        display_names: Feature name -> display name
+    """
+    def __init__(self, rules=CONTRIBUTION_RULES, display_names=FEATURE_DISPLAY_NAMES):
+        self.rules = rules
+        self.display_names = display_names
+        self._layouts = {}
+        self._lock = threading.Lock()
+
+    def compile(self, names):
+        """
+        Get the compiled rules for a feature order (cached per order).
+
+        Returns:
+            CompiledLayout: The compiled layout
+        """
+        key = tuple(names)
+        layout = self._layouts.get(key)
+        if layout is None:
+            with self._lock:
+                layout = self._layouts.get(key)
+                if layout is None:
+                    layout = self._layouts[key] = CompiledLayout(key, self.rules, self.display_names)
+        return layout
+
+    def contributions(self, layout, values):
+        """
+        Raw contributions and sections for a batch.
+
+        Args:
+            layout: CompiledLayout
+            values: (batch, len(layout.rule_positions)) values of the rule features
+
+        Returns:
+            tuple: (contributions, sections) arrays of shape (batch, rules);
+                sections index SECTIONS
+        """
+        values = np.asarray(values, dtype=np.float64)
+        active = np.where(layout.greater, values > layout.threshold, values < layout.threshold)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            candidates = [
+                layout.a * (values / layout.b),
+                layout.a * values / layout.b,
+                layout.a * np.minimum(values / layout.b, 1.0),
+                layout.a * (layout.b - values) / layout.b,
+                np.broadcast_to(layout.a, values.shape),
+            ]
+        raw = np.choose(np.broadcast_to(layout.kind, values.shape), candidates)
+        contributions = np.where(active, raw, 0.0)
+        sections = np.where(active, layout.section, SECTIONS.index(KEY_RISK_FACTORS))
+        return contributions, sections
+
+    def explain(self, features, score):
+        """
+        Explain one prediction.
+
+        Args:
+            features: Feature name -> value, as returned by extract_features
+            score: Final risk score (0-100)
+
+        Returns:
+            dict: feature_contributions, feature_table and, when there are
+                contributions, section_totals
+        """
+        return self.explain_batch([features], [score])[0]
+
+    def explain_batch(self, feature_dicts, scores):
+        """
+        Explain many predictions; rows with the same feature order share one
+        array pass.
+
+        Args:
+            feature_dicts: List of feature dicts
+            scores: Final risk score of each row
+
+        Returns:
+            list: One explanation per row (see explain)
+        """
+        groups = {}
+        for row, features in enumerate(feature_dicts):
+            if not isinstance(features, dict):
+                raise TypeError(f"Expected a feature dict, got {type(features).__name__}")
+            names = tuple(name for name in features if name != "error")
+            groups.setdefault(names, []).append(row)
+
+        explanations = [None] * len(feature_dicts)
+        for names, rows in groups.items():
+            layout = self.compile(names)
+            values = [[feature_dicts[row][name] for name in layout.rule_names] for row in rows]
+            contributions, sections = self.contributions(layout, np.array(values, dtype=np.float64).reshape(
+                len(rows), len(layout.rule_names)))
+            for offset, row in enumerate(rows):
+                explanations[row] = self._explain_row(layout, feature_dicts[row], scores[row],
+                                                      contributions[offset], sections[offset])
+        return explanations
+
+    def _explain_row(self, layout, features, score, rule_contributions, rule_sections):
+        count = len(layout.names)
+        contribution = np.zeros(count, dtype=np.float64)
+        contribution[layout.rule_positions] = rule_contributions
+        section = np.zeros(count, dtype=np.int8)
+        section[layout.rule_positions] = rule_sections
+        contribution_list = contribution.tolist()
+
+        # Stable sort by descending contribution, like list.sort(key=-percentage)
+        order = np.argsort(-contribution, kind='stable').tolist()
+        percentages = [contribution_list[position] for position in order]
+
+        explanation = {"feature_contributions": [], "feature_table": []}
+        if count:
+            https_rank = next((rank for rank, position in enumerate(order) if position == layout.https_position), None)
+            # Python's sum in sorted order, so totals match the per-feature code bit for bit
+            total_contribution = sum(p for rank, p in enumerate(percentages) if rank != https_rank)
+            https_contribution = percentages[https_rank] if https_rank is not None else 0
+            remaining_score = max(0, score - https_contribution)
+            if total_contribution > 0 and remaining_score > 0:
+                factor = remaining_score / total_contribution
+                percentages = [p if rank == https_rank else round(p * factor, 1) for rank, p in enumerate(percentages)]
+            total_feature_impact = sum(percentages)
+            if total_feature_impact > 0:
+                factor = score / total_feature_impact
+                percentages = [round(p * factor, 1) for p in percentages]
+            explanation["section_totals"] = {
+                name: round((SECTION_WEIGHTS[name] / 100) * score, 1) for name in SECTIONS
+            }
+
+        impact = [0.0] * count
+        colors = ["success"] * count
+        contributions = explanation["feature_contributions"]
+        for rank, position in enumerate(order):
+            name = layout.names[position]
+            value = contribution_list[position]
+            color_class = "danger" if value > 60 else "warning" if value > 20 else "success"
+            impact[position] = percentages[rank]
+            colors[position] = color_class
+            contributions.append({
+                "name": name,
+                "value": features[name],
+                "contribution": value,
+                "direction": "increases" if value > 0 else "decreases",
+                "percentage": percentages[rank],
+                "feature_name": layout.display_names[position],
+                "color_class": color_class,
+                "section": SECTIONS[section[position]]
+            })
+
+        table = explanation["feature_table"]
+        for position, name in enumerate(layout.names):
+            value = features[name]
+            if position == layout.https_position and value < 1:
+                table.append({
+                    'feature': "Security Weights",
+                    'value': "No",
+                    'impact': HTTPS_CONTRIBUTION,
+                    'color_class': "danger"
+                })
+            elif impact[position] > TABLE_MIN_IMPACT or name in ALWAYS_SHOWN_FEATURES:
+                formatted_value = value
+                if isinstance(value, bool) or (isinstance(value, (int, float)) and value in [0, 1]):
+                    formatted_value = "No" if value == 0 or value is False else "Yes"
+                elif isinstance(value, float) and value < 1:
+                    formatted_value = round(value, 2)
+                table.append({
+                    'feature': layout.display_names[position],
+                    'value': formatted_value,
+                    'impact': impact[position],
+                    'color_class': colors[position]
+                })
+        table.sort(key=lambda row: -row['impact'])
+        return explanation
+
+
+# Shared instance used by the app
+default_explainer = FeatureExplainer()
+
+
+def explain_prediction(features, score):
+    """Explain one prediction with the shared explainer (see FeatureExplainer.explain)"""
+    return default_explainer.explain(features, score)
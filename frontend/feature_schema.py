@@ -0,0 +1,222 @@
+"""
+Declared layout of the model input vector.
+
+Every feature the model reads has a fixed position, a value type and a
+default. Extractors write their values straight into a preallocated float32
+row (or a row of a batch matrix) by name; positions never depend on which
+keys an extractor happened to return. The schema version is a hash of the
+declaration, so stored vectors can be matched to the layout they were built
+with.
+"""
+import hashlib
+import logging
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class FeatureSchemaError(ValueError):
+    """Raised when the schema is inconsistent or does not fit the model"""
+    pass
+
+
+class FeatureSpec(NamedTuple):
+    name: str
+    dtype: type = int
+    default: float = 0
+
+
+class FeatureSchema:
+    """
+    Fixed name -> index mapping of a model input vector.
+
+    Args:
+        specs: FeatureSpec entries in model input order
+        width: Length of the model input; positions after the last feature
+            are padding and stay zero
+        observed: FeatureSpec entries that are extracted and reported but
+            not (yet) model inputs; they have no position and write() skips them
+    """
+    def __init__(self, specs, width, observed=()):
+        self.specs = tuple(FeatureSpec(*spec) for spec in specs)
+        self.names = tuple(spec.name for spec in self.specs)
+        self.observed = tuple(FeatureSpec(*spec) for spec in observed)
+        self.width = int(width)
+        declared = self.names + tuple(spec.name for spec in self.observed)
+        if len(set(declared)) != len(declared):
+            duplicates = sorted({name for name in declared if declared.count(name) > 1})
+            raise FeatureSchemaError(f"Duplicate features: {', '.join(duplicates)}")
+        if len(self.names) > self.width:
+            raise FeatureSchemaError(f"{len(self.names)} features do not fit a model input of {self.width}")
+        self.index = {name: position for position, name in enumerate(self.names)}
+        self._template = np.zeros(self.width, dtype=np.float32)
+        self._template[:len(self.specs)] = [spec.default for spec in self.specs]
+        declaration = ";".join(f"{spec.name}:{spec.dtype.__name__}:{spec.default}" for spec in self.specs)
+        self.version = hashlib.sha256(f"{declaration}|{self.width}".encode('utf-8')).hexdigest()[:12]
+        # Observed features count as already reported, so write() skips them silently
+        self._unknown = {spec.name for spec in self.observed}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.specs)
+
+    def new_row(self):
+        """A float32 row holding the defaults"""
+        return self._template.copy()
+
+    def new_batch(self, rows):
+        """A (rows, width) float32 matrix holding the defaults"""
+        return np.tile(self._template, (rows, 1))
+
+    def reset(self, row):
+        """Overwrite a row with the defaults in place"""
+        row[:] = self._template
+        return row
+
+    def write(self, row, values, prefix=""):
+        """
+        Write a group of feature values into a row.
+
+        Args:
+            row: float32 row of width self.width (a view into a batch works)
+            values: Feature name -> value, as returned by an extractor
+            prefix: Prefix of the group's names in the schema, e.g. "whois_"
+        """
+        index = self.index
+        for key, value in values.items():
+            position = index.get(prefix + key)
+            if position is None:
+                self._warn_unknown(prefix + key)
+                continue
+            row[position] = value
+
+    def _warn_unknown(self, name):
+        with self._lock:
+            if name in self._unknown:
+                return
+            self._unknown.add(name)
+        logger.warning("Feature %r is not in schema %s and is not passed to the model", name, self.version)
+
+    def row_from_dict(self, features, out=None):
+        """
+        Build a model input row from a full feature dictionary.
+
+        Args:
+            features: Feature dictionary as returned by extract_features
+            out: Optional preallocated row to fill
+
+        Returns:
+            numpy.ndarray: The filled float32 row
+        """
+        row = self.reset(out) if out is not None else self.new_row()
+        self.write(row, features)
+        return row
+
+    def to_dict(self, row):
+        """
+        Read the declared features back from a row.
+
+        Returns:
+            dict: Feature name -> value converted to the declared type
+        """
+        return {spec.name: spec.dtype(row[position]) for position, spec in enumerate(self.specs)}
+
+    def validate(self, input_width):
+        """
+        Check the schema against the loaded model.
+
+        Args:
+            input_width: Input size of the model
+
+        Raises:
+            FeatureSchemaError: When the widths differ
+        """
+        if input_width is not None and int(input_width) != self.width:
+            raise FeatureSchemaError(f"Schema {self.version} builds vectors of {self.width} values "
+                                     f"but the model expects {input_width}")
+
+    def describe(self):
+        return {"version": self.version, "features": len(self.specs), "width": self.width,
+                "observed": [spec.name for spec in self.observed]}
+
+
+# Model input order of the deployed model: the basic URL features, then the
+# enrichment groups by prefix. Append new features at the end; reordering
+# changes what the trained model sees at each position.
+FEATURE_SPECS = (
+    # Lexical URL features
+    FeatureSpec("url_length"),
+    FeatureSpec("domain_length"),
+    FeatureSpec("path_length"),
+    FeatureSpec("query_length"),
+    FeatureSpec("fragment_length"),
+    FeatureSpec("subdomain_count"),
+    FeatureSpec("path_depth"),
+    FeatureSpec("tld_score", float),
+    FeatureSpec("domain_entropy", float),
+    FeatureSpec("https_present"),
+    FeatureSpec("special_char_count"),
+    FeatureSpec("digit_percentage", float),
+    FeatureSpec("letter_percentage", float),
+    FeatureSpec("numeric_path"),
+    FeatureSpec("ip_url"),
+    FeatureSpec("keyword_count"),
+    # Page content
+    FeatureSpec("content_external_resources_count"),
+    FeatureSpec("content_favicon_exists"),
+    FeatureSpec("content_form_count"),
+    FeatureSpec("content_js_to_html_ratio", float),
+    FeatureSpec("content_page_size_bytes"),
+    FeatureSpec("content_password_field_count"),
+    FeatureSpec("content_similar_domain_redirect"),
+    FeatureSpec("content_title_brand_mismatch"),
+    # Certificate transparency
+    FeatureSpec("ct_cert_count"),
+    FeatureSpec("ct_recent_cert_count"),
+    FeatureSpec("ct_suspicious_cert_pattern"),
+    # Hosting location
+    FeatureSpec("geo_suspicious_country"),
+    # HTML security scan
+    FeatureSpec("html_has_obfuscated_js"),
+    FeatureSpec("html_has_password_field"),
+    FeatureSpec("html_risk_factor_count"),
+    FeatureSpec("html_security_score"),
+    # Domain name language features
+    FeatureSpec("nlp_character_distribution", float),
+    FeatureSpec("nlp_contains_digits"),
+    FeatureSpec("nlp_contains_repeated_chars"),
+    FeatureSpec("nlp_ngram_score", float),
+    FeatureSpec("nlp_vowel_consonant_ratio", float),
+    FeatureSpec("nlp_word_length_avg", float),
+    # Reputation
+    FeatureSpec("rep_domain_age_category"),
+    FeatureSpec("rep_domain_blacklisted"),
+    FeatureSpec("rep_ip_blacklisted", float),
+    FeatureSpec("rep_suspicious_country"),
+    FeatureSpec("rep_suspicious_tld_category"),
+    # WHOIS
+    FeatureSpec("whois_domain_age_days"),
+    FeatureSpec("whois_expiration_remaining_days"),
+    FeatureSpec("whois_privacy_protected"),
+    FeatureSpec("whois_recently_registered"),
+    FeatureSpec("whois_suspicious_registrar"),
+)
+
+# Extracted and reported, but the deployed model was trained with zeros in the
+# padding positions they would take. Move them to the end of FEATURE_SPECS
+# when the model is retrained with them.
+OBSERVED_FEATURE_SPECS = (
+    # Brand lookalikes (brand_lookalike.py)
+    FeatureSpec("lookalike_brand_match"),
+    FeatureSpec("lookalike_distance"),
+    FeatureSpec("lookalike_technique"),
+    FeatureSpec("lookalike_punycode"),
+)
+
+MODEL_INPUT_SIZE = 96
+
+FEATURE_SCHEMA = FeatureSchema(FEATURE_SPECS, MODEL_INPUT_SIZE, OBSERVED_FEATURE_SPECS)
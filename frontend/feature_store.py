@@ -0,0 +1,419 @@
+"""
+Feature store for host- and domain-level enrichment.
+
+WHOIS, certificate transparency, reputation and geo/DNS results describe the
+registrable domain, host or IP address rather than the URL, so they are
+stored under those keys and reused by every request, gunicorn worker and
+offline tool on the node until the group's freshness runs out. The backend is
+a local SQLite file in WAL mode.
+
+The most used entries can be written to a snapshot file and loaded into an
+empty store, so a replaced node starts warm:
+
+    python feature_store.py info
+    python feature_store.py snapshot data/feature_store.snapshot.gz
+    python feature_store.py restore data/feature_store.snapshot.gz
+    python feature_store.py prune
+"""
+import os
+import sys
+import gzip
+import atexit
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import argparse
+import threading
+import ipaddress
+from collections import Counter
+
+from metrics import cache_lookups
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+try:
+    import tldextract
+    # Bundled public suffix snapshot only: resolving a domain must never fetch the list
+    _tld_extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+    tldextract_available = True
+except ImportError:
+    logger.warning("tldextract not available, registrable domains fall back to the last two labels")
+    tldextract_available = False
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# Path of the store; "off" disables it
+FEATURE_STORE = os.environ.get('FEATURE_STORE', os.path.join(current_dir, 'data', 'feature_store.db'))
+# Loaded at startup into an empty store and rewritten at exit, when set
+FEATURE_STORE_SNAPSHOT = os.environ.get('FEATURE_STORE_SNAPSHOT')
+FEATURE_STORE_SNAPSHOT_SIZE = int(os.environ.get('FEATURE_STORE_SNAPSHOT_SIZE', 50000))
+# Seconds between writes of the in-memory access counts
+FEATURE_STORE_ACCESS_FLUSH = float(os.environ.get('FEATURE_STORE_ACCESS_FLUSH', 30))
+# Seconds between deletions of expired entries by each process; 0 leaves pruning to the CLI
+FEATURE_STORE_PRUNE_INTERVAL = float(os.environ.get('FEATURE_STORE_PRUNE_INTERVAL', 3600))
+# Expired entries deleted per transaction, so pruning never holds the write lock for long
+FEATURE_STORE_PRUNE_BATCH = int(os.environ.get('FEATURE_STORE_PRUNE_BATCH', 5000))
+
+# Seconds each group stays fresh; FEATURE_STORE_FRESHNESS="whois=43200,ct=3600" overrides
+DEFAULT_FRESHNESS = {
+    "whois": 86400,
+    "ct": 6 * 3600,
+    "reputation": 6 * 3600,
+    "domain_info": 3600,
+}
+
+# Rows per IN (...) query of get_many
+_BULK_CHUNK = 500
+
+
+def parse_freshness(text, defaults=DEFAULT_FRESHNESS):
+    """Parse "group=seconds,..." on top of the defaults"""
+    freshness = dict(defaults)
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        group, _, seconds = item.partition('=')
+        freshness[group.strip()] = float(seconds)
+    return freshness
+
+
+def host_of(netloc):
+    """Lower-case hostname of a URL netloc, without port, credentials or trailing dot"""
+    host = netloc.rsplit('@', 1)[-1].lower()
+    if host.startswith('['):
+        return host[1:].split(']', 1)[0]
+    return host.split(':', 1)[0].rstrip('.')
+
+
+def registrable_domain(netloc):
+    """
+    Get the registrable domain (public suffix plus one label) of a host.
+
+    Args:
+        netloc: Hostname or URL netloc
+
+    Returns:
+        str: e.g. "example.co.uk" for "www.shop.example.co.uk:8080"; IP
+            addresses and hosts without a known suffix are returned as is
+    """
+    host = host_of(netloc)
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    if tldextract_available:
+        parts = _tld_extract(host)
+        if parts.domain and parts.suffix:
+            return f"{parts.domain}.{parts.suffix}"
+        return host
+    labels = host.split('.')
+    return '.'.join(labels[-2:]) if len(labels) > 2 else host
+
+
+class FeatureStore:
+    """
+    Persistent store of feature groups keyed by domain, host or IP.
+
+    Args:
+        path: SQLite file shared by all processes on the node
+        freshness: Group name -> seconds an entry is served after it was computed
+    """
+    def __init__(self, path=FEATURE_STORE, freshness=None, prune_interval=FEATURE_STORE_PRUNE_INTERVAL):
+        self.path = path
+        self.freshness = freshness or parse_freshness(os.environ.get('FEATURE_STORE_FRESHNESS'))
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        self.pruned = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending_access = Counter()
+        self._last_flush = time.time()
+        self._lookups = Counter()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS features ("
+            "grp TEXT NOT NULL, key TEXT NOT NULL, body BLOB NOT NULL, "
+            "computed_at REAL NOT NULL, expires_at REAL NOT NULL, "
+            "hits INTEGER NOT NULL DEFAULT 0, last_access REAL NOT NULL, "
+            "PRIMARY KEY (grp, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS features_expiry ON features (expires_at)")
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def ttl(self, group):
+        """Freshness of a group in seconds (groups without a setting are never stored)"""
+        return self.freshness.get(group, 0)
+
+    def get(self, group, key):
+        """
+        Look up one fresh entry.
+
+        Returns:
+            dict or None: Stored features, None when missing or stale
+        """
+        return self.get_many(group, [key]).get(key)
+
+    def get_many(self, group, keys):
+        """
+        Look up fresh entries of one group.
+
+        Args:
+            group: Feature group name
+            keys: Domain, host or IP keys
+
+        Returns:
+            dict: key -> features for the keys with a fresh entry
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        conn = self._connection()
+        for start in range(0, len(keys), _BULK_CHUNK):
+            chunk = keys[start:start + _BULK_CHUNK]
+            rows = conn.execute(
+                f"SELECT key, body FROM features WHERE grp = ? AND expires_at > ? "
+                f"AND key IN ({','.join('?' * len(chunk))})", [group, now, *chunk]
+            ).fetchall()
+            for key, body in rows:
+                found[key] = json.loads(zlib.decompress(body))
+        hits = len(found)
+        if hits:
+            cache_lookups.inc("feature_store", "hit", amount=hits)
+        if len(keys) > hits:
+            cache_lookups.inc("feature_store", "miss", amount=len(keys) - hits)
+        with self._lock:
+            self._lookups[(group, "hit")] += hits
+            self._lookups[(group, "miss")] += len(keys) - hits
+            for key in found:
+                self._pending_access[(group, key)] += 1
+            flush = now - self._last_flush >= FEATURE_STORE_ACCESS_FLUSH
+        if flush:
+            self.flush_access()
+        return found
+
+    def put(self, group, key, features):
+        """Store one entry of a group"""
+        self.put_many(group, {key: features})
+
+    def put_many(self, group, entries):
+        """
+        Store entries of one group, computed now.
+
+        Args:
+            group: Feature group name
+            entries: key -> JSON-serializable features
+        """
+        ttl = self.ttl(group)
+        if ttl <= 0 or not entries:
+            return
+        now = time.time()
+        rows = [(group, key, zlib.compress(json.dumps(features).encode('utf-8')), now, now + ttl, now)
+                for key, features in entries.items()]
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO features (grp, key, body, computed_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (grp, key) DO UPDATE SET "
+                "body = excluded.body, computed_at = excluded.computed_at, expires_at = excluded.expires_at",
+                rows
+            )
+
+    def flush_access(self):
+        """Write the access counts collected since the last flush, pruning expired entries when due"""
+        with self._lock:
+            pending, self._pending_access = self._pending_access, Counter()
+            self._last_flush = now = time.time()
+            prune_due = self.prune_interval > 0 and now - self._last_prune >= self.prune_interval
+            if prune_due:
+                self._last_prune = now
+        if prune_due:
+            try:
+                self.prune()
+            except sqlite3.Error as e:
+                # Expired entries are never served; the next interval tries again
+                logger.warning("Could not prune the feature store: %s", e)
+        if not pending:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany("UPDATE features SET hits = hits + ?, last_access = ? WHERE grp = ? AND key = ?",
+                             [(count, now, group, key) for (group, key), count in pending.items()])
+
+    def prune(self, batch_size=FEATURE_STORE_PRUNE_BATCH):
+        """
+        Delete expired entries, batch_size rows per transaction.
+
+        Returns:
+            int: Number of deleted entries
+        """
+        now = time.time()
+        conn = self._connection()
+        deleted = 0
+        while True:
+            with conn:
+                batch = conn.execute(
+                    "DELETE FROM features WHERE rowid IN "
+                    "(SELECT rowid FROM features WHERE expires_at <= ? LIMIT ?)", (now, batch_size)
+                ).rowcount
+            deleted += batch
+            if batch < batch_size:
+                break
+        with self._lock:
+            self.pruned += deleted
+        if deleted:
+            logger.info("Pruned %s expired feature store entries", deleted)
+        return deleted
+
+    def snapshot(self, path, limit=FEATURE_STORE_SNAPSHOT_SIZE):
+        """
+        Write the hot set (fresh entries, most used first) to a gzipped JSONL file.
+
+        The file is replaced atomically, so concurrent writers leave one
+        complete snapshot behind.
+
+        Returns:
+            int: Number of entries written
+        """
+        self.flush_access()
+        rows = self._connection().execute(
+            "SELECT grp, key, body, computed_at, expires_at, hits FROM features WHERE expires_at > ? "
+            "ORDER BY hits DESC, last_access DESC LIMIT ?", (time.time(), limit)
+        ).fetchall()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            for group, key, body, computed_at, expires_at, hits in rows:
+                f.write(json.dumps({
+                    "group": group, "key": key, "features": json.loads(zlib.decompress(body)),
+                    "computed_at": computed_at, "expires_at": expires_at, "hits": hits
+                }) + "\n")
+        os.replace(temp_path, path)
+        logger.info("Wrote %s feature store entries to %s", len(rows), path)
+        return len(rows)
+
+    def restore(self, path):
+        """
+        Load a snapshot, keeping the original computation times.
+
+        Expired entries are skipped, and entries already in the store are
+        only replaced by newer ones.
+
+        Returns:
+            int: Number of entries loaded
+        """
+        now = time.time()
+        rows = []
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["expires_at"] <= now:
+                    continue
+                rows.append((entry["group"], entry["key"], zlib.compress(json.dumps(entry["features"]).encode('utf-8')),
+                             entry["computed_at"], entry["expires_at"], entry.get("hits", 0), now))
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO features (grp, key, body, computed_at, expires_at, hits, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (grp, key) DO UPDATE SET "
+                "body = excluded.body, computed_at = excluded.computed_at, expires_at = excluded.expires_at "
+                "WHERE excluded.computed_at > features.computed_at",
+                rows
+            )
+        logger.info("Restored %s feature store entries from %s", len(rows), path)
+        return len(rows)
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM features").fetchone()[0]
+
+    def summary(self):
+        """Entries per group: total and still fresh"""
+        rows = self._connection().execute(
+            "SELECT grp, COUNT(*), SUM(expires_at > ?) FROM features GROUP BY grp ORDER BY grp", (time.time(),)
+        ).fetchall()
+        return {group: {"entries": total, "fresh": fresh or 0} for group, total, fresh in rows}
+
+    def stats(self):
+        with self._lock:
+            lookups = dict(self._lookups)
+        groups = self.summary()
+        for group, freshness in self.freshness.items():
+            entry = groups.setdefault(group, {"entries": 0, "fresh": 0})
+            entry["freshness_seconds"] = freshness
+            entry["hits"] = lookups.get((group, "hit"), 0)
+            entry["misses"] = lookups.get((group, "miss"), 0)
+        return {"path": self.path, "groups": groups, "pruned": self.pruned,
+                "prune_interval_seconds": self.prune_interval}
+
+
+def configure_feature_store():
+    """
+    Open the store named by FEATURE_STORE and warm it from FEATURE_STORE_SNAPSHOT.
+
+    Returns:
+        FeatureStore or None: None when disabled or unavailable
+    """
+    if FEATURE_STORE.lower() in ('', 'off', 'none', 'false'):
+        return None
+    try:
+        store = FeatureStore(FEATURE_STORE)
+    except Exception as e:
+        logger.error("Feature store unavailable: %s", e)
+        return None
+    if FEATURE_STORE_SNAPSHOT:
+        if store.count() == 0 and os.path.exists(FEATURE_STORE_SNAPSHOT):
+            try:
+                store.restore(FEATURE_STORE_SNAPSHOT)
+            except Exception as e:
+                logger.error("Could not restore feature store snapshot %s: %s", FEATURE_STORE_SNAPSHOT, e)
+        atexit.register(_snapshot_at_exit, store, FEATURE_STORE_SNAPSHOT)
+    else:
+        atexit.register(store.flush_access)
+    return store
+
+
+def _snapshot_at_exit(store, path):
+    try:
+        store.snapshot(path)
+    except Exception as e:
+        logger.error("Could not write feature store snapshot %s: %s", path, e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and maintain the feature store")
+    parser.add_argument("--store", default=FEATURE_STORE, help="SQLite file of the store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("info", help="Entries per group")
+    snapshot = commands.add_parser("snapshot", help="Write the hot set to a file")
+    snapshot.add_argument("path")
+    snapshot.add_argument("--limit", type=int, default=FEATURE_STORE_SNAPSHOT_SIZE)
+    restore = commands.add_parser("restore", help="Load a snapshot")
+    restore.add_argument("path")
+    commands.add_parser("prune", help="Delete expired entries")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = FeatureStore(args.store)
+    if args.command == "info":
+        print(json.dumps(store.summary(), indent=2))
+    elif args.command == "snapshot":
+        store.snapshot(args.path, args.limit)
+    elif args.command == "restore":
+        store.restore(args.path)
+    elif args.command == "prune":
+        store.prune()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+
+from metrics import cache_lookups
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Version of the documents written to users/{uid}/scans
+HISTORY_SCHEMA_VERSION = 2
+HISTORY_TOP_K = int(os.environ.get('HISTORY_TOP_K', 5))
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DETAILS_PATH = os.environ.get('HISTORY_DETAILS_PATH', os.path.join(current_dir, 'data', 'history_details.db'))
+# Days full results are kept locally for the lazy details endpoint
+HISTORY_DETAILS_TTL_DAYS = float(os.environ.get('HISTORY_DETAILS_TTL_DAYS', 30))
+
+# Result fields that change on every run of the same analysis
+_VOLATILE_FIELDS = ("analysis_date", "timings")
+
+
+def _json_default(value):
+    # numpy scalars and datetimes that end up in result dictionaries
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def canonical_json(result):
+    """Serialize a result deterministically (sorted keys, no volatile fields)"""
+    stable = {key: value for key, value in result.items() if key not in _VOLATILE_FIELDS}
+    return json.dumps(stable, sort_keys=True, separators=(',', ':'), default=_json_default)
+
+
+def content_hash(result):
+    """
+    Hash the full analysis result.
+
+    Returns:
+        str: Hex SHA-256 of the canonical JSON form
+    """
+    return hashlib.sha256(canonical_json(result).encode('utf-8')).hexdigest()
+
+
+def layout_hash(names):
+    """Short hash identifying the order of the values in a packed feature vector"""
+    return hashlib.sha256(",".join(names).encode('utf-8')).hexdigest()[:12]
+
+
+def pack_feature_vector(values):
+    """Pack feature values as little-endian float32 bytes"""
+    return np.asarray(values, dtype='<f4').tobytes()
+
+
+def unpack_feature_vector(blob):
+    """
+    Unpack a vector written by pack_feature_vector.
+
+    Returns:
+        numpy.ndarray: float32 values
+    """
+    return np.frombuffer(blob, dtype='<f4').astype(np.float32)
+
+
+def top_factors(result, k=HISTORY_TOP_K):
+    """
+    Pick the k strongest risk factors of a result for the summary.
+
+    Uses the model feature contributions when present, otherwise the
+    suspicious patterns found by the rules.
+
+    Returns:
+        list: Dicts with name, label, value and section
+    """
+    contributions = result.get("feature_contributions") or []
+    if contributions:
+        ranked = sorted(contributions, key=lambda item: -abs(item.get("percentage", item.get("contribution", 0)) or 0))
+        return [{
+            "name": item.get("name"),
+            "label": item.get("feature_name", item.get("name")),
+            "value": round(float(item.get("percentage", item.get("contribution", 0)) or 0), 2),
+            "section": item.get("section")
+        } for item in ranked[:k]]
+
+    factors = []
+    for pattern in result.get("suspicious_patterns") or []:
+        if isinstance(pattern, dict):
+            factors.append({
+                "name": pattern.get("pattern"),
+                "label": pattern.get("pattern"),
+                "value": round(float(pattern.get("risk_score", 0) or 0), 2),
+                "section": "Suspicious Patterns"
+            })
+    factors.sort(key=lambda item: -item["value"])
+    return factors[:k]
+
+
+def build_history_record(url, result, model_version, layout=None, vector=None):
+    """
+    Build the compact history document for a scan.
+
+    Args:
+        url: Scanned URL
+        result: Full analysis or prediction result
+        model_version: Identifier of the model that produced the score
+        layout: Feature names in vector order (optional)
+        vector: Feature values in layout order (optional)
+
+    Returns:
+        dict: Firestore document without the timestamp
+    """
+    score = float(result.get("score", result.get("fraud_score", 0)) or 0)
+    record = {
+        "schemaVersion": HISTORY_SCHEMA_VERSION,
+        "url": url,
+        # riskScore is what the history and dashboard pages already read
+        "riskScore": int(round(score)),
+        "score": round(score, 2),
+        "riskLevel": result.get("risk_level", "unknown"),
+        "scoringTier": result.get("scoring_tier", "full"),
+        "topFactors": top_factors(result),
+        "contentHash": content_hash(result),
+        "modelVersion": model_version
+    }
+    if vector is not None and layout:
+        record["featureVector"] = pack_feature_vector(vector)
+        record["featureLayout"] = layout_hash(layout)
+    return record
+
+
+class HistoryDetailStore:
+    """
+    Local content-addressed store of full results, keyed by content hash.
+
+    History documents only carry the summary; the details endpoint reads the
+    full result from here and recomputes it when it has expired or was
+    produced on another host.
+    """
+    def __init__(self, path=DEFAULT_DETAILS_PATH, ttl_days=HISTORY_DETAILS_TTL_DAYS):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS details ("
+            "content_hash TEXT PRIMARY KEY, created_at REAL NOT NULL, body BLOB NOT NULL)"
+        )
+        conn.commit()
+        self._prune()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def put_many(self, results):
+        """
+        Store full results.
+
+        Args:
+            results: Iterable of (content_hash, result) pairs
+        """
+        now = time.time()
+        rows = [(digest, now, zlib.compress(json.dumps(result, default=_json_default).encode('utf-8')))
+                for digest, result in results]
+        if not rows:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO details VALUES (?, ?, ?)", rows)
+
+    def get(self, digest):
+        """
+        Look up a stored result.
+
+        Returns:
+            dict or None: The full result if it is stored, not expired and
+                still matches its content hash
+        """
+        row = self._connection().execute(
+            "SELECT created_at, body FROM details WHERE content_hash = ?", (digest,)
+        ).fetchone()
+        result = None
+        if row is not None and time.time() - row[0] <= self.ttl_seconds:
+            try:
+                result = json.loads(zlib.decompress(row[1]))
+            except (zlib.error, ValueError):
+                logger.warning("Discarding unreadable history details %s", digest)
+            # Corrupt or mismatched rows are recomputed like expired ones
+            if result is not None and content_hash(result) != digest:
+                logger.warning("Discarding history details %s that do not match their content hash", digest)
+                result = None
+        if result is None:
+            cache_lookups.inc("history_details", "miss")
+            return None
+        cache_lookups.inc("history_details", "hit")
+        return result
+
+    def _prune(self):
+        conn = self._connection()
+        with conn:
+            deleted = conn.execute("DELETE FROM details WHERE created_at < ?",
+                                   (time.time() - self.ttl_seconds,)).rowcount
+        if deleted:
+            logger.info("Pruned %s expired history details", deleted)
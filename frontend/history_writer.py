@@ -0,0 +1,301 @@
+import os
+import copy
+import json
+import time
+import base64
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from metrics import stage_duration, outbound_calls
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_JOURNAL_PATH = os.environ.get('HISTORY_JOURNAL_PATH', os.path.join(current_dir, 'data', 'history_journal.jsonl'))
+HISTORY_QUEUE_SIZE = int(os.environ.get('HISTORY_QUEUE_SIZE', 10000))
+# Firestore accepts at most 500 writes per batch
+HISTORY_BATCH_SIZE = min(500, int(os.environ.get('HISTORY_BATCH_SIZE', 100)))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 1.0))
+# Minimum seconds between attempts to replay the journal after Firestore recovers
+JOURNAL_RETRY_INTERVAL = float(os.environ.get('HISTORY_JOURNAL_RETRY_INTERVAL', 60.0))
+
+
+def _json_default(value):
+    # numpy scalars, datetimes and packed vectors that end up in history records
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return {"$bytes": base64.b64encode(value).decode('ascii')}
+    return str(value)
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1 and "$bytes" in obj:
+        return base64.b64decode(obj["$bytes"])
+    return obj
+
+
+class HistoryWriter:
+    """
+    Background writer for scan history.
+
+    Requests only enqueue records; a daemon thread drains the bounded queue
+    and writes Firestore batches when batch_size records are waiting or
+    flush_interval seconds have passed. Records that cannot be written (or
+    that arrive while the queue is full) are appended to an on-disk journal,
+    which is replayed on startup and after Firestore recovers.
+
+    When a detail_store is given, the full results passed to enqueue are
+    saved there by content hash before each batch is written.
+    """
+    def __init__(self, db, journal_path=DEFAULT_JOURNAL_PATH, max_queue=HISTORY_QUEUE_SIZE,
+                 batch_size=HISTORY_BATCH_SIZE, flush_interval=HISTORY_FLUSH_INTERVAL, detail_store=None):
+        self.db = db
+        self.detail_store = detail_store
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._journal_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_journal_attempt = 0.0
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "journaled": 0,
+            "replayed": 0,
+            "last_flush_seconds": None,
+            "max_flush_seconds": 0.0,
+            "total_flush_seconds": 0.0
+        }
+
+    def start(self):
+        """Start the writer thread and replay any journal left by a previous run"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Flush what is queued and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # Anything still queued (e.g. the join timed out) goes to the journal
+        leftovers = self._drain(block=False)
+        if leftovers:
+            self._journal([record for record, _ in leftovers])
+
+    def enqueue(self, user_id, doc, details=None):
+        """
+        Queue a scan record for writing without blocking the caller.
+
+        Args:
+            user_id: Firebase user id
+            doc: History document (see history_schema.build_history_record)
+            details: Full result to keep in the detail store (optional); copied,
+                so the caller may keep changing it
+
+        Returns:
+            bool: True if queued, False if it was spilled to the journal
+        """
+        record = {"user_id": user_id, "doc": doc, "timestamp": datetime.utcnow()}
+        if details is not None:
+            # The writer thread serializes it later; stay in step with doc["contentHash"]
+            details = copy.deepcopy(details)
+        try:
+            self._queue.put_nowait((record, details))
+        except queue.Full:
+            logger.warning("History queue full, spilling record to journal")
+            self._journal([record])
+            return False
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+        return True
+
+    def _drain(self, block=True):
+        items = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(items) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    items.append(self._queue.get(timeout=timeout))
+                else:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        self._recover_orphaned_replays()
+        self.replay_journal()
+        while not self._stop_event.is_set() or not self._queue.empty():
+            items = self._drain(block=not self._stop_event.is_set())
+            if items:
+                self._store_details(items)
+                self._write_batch([record for record, _ in items])
+            elif self._stop_event.is_set():
+                break
+
+    def _commit(self, records):
+        batch = self.db.batch()
+        for record in records:
+            # Same path the frontend reads from
+            doc_ref = self.db.collection('users').document(record["user_id"]).collection('scans').document()
+            batch.set(doc_ref, {**record["doc"], 'timestamp': record["timestamp"]})
+        try:
+            with stage_duration.time("firestore"):
+                batch.commit()
+        except Exception:
+            outbound_calls.inc("firestore", "error")
+            raise
+        outbound_calls.inc("firestore", "success")
+
+    def _store_details(self, items):
+        if self.detail_store is None:
+            return
+        details = [(record["doc"]["contentHash"], result) for record, result in items
+                   if result is not None and "contentHash" in record["doc"]]
+        try:
+            self.detail_store.put_many(details)
+        except Exception as e:
+            # Details can be recomputed; never let this block the history write
+            logger.warning("Could not store %s history details: %s", len(details), e)
+
+    def _write_batch(self, records):
+        start = time.monotonic()
+        try:
+            self._commit(records)
+        except Exception as e:
+            logger.error("Error writing %s history records to Firestore: %s", len(records), e)
+            with self._stats_lock:
+                self._stats["failed_batches"] += 1
+            self._journal(records)
+            return False
+
+        elapsed = time.monotonic() - start
+        with self._stats_lock:
+            self._stats["written"] += len(records)
+            self._stats["batches"] += 1
+            self._stats["last_flush_seconds"] = round(elapsed, 4)
+            self._stats["max_flush_seconds"] = max(self._stats["max_flush_seconds"], round(elapsed, 4))
+            self._stats["total_flush_seconds"] += elapsed
+        logger.info("Saved %s history records in %.3fs", len(records), elapsed)
+
+        # Firestore is healthy again: retry anything journaled earlier
+        if time.monotonic() - self._last_journal_attempt >= JOURNAL_RETRY_INTERVAL:
+            self.replay_journal()
+        return True
+
+    def _journal(self, records):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+            with self._journal_lock, open(self.journal_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, default=_json_default) + "\n")
+            with self._stats_lock:
+                self._stats["journaled"] += len(records)
+        except OSError as e:
+            logger.error("Could not journal %s history records, dropping them: %s", len(records), e)
+
+    def _recover_orphaned_replays(self):
+        # Replay files of processes that died mid-replay go back into the journal
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        prefix = os.path.basename(self.journal_path) + ".replay-"
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if not name.startswith(prefix):
+                continue
+            try:
+                pid = int(name[len(prefix):].split('-')[0])
+                os.kill(pid, 0)
+                continue  # owner is still running
+            except ProcessLookupError:
+                pass
+            except (ValueError, PermissionError):
+                continue
+            path = os.path.join(directory, name)
+            with self._journal_lock, open(path, 'r', encoding='utf-8') as src, \
+                    open(self.journal_path, 'a', encoding='utf-8') as dst:
+                dst.write(src.read())
+            os.remove(path)
+            logger.info("Recovered orphaned history replay file %s", name)
+
+    def replay_journal(self):
+        """
+        Write journaled records back to Firestore.
+
+        The journal is first renamed to a per-process file so concurrent
+        workers never replay the same records twice.
+
+        Returns:
+            int: Number of records replayed
+        """
+        self._last_journal_attempt = time.monotonic()
+        if not os.path.exists(self.journal_path):
+            return 0
+        replay_path = f"{self.journal_path}.replay-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with self._journal_lock:
+                os.replace(self.journal_path, replay_path)
+        except OSError:
+            # Another worker took it first
+            return 0
+
+        records = []
+        with open(replay_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line, object_hook=_json_object_hook)
+                    record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+                    records.append(record)
+                except (ValueError, KeyError):
+                    logger.warning("Skipping corrupt history journal line")
+        os.remove(replay_path)
+
+        replayed = 0
+        for i in range(0, len(records), self.batch_size):
+            try:
+                self._commit(records[i:i + self.batch_size])
+            except Exception as e:
+                logger.error("Replaying history journal failed: %s", e)
+                self._journal(records[i:])
+                break
+            replayed += len(records[i:i + self.batch_size])
+
+        with self._stats_lock:
+            self._stats["replayed"] += replayed
+        if replayed:
+            logger.info("Replayed %s journaled history records", replayed)
+        return replayed
+
+    def stats(self):
+        """
+        Get writer statistics for status endpoints.
+
+        Returns:
+            dict: Queue depth, write counters and flush latency
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total_flush_seconds = stats.pop("total_flush_seconds")
+        stats["avg_flush_seconds"] = round(total_flush_seconds / stats["batches"], 4) if stats["batches"] else None
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["journal_bytes"] = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        return stats
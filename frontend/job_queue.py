@@ -0,0 +1,504 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from urllib.parse import urlparse
+
+import requests
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', os.path.join(current_dir, 'data', 'jobs.db'))
+MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+# Identical submissions within this many seconds return the existing job
+DEDUP_TTL = float(os.environ.get('JOB_DEDUP_TTL', 300))
+# Running tasks whose worker has not finished within this time are requeued
+VISIBILITY_TIMEOUT = float(os.environ.get('JOB_VISIBILITY_TIMEOUT', 600))
+MAX_BATCH_SIZE = int(os.environ.get('JOB_MAX_BATCH_SIZE', 1000))
+# Ready tasks a worker claims at once; they share one batch context (e.g. feature store reads)
+CLAIM_BATCH_SIZE = int(os.environ.get('JOB_CLAIM_BATCH', 4))
+# Hosts allowed as callback targets; callbacks never leave the local machine by default
+CALLBACK_HOSTS = {h.strip() for h in os.environ.get('JOB_CALLBACK_HOSTS', 'localhost,127.0.0.1,::1').split(',') if h.strip()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    dedup_key TEXT NOT NULL,
+    callback_url TEXT,
+    options TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, created_at);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs (id),
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    locked_by TEXT,
+    locked_at REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (status, available_at);
+CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id, position);
+"""
+
+# Task states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobError(ValueError):
+    """Raised for invalid job submissions"""
+
+
+def _json_default(value):
+    # numpy scalars and datetimes that end up in result dictionaries
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def validate_callback_url(callback_url):
+    """
+    Check that a callback URL points at an allowed local host.
+
+    Raises:
+        JobError: The URL is malformed or not local
+    """
+    parsed = urlparse(callback_url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise JobError("callback_url must be an http(s) URL")
+    if parsed.hostname not in CALLBACK_HOSTS:
+        raise JobError(f"callback_url host must be one of: {', '.join(sorted(CALLBACK_HOSTS))}")
+
+
+class JobQueue:
+    """
+    Persistent SQLite-backed queue of URL analysis jobs.
+
+    A job is one submission (a single URL or a batch); each URL becomes a task
+    that workers claim, run and complete independently. Several processes may
+    share the same database file.
+    """
+    def __init__(self, path=DEFAULT_QUEUE_PATH, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._raw_connection().executescript(SCHEMA)
+
+    def _raw_connection(self):
+        # One connection per thread; sqlite3 connections are not thread-safe
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _connection(self, write=True):
+        return _Transaction(self._raw_connection(), write)
+
+    def submit(self, urls, callback_url=None, options=None):
+        """
+        Enqueue a job.
+
+        Args:
+            urls: List of URLs (with scheme)
+            callback_url: Optional local URL notified when the job finishes
+            options: JSON-serializable options passed to the task handler
+
+        Returns:
+            tuple: (job_id, deduplicated)
+        """
+        if not urls:
+            raise JobError("No URLs provided")
+        if len(urls) > MAX_BATCH_SIZE:
+            raise JobError(f"Batch too large (maximum {MAX_BATCH_SIZE} URLs)")
+        if callback_url:
+            validate_callback_url(callback_url)
+        options = options or {}
+
+        dedup_source = json.dumps({"urls": urls, "options": options}, sort_keys=True)
+        dedup_key = hashlib.sha256(dedup_source.encode('utf-8')).hexdigest()
+        now = time.time()
+
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE dedup_key = ? AND created_at >= ? ORDER BY created_at DESC LIMIT 1",
+                (dedup_key, now - DEDUP_TTL)
+            ).fetchone()
+            if row is not None:
+                return row["id"], True
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, dedup_key, callback_url, options, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, dedup_key, callback_url, json.dumps(options), now)
+            )
+            conn.executemany(
+                "INSERT INTO tasks (job_id, position, url, status, available_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(job_id, position, url, QUEUED, now, now) for position, url in enumerate(urls)]
+            )
+        return job_id, False
+
+    def claim(self, worker_id):
+        """
+        Atomically claim the next ready task.
+
+        Returns:
+            dict or None: Task with its job options, or None if nothing is ready
+        """
+        tasks = self.claim_many(worker_id, 1)
+        return tasks[0] if tasks else None
+
+    def claim_many(self, worker_id, limit):
+        """
+        Atomically claim up to limit ready tasks, oldest first.
+
+        Returns:
+            list: Tasks with their job options (empty if nothing is ready)
+        """
+        now = time.time()
+        with self._connection() as conn:
+            # Requeue tasks abandoned by crashed workers
+            conn.execute(
+                "UPDATE tasks SET status = ?, locked_by = NULL, locked_at = NULL, updated_at = ? "
+                "WHERE status = ? AND locked_at < ?",
+                (QUEUED, now, RUNNING, now - VISIBILITY_TIMEOUT)
+            )
+            rows = conn.execute(
+                "SELECT t.id, t.job_id, t.url, t.attempts, j.options FROM tasks t JOIN jobs j ON j.id = t.job_id "
+                "WHERE t.status = ? AND t.available_at <= ? ORDER BY t.available_at, t.id LIMIT ?",
+                (QUEUED, now, max(1, limit))
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET status = ?, locked_by = ?, locked_at = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                [(RUNNING, worker_id, now, now, row["id"]) for row in rows]
+            )
+        return [{
+            "id": row["id"],
+            "job_id": row["job_id"],
+            "url": row["url"],
+            "attempt": row["attempts"] + 1,
+            "options": json.loads(row["options"])
+        } for row in rows]
+
+    def complete(self, task, result):
+        """
+        Store a task result.
+
+        Returns:
+            dict or None: The job summary if this completed the whole job
+        """
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = NULL, locked_by = NULL, updated_at = ? WHERE id = ?",
+                (DONE, json.dumps(result, default=_json_default), now, task["id"])
+            )
+        return self._finish_job_if_done(task["job_id"])
+
+    def fail(self, task, error):
+        """
+        Record a task failure, scheduling a retry with exponential backoff.
+
+        Returns:
+            dict or None: The job summary if this completed the whole job
+        """
+        now = time.time()
+        with self._connection() as conn:
+            if task["attempt"] < self.max_attempts:
+                backoff = 2 ** task["attempt"]
+                conn.execute(
+                    "UPDATE tasks SET status = ?, error = ?, locked_by = NULL, locked_at = NULL, "
+                    "available_at = ?, updated_at = ? WHERE id = ?",
+                    (QUEUED, str(error), now + backoff, now, task["id"])
+                )
+                logger.warning("Task %s failed (attempt %s), retrying in %ss: %s", task['id'], task['attempt'], backoff, error)
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, locked_by = NULL, updated_at = ? WHERE id = ?",
+                (FAILED, str(error), now, task["id"])
+            )
+            logger.error("Task %s failed permanently after %s attempts: %s", task['id'], task['attempt'], error)
+        return self._finish_job_if_done(task["job_id"])
+
+    def _finish_job_if_done(self, job_id):
+        with self._connection() as conn:
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE job_id = ? AND status IN (?, ?)",
+                (job_id, QUEUED, RUNNING)
+            ).fetchone()[0]
+            if pending:
+                return None
+            # Only the worker that flips finished_at delivers the callback
+            updated = conn.execute(
+                "UPDATE jobs SET finished_at = ? WHERE id = ? AND finished_at IS NULL",
+                (time.time(), job_id)
+            ).rowcount
+        if not updated:
+            return None
+        return self.get_job(job_id)
+
+    def get_job(self, job_id, include_results=True):
+        """
+        Get a job's status and (optionally) its per-URL results.
+
+        Returns:
+            dict or None: Job summary, or None if the job does not exist
+        """
+        with self._connection(write=False) as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            tasks = conn.execute(
+                "SELECT url, status, attempts, result, error FROM tasks WHERE job_id = ? ORDER BY position",
+                (job_id,)
+            ).fetchall()
+
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for task in tasks:
+            counts[task["status"]] += 1
+
+        if counts[QUEUED] + counts[RUNNING] == 0:
+            status = "failed" if counts[DONE] == 0 else ("completed_with_errors" if counts[FAILED] else "completed")
+        elif counts[RUNNING] or counts[DONE] or counts[FAILED]:
+            status = "running"
+        else:
+            status = "queued"
+
+        summary = {
+            "job_id": job["id"],
+            "status": status,
+            "total": len(tasks),
+            "counts": counts,
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+            "callback_url": job["callback_url"]
+        }
+        if include_results:
+            summary["results"] = [{
+                "url": task["url"],
+                "status": task["status"],
+                "attempts": task["attempts"],
+                "result": json.loads(task["result"]) if task["result"] else None,
+                "error": task["error"]
+            } for task in tasks]
+        return summary
+
+    def stats(self):
+        """
+        Get queue depth by task state.
+
+        Returns:
+            dict: Task counts
+        """
+        with self._connection(write=False) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status").fetchall()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+
+class _Transaction:
+    """Context manager running a block in a transaction (write-locking from the start for writes)"""
+    def __init__(self, conn, write=True):
+        self.conn = conn
+        self.write = write
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE" if self.write else "BEGIN")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def deliver_callback(job):
+    """POST a finished job summary (without results) to its callback URL"""
+    callback_url = job.get("callback_url")
+    if not callback_url:
+        return
+    payload = {k: v for k, v in job.items() if k != "results"}
+    try:
+        requests.post(callback_url, json=payload, timeout=5)
+        logger.info("Delivered callback for job %s to %s", job['job_id'], callback_url)
+    except requests.RequestException as e:
+        logger.warning("Callback for job %s to %s failed: %s", job['job_id'], callback_url, e)
+
+
+def worker_loop(queue, handler, worker_id, stop_event, poll_interval=1.0, batch_size=1, batch_context=None):
+    """
+    Drain the queue until stop_event is set.
+
+    Args:
+        queue: JobQueue instance
+        handler: Callable(url, options) returning a JSON-serializable result;
+            exceptions trigger a retry
+        worker_id: Identifier recorded on claimed tasks
+        stop_event: threading.Event or multiprocessing.Event
+        poll_interval: Seconds to sleep when the queue is empty
+        batch_size: Ready tasks claimed at once
+        batch_context: Callable(urls) returning a context manager the claimed
+            tasks run in (optional)
+    """
+    logger.info("Job worker %s started", worker_id)
+    while not stop_event.is_set():
+        try:
+            tasks = queue.claim_many(worker_id, batch_size)
+        except sqlite3.Error as e:
+            logger.error("Job worker %s could not claim a task: %s", worker_id, e)
+            stop_event.wait(poll_interval)
+            continue
+        if not tasks:
+            stop_event.wait(poll_interval)
+            continue
+
+        with batch_context([task["url"] for task in tasks]) if batch_context else nullcontext():
+            for task in tasks:
+                try:
+                    result = handler(task["url"], task["options"])
+                    finished_job = queue.complete(task, result)
+                except Exception as e:
+                    finished_job = queue.fail(task, e)
+                if finished_job:
+                    deliver_callback(finished_job)
+    logger.info("Job worker %s stopped", worker_id)
+
+
+def _process_worker_main(path, handler, worker_id, stop_event, poll_interval, batch_size, batch_context):
+    logging.basicConfig(level=logging.INFO)
+    worker_loop(JobQueue(path), handler, worker_id, stop_event, poll_interval, batch_size, batch_context)
+
+
+class JobWorkerPool:
+    """
+    Pool of background workers draining a JobQueue.
+
+    Workers are threads inside the current process by default, or separate
+    processes with mode="process" (the handler and batch_context must then be
+    module-level functions so they can be sent to the child processes).
+    Each worker claims up to batch_size tasks at a time and runs them inside
+    batch_context(urls) when one is given.
+    """
+    def __init__(self, queue, handler, workers=2, mode="thread", poll_interval=1.0,
+                 batch_size=CLAIM_BATCH_SIZE, batch_context=None):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.batch_context = batch_context
+        self._stop_event = None
+        self._workers = []
+
+    def start(self):
+        if self._workers:
+            return
+        prefix = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        if self.mode == "process":
+            # spawn rather than fork: the parent may already hold TensorFlow state
+            context = multiprocessing.get_context("spawn")
+            self._stop_event = context.Event()
+            # Children import the handler's module (usually app) while still bootstrapping,
+            # before any code of ours runs there; the environment they inherit keeps that
+            # import from starting in-app workers of its own
+            inherited = os.environ.get('JOB_WORKERS')
+            os.environ['JOB_WORKERS'] = '0'
+            try:
+                for i in range(self.workers):
+                    worker = context.Process(
+                        target=_process_worker_main,
+                        args=(self.queue.path, self.handler, f"{prefix}-p{i}", self._stop_event, self.poll_interval,
+                              self.batch_size, self.batch_context),
+                        daemon=True
+                    )
+                    worker.start()
+                    self._workers.append(worker)
+            finally:
+                if inherited is None:
+                    del os.environ['JOB_WORKERS']
+                else:
+                    os.environ['JOB_WORKERS'] = inherited
+        else:
+            self._stop_event = threading.Event()
+            for i in range(self.workers):
+                worker = threading.Thread(
+                    target=worker_loop,
+                    args=(self.queue, self.handler, f"{prefix}-t{i}", self._stop_event, self.poll_interval,
+                          self.batch_size, self.batch_context),
+                    name=f"job-worker-{i}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+        logger.info("Started %s job worker %s(s) on %s", self.workers, self.mode, self.queue.path)
+
+    def stop(self, timeout=10):
+        if self._stop_event is None:
+            return
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def status(self):
+        return {
+            "workers": len(self._workers),
+            "mode": self.mode,
+            "alive": sum(1 for w in self._workers if w.is_alive())
+        }
+
+
+def main(argv=None):
+    """Run standalone worker processes against the queue (python job_queue.py --workers 4)"""
+    parser = argparse.ArgumentParser(description="Run background workers for queued URL analysis jobs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Number of worker processes")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="Path to the SQLite queue database")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls of an empty queue")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # The standalone pool replaces the in-app worker threads
+    os.environ['JOB_WORKERS'] = '0'
+    # Imported here: app imports this module for the HTTP endpoints
+    sys.path.insert(0, current_dir)
+    from app import run_job_task, feature_store_batch
+
+    pool = JobWorkerPool(JobQueue(args.queue), run_job_task, workers=args.workers, mode="process",
+                         poll_interval=args.poll_interval, batch_context=feature_store_batch)
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Stopping job workers")
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Lightweight Prometheus-style metrics.
+
+Counters, gauges and histograms live in process memory and cost a lock and a
+dict update per observation. When METRICS_MULTIPROC_DIR is set, every process
+periodically writes a snapshot to that directory and /metrics merges the
+snapshots of all workers: counters and histograms are summed across every
+process that ever wrote one, gauges only across processes that are alive.
+Clear the directory when the service is (re)deployed. Forked children (e.g.
+gunicorn --preload workers) start their own snapshot file and flush thread.
+"""
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+# Seconds between snapshot writes; other workers' values lag by at most this much
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5.0))
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), self._copy(value)] for labels, value in self._values.items()]
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight"""
+    kind = "gauge"
+
+    def inc(self, *labelvalues, amount=1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, *labelvalues, amount=1.0):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = float(value)
+
+    @contextmanager
+    def track_inprogress(self, *labelvalues):
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, the last slot is +Inf
+                state = self._values[labelvalues] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            state["counts"][index] += 1
+            state["sum"] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    @staticmethod
+    def _copy(value):
+        return {"counts": list(value["counts"]), "sum": value["sum"]}
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name, *args, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args, **kwargs)
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """Get or create a counter"""
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    """Get or create a gauge"""
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Get or create a histogram"""
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+# Metrics shared by the app and its helper modules
+stage_duration = histogram("fraud_stage_duration_seconds",
+                           "Time spent in each analysis stage (dns, geo, whois, page_fetch, html_parse, ct, tls, "
+                           "scaler, model, firestore); provider stages count only calls that reach the provider",
+                           ["stage"])
+outbound_calls = counter("fraud_outbound_calls_total", "Outbound provider calls by outcome", ["provider", "outcome"])
+cache_lookups = counter("fraud_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+inflight_requests = gauge("fraud_inflight_requests", "HTTP requests currently being handled", ["endpoint"])
+http_requests = counter("fraud_http_requests_total", "HTTP requests handled", ["endpoint", "method", "status"])
+http_request_duration = histogram("fraud_http_request_duration_seconds", "HTTP request latency", ["endpoint"])
+coalesced_requests = counter("fraud_coalesced_requests_total",
+                             "Requests answered by an identical in-flight request", ["level", "scope"])
+tiered_scoring = counter("fraud_tiered_scoring_total",
+                         "Tiered scoring verdicts: skipped (lexical fast path) or enriched (full pipeline)",
+                         ["outcome"])
+model_warmup_duration = histogram("fraud_model_warmup_duration_seconds",
+                                  "Model warmup time of each worker at startup", ["backend", "outcome"])
+
+
+def _local_snapshot():
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {
+        metric.name: {
+            "type": metric.kind,
+            "help": metric.documentation,
+            "labelnames": list(metric.labelnames),
+            "buckets": list(metric.buckets) if metric.kind == "histogram" else None,
+            "samples": metric.snapshot()
+        }
+        for metric in metrics
+    }
+
+
+# Snapshot file of this process; the start time guards against pid reuse
+_snapshot_path = None
+_flush_thread = None
+
+
+def _snapshot_file():
+    global _snapshot_path
+    if _snapshot_path is None:
+        _snapshot_path = os.path.join(MULTIPROC_DIR, f"metrics-{os.getpid()}-{int(time.time() * 1000)}.json")
+    return _snapshot_path
+
+
+def flush():
+    """Write this process's snapshot to the multiprocess directory"""
+    if not MULTIPROC_DIR:
+        return
+    path = _snapshot_file()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"pid": os.getpid(), "metrics": _local_snapshot()}, f)
+    os.replace(tmp_path, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError as e:
+            logger.warning("Could not write metrics snapshot: %s", e)
+
+
+def _start_flush_thread():
+    global _flush_thread
+    _flush_thread = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+    _flush_thread.start()
+
+
+def start():
+    """Start writing snapshots in the background (no-op without METRICS_MULTIPROC_DIR)"""
+    if not MULTIPROC_DIR or _flush_thread is not None:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    _start_flush_thread()
+    atexit.register(flush)
+
+
+def _after_fork_in_child():
+    global _registry_lock, _snapshot_path
+    # Only the forking thread survives: locks it did not hold may be stuck, the flush thread is gone
+    _registry_lock = threading.Lock()
+    for metric in _registry.values():
+        metric._lock = threading.Lock()
+        if MULTIPROC_DIR:
+            # The parent keeps reporting what it counted before the fork in its own snapshot
+            metric._values = {}
+    # Otherwise the child would overwrite the parent's snapshot file
+    _snapshot_path = None
+    if _flush_thread is not None:
+        _start_flush_thread()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(into, snapshot, alive):
+    for name, metric in snapshot.items():
+        if metric["type"] == "gauge" and not alive:
+            continue
+        merged = into.setdefault(name, {**metric, "samples": {}})
+        for labels, value in metric["samples"]:
+            key = tuple(labels)
+            if metric["type"] == "histogram":
+                current = merged["samples"].get(key)
+                if current is None:
+                    merged["samples"][key] = {"counts": list(value["counts"]), "sum": value["sum"]}
+                else:
+                    current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                    current["sum"] += value["sum"]
+            else:
+                merged["samples"][key] = merged["samples"].get(key, 0.0) + value
+
+
+def collect():
+    """
+    Gather metrics from this process, or from every worker in multiprocess mode.
+
+    Returns:
+        dict: Metric name to merged metric description
+    """
+    merged = {}
+    if not MULTIPROC_DIR:
+        _merge(merged, _local_snapshot(), alive=True)
+        return merged
+
+    flush()
+    for filename in os.listdir(MULTIPROC_DIR):
+        if not (filename.startswith("metrics-") and filename.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(MULTIPROC_DIR, filename), 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        _merge(merged, data["metrics"], alive=_pid_alive(data["pid"]))
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+def generate_latest():
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+    for name, metric in sorted(collect().items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["type"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(list(metric["buckets"]) + [float('inf')], value["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(names, labels, ('le', _format_value(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(names, labels)} {cumulative}")
+            else:
+                lines.append(f"{name}{_format_labels(names, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    """Track in-flight requests, request counts and latency for a Flask app"""
+    from flask import request, g
+
+    @app.before_request
+    def _start_request_metrics():
+        endpoint = request.endpoint or "unmatched"
+        g.metrics_endpoint = endpoint
+        g.metrics_started = time.perf_counter()
+        inflight_requests.inc(endpoint)
+
+    @app.after_request
+    def _record_request_metrics(response):
+        endpoint = getattr(g, 'metrics_endpoint', None)
+        if endpoint is not None:
+            http_requests.inc(endpoint, request.method, str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc=None):
+        endpoint = getattr(g, 'metrics_endpoint', None)
+        if endpoint is None:
+            return
+        # Streamed responses end here, after the last chunk was sent
+        inflight_requests.dec(endpoint)
+        http_request_duration.observe(time.perf_counter() - g.metrics_started, endpoint)
@@ -0,0 +1,203 @@
+"""
+Feature attributions computed from the loaded Keras model.
+
+Supports gradient x input and integrated gradients with a fixed number of
+steps against an all-zero baseline. A whole batch of feature vectors (and,
+for integrated gradients, all of their interpolation steps) goes through the
+model in one gradient pass. Results are cached by model version and the
+hash of the feature vector.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import tensorflow as tf
+
+from metrics import cache_lookups, stage_duration
+from timing import span
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# "integrated_gradients" or "gradient_x_input"
+ATTRIBUTION_METHOD = os.environ.get('ATTRIBUTION_METHOD', 'integrated_gradients').lower()
+ATTRIBUTION_STEPS = int(os.environ.get('ATTRIBUTION_STEPS', 16))
+ATTRIBUTION_CACHE_SIZE = int(os.environ.get('ATTRIBUTION_CACHE_SIZE', 10000))
+# Batches slower than this are counted in stats() and logged
+ATTRIBUTION_BUDGET_MS = float(os.environ.get('ATTRIBUTION_BUDGET_MS', 50))
+ATTRIBUTION_TOP_K = int(os.environ.get('ATTRIBUTION_TOP_K', 10))
+
+METHODS = ("integrated_gradients", "gradient_x_input")
+
+
+class ModelAttributor:
+    """
+    Batched gradient-based attributions for one model.
+
+    Args:
+        model: Keras model with a single sigmoid output
+        model_version: Identifier of the model weights, part of the cache key
+        scaler: Scaler applied to raw feature vectors before the model (optional); its
+            transform_rows scales each row the way a single-URL prediction is scaled
+        method: "integrated_gradients" or "gradient_x_input"
+        steps: Integration steps (integrated gradients only)
+    """
+    def __init__(self, model, model_version, scaler=None, method=ATTRIBUTION_METHOD, steps=ATTRIBUTION_STEPS,
+                 cache_size=ATTRIBUTION_CACHE_SIZE, budget_ms=ATTRIBUTION_BUDGET_MS):
+        if method not in METHODS:
+            raise ValueError(f"Unknown attribution method {method!r} (choose from {', '.join(METHODS)})")
+        self.model = model
+        self.model_version = model_version
+        self.scaler = scaler
+        self.method = method
+        self.steps = max(1, int(steps))
+        self.cache_size = cache_size
+        self.budget_ms = budget_ms
+        # Midpoint rule: the same fixed alphas for every input
+        self.alphas = ((np.arange(self.steps, dtype=np.float32) + 0.5) / self.steps).reshape(-1, 1)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "rows": 0, "computed": 0, "cache_hits": 0, "over_budget": 0, "total_ms": 0.0}
+
+        @tf.function(reduce_retracing=True)
+        def gradients(inputs):
+            with tf.GradientTape() as tape:
+                tape.watch(inputs)
+                outputs = self.model(inputs, training=False)
+            return tape.gradient(outputs, inputs)
+        self._gradients = gradients
+
+    def _key(self, vector):
+        digest = hashlib.sha1(np.ascontiguousarray(vector, dtype=np.float32).tobytes()).hexdigest()
+        return (self.model_version, self.method, self.steps, digest)
+
+    def _compute(self, scaled):
+        if self.method == "gradient_x_input":
+            grads = self._gradients(tf.constant(scaled)).numpy()
+            return scaled * grads
+        rows, width = scaled.shape
+        # (rows * steps, width): every interpolation step of every row in one pass
+        path = (scaled[:, None, :] * self.alphas[None, :, :]).reshape(rows * self.steps, width)
+        grads = self._gradients(tf.constant(path)).numpy().reshape(rows, self.steps, width)
+        return scaled * grads.mean(axis=1)
+
+    def attribute(self, vectors):
+        """
+        Attributions of a batch of raw feature vectors.
+
+        Args:
+            vectors: (batch, width) raw model input vectors
+
+        Returns:
+            numpy.ndarray: (batch, width) float32 attributions in model
+                output units (integrated gradients sum to roughly
+                f(x) - f(0))
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        result = np.zeros(vectors.shape, dtype=np.float32)
+        keys = [self._key(vector) for vector in vectors]
+        missing = []
+        with self._lock:
+            for row, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(row)
+                    cache_lookups.inc("attributions", "miss")
+                else:
+                    self._cache.move_to_end(key)
+                    result[row] = cached
+                    cache_lookups.inc("attributions", "hit")
+
+        start = time.perf_counter()
+        if missing:
+            with stage_duration.time("attributions"), span("attributions", rows=len(missing), method=self.method):
+                inputs = vectors[missing] if self.scaler is None else self.scaler.transform_rows(vectors[missing])
+                computed = self._compute(inputs).astype(np.float32)
+            result[missing] = computed
+            with self._lock:
+                for row, values in zip(missing, computed):
+                    self._cache[keys[row]] = values
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["rows"] += len(vectors)
+            self._stats["computed"] += len(missing)
+            self._stats["cache_hits"] += len(vectors) - len(missing)
+            self._stats["total_ms"] += elapsed_ms
+            if elapsed_ms > self.budget_ms:
+                self._stats["over_budget"] += 1
+        if elapsed_ms > self.budget_ms:
+            logger.warning("Attributions for %s vectors took %.1f ms (budget %.0f ms)", len(missing), elapsed_ms, self.budget_ms)
+        return result
+
+    def explain(self, vectors, layouts, top_k=ATTRIBUTION_TOP_K):
+        """
+        Attributions mapped to feature names.
+
+        Args:
+            vectors: (batch, width) raw model input vectors
+            layouts: Per row, the feature names of the leading vector
+                positions (the rest is padding)
+            top_k: Keep the k largest attributions by magnitude (None for all)
+
+        Returns:
+            list: Per row, dicts with name, value, attribution and share
+                (percent of the total absolute attribution), largest first
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        attributions = self.attribute(vectors)
+        explanations = []
+        for vector, row, names in zip(vectors, attributions, layouts):
+            width = min(len(names), len(row))
+            magnitude = np.abs(row[:width])
+            total = float(magnitude.sum())
+            order = np.argsort(-magnitude, kind='stable')
+            if top_k is not None:
+                order = order[:top_k]
+            explanations.append([{
+                "name": names[position],
+                "value": float(vector[position]),
+                "attribution": round(float(row[position]), 6),
+                "share": round(float(magnitude[position]) / total * 100, 2) if total > 0 else 0.0
+            } for position in order])
+        return explanations
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cache_size"] = len(self._cache)
+        stats["mean_ms_per_batch"] = round(stats["total_ms"] / stats["batches"], 3) if stats["batches"] else None
+        stats["total_ms"] = round(stats["total_ms"], 3)
+        stats.update({"method": self.method, "steps": self.steps, "budget_ms": self.budget_ms,
+                      "model_version": self.model_version})
+        return stats
+
+
+_attributor = None
+_attributor_lock = threading.Lock()
+
+
+def get_attributor(model, model_version, scaler=None):
+    """
+    Get the shared attributor, rebuilding it when the model changes.
+
+    Returns:
+        ModelAttributor: Attributor for the given model
+    """
+    global _attributor
+    with _attributor_lock:
+        if _attributor is None or _attributor.model is not model or _attributor.model_version != model_version:
+            _attributor = ModelAttributor(model, model_version, scaler=scaler)
+        return _attributor
+
+
+def get_attribution_stats():
+    """Statistics of the shared attributor, or None before first use"""
+    return _attributor.stats() if _attributor is not None else None
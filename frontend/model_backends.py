@@ -0,0 +1,425 @@
+"""
+Inference backends for the fraud model.
+
+Every backend scores a (rows, width) float32 matrix of scaled features and
+returns (rows, 1) float32 outputs:
+
+- keras: the loaded Keras model (reference)
+- tflite: an exported TensorFlow Lite flatbuffer, run by the LiteRT or
+  TFLite interpreter
+- onnx: an exported ONNX graph, run by onnxruntime
+- float16, int8: the numpy low-precision variants of model_quantization
+
+Exported files carry a sidecar JSON with the version of the .h5 they were
+converted from, so a stale export is never served. Serving an export only
+needs the runtime, not Keras, which keeps predictions working when a Keras
+upgrade can no longer load the .h5.
+
+    python model_backends.py export --format tflite
+    python model_backends.py export --format onnx
+    python model_backends.py parity --rows 2000
+    python model_backends.py bench --backends keras,tflite,onnx,float16
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+try:
+    from ai_edge_litert.interpreter import Interpreter as TFLiteInterpreter
+    tflite_available = True
+except ImportError:
+    try:
+        from tflite_runtime.interpreter import Interpreter as TFLiteInterpreter
+        tflite_available = True
+    except ImportError:
+        try:
+            import tensorflow as tf
+            TFLiteInterpreter = tf.lite.Interpreter
+            tflite_available = True
+        except (ImportError, AttributeError):
+            tflite_available = False
+
+try:
+    import onnxruntime
+    onnxruntime_available = True
+except ImportError:
+    onnxruntime_available = False
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+EXPORT_PATHS = {
+    "tflite": os.environ.get('MODEL_TFLITE_PATH', os.path.join(current_dir, 'models', 'fraud_model.tflite')),
+    "onnx": os.environ.get('MODEL_ONNX_PATH', os.path.join(current_dir, 'models', 'fraud_model.onnx')),
+}
+BACKENDS = ("keras", "tflite", "onnx", "float16", "int8")
+
+# Largest (max, mean) |difference| from keras accepted by the parity check, per backend.
+# int8 rounds every activation, so single rows may move further; its mean stays small.
+PARITY_TOLERANCE = {"tflite": (1e-5, 1e-6), "onnx": (1e-5, 1e-6), "float16": (1e-3, 1e-4), "int8": (0.15, 0.01)}
+
+
+class BackendError(RuntimeError):
+    """Raised when a backend cannot be loaded"""
+    pass
+
+
+class ModelBackend:
+    """Interface of an inference backend"""
+    name = None
+
+    def predict(self, inputs, verbose=0):
+        """
+        Score scaled inputs.
+
+        Args:
+            inputs: (rows, width) float32 scaled features
+
+        Returns:
+            numpy.ndarray: (rows, 1) float32 outputs
+        """
+        raise NotImplementedError
+
+    def describe(self):
+        return {"backend": self.name}
+
+
+class KerasBackend(ModelBackend):
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, inputs, verbose=0):
+        return np.asarray(self.model.predict(np.asarray(inputs, dtype=np.float32), verbose=verbose), dtype=np.float32)
+
+
+class QuantizedBackend(ModelBackend):
+    def __init__(self, quantized_model):
+        self.model = quantized_model
+        self.name = quantized_model.precision
+
+    def predict(self, inputs, verbose=0):
+        return self.model.predict(inputs)
+
+    def describe(self):
+        return {"backend": self.name, "model": self.model.summary()}
+
+
+class TFLiteBackend(ModelBackend):
+    """
+    TensorFlow Lite interpreter backend.
+
+    Interpreters are not thread-safe, so every thread gets its own, resized
+    whenever the batch size changes.
+    """
+    name = "tflite"
+
+    def __init__(self, path, num_threads=1):
+        if not tflite_available:
+            raise BackendError("No TFLite interpreter available (install ai-edge-litert or tensorflow)")
+        with open(path, 'rb') as f:
+            self.model_content = f.read()
+        self.path = path
+        self.num_threads = num_threads
+        self._local = threading.local()
+        self._interpreter()
+
+    def _interpreter(self):
+        state = getattr(self._local, "state", None)
+        if state is None:
+            interpreter = TFLiteInterpreter(model_content=self.model_content, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            input_detail = interpreter.get_input_details()[0]
+            state = self._local.state = {
+                "interpreter": interpreter,
+                "input": input_detail["index"],
+                "output": interpreter.get_output_details()[0]["index"],
+                "rows": int(input_detail["shape"][0])
+            }
+        return state
+
+    def predict(self, inputs, verbose=0):
+        inputs = np.ascontiguousarray(inputs, dtype=np.float32)
+        state = self._interpreter()
+        interpreter = state["interpreter"]
+        if state["rows"] != len(inputs):
+            interpreter.resize_tensor_input(state["input"], list(inputs.shape))
+            interpreter.allocate_tensors()
+            state["rows"] = len(inputs)
+        interpreter.set_tensor(state["input"], inputs)
+        interpreter.invoke()
+        return interpreter.get_tensor(state["output"]).copy()
+
+    def describe(self):
+        return {"backend": self.name, "path": self.path, "bytes": len(self.model_content)}
+
+
+class ONNXBackend(ModelBackend):
+    name = "onnx"
+
+    def __init__(self, path, num_threads=1):
+        if not onnxruntime_available:
+            raise BackendError("onnxruntime is not installed")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = path
+
+    def predict(self, inputs, verbose=0):
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(inputs, dtype=np.float32)})[0]
+
+    def describe(self):
+        return {"backend": self.name, "path": self.path}
+
+
+def export_metadata_path(path):
+    return path + ".json"
+
+
+def check_export(path, model_version):
+    """
+    Make sure an exported file exists and was converted from the deployed weights.
+
+    Raises:
+        BackendError: When the file is missing or stale
+    """
+    if not os.path.exists(path):
+        raise BackendError(f"{path} does not exist; run model_backends.py export")
+    try:
+        with open(export_metadata_path(path), 'r') as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        raise BackendError(f"{export_metadata_path(path)} is missing; re-export the model")
+    if metadata.get("model_version") != model_version:
+        raise BackendError(f"{path} was exported from model {metadata.get('model_version')}, "
+                           f"deployed model is {model_version}; re-export the model")
+
+
+def load_backend(name, model_version, keras_model=None, num_threads=1):
+    """
+    Load an inference backend.
+
+    Args:
+        name: One of BACKENDS
+        model_version: Version of the deployed .h5 weights
+        keras_model: Loaded Keras model (keras, float16 and int8 only)
+
+    Returns:
+        ModelBackend: The backend
+
+    Raises:
+        BackendError: When the backend cannot be used
+    """
+    if name == "keras":
+        if keras_model is None:
+            raise BackendError("No Keras model loaded")
+        return KerasBackend(keras_model)
+    if name in ("float16", "int8"):
+        if keras_model is None:
+            raise BackendError("No Keras model loaded")
+        from model_quantization import build_quantized_model
+        try:
+            return QuantizedBackend(build_quantized_model(keras_model, name, model_version))
+        except ValueError as e:
+            raise BackendError(str(e))
+    if name in EXPORT_PATHS:
+        path = EXPORT_PATHS[name]
+        check_export(path, model_version)
+        return TFLiteBackend(path, num_threads) if name == "tflite" else ONNXBackend(path, num_threads)
+    raise BackendError(f"Unknown backend {name!r} (choose from {', '.join(BACKENDS)})")
+
+
+def export_tflite(model):
+    """Convert a Keras model to a float32 TFLite flatbuffer"""
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    return converter.convert()
+
+
+def export_onnx(model):
+    """
+    Convert a Dense-stack Keras model to an ONNX graph.
+
+    The graph is built directly from the layer weights (MatMul, Add and the
+    activation per layer), so no converter package is needed.
+    """
+    import onnx
+    from onnx import helper, numpy_helper, TensorProto
+    from model_quantization import dense_stack
+
+    layers = dense_stack(model)
+    activations = {"relu": "Relu", "sigmoid": "Sigmoid", "tanh": "Tanh", "linear": None}
+    nodes, initializers = [], []
+    current = "input"
+    for i, (kernel, bias, activation) in enumerate(layers):
+        initializers += [numpy_helper.from_array(kernel, f"kernel_{i}"), numpy_helper.from_array(bias, f"bias_{i}")]
+        nodes.append(helper.make_node("MatMul", [current, f"kernel_{i}"], [f"matmul_{i}"]))
+        nodes.append(helper.make_node("Add", [f"matmul_{i}", f"bias_{i}"], [f"dense_{i}"]))
+        current = f"dense_{i}"
+        if activations[activation]:
+            nodes.append(helper.make_node(activations[activation], [current], [f"{activation}_{i}"]))
+            current = f"{activation}_{i}"
+    nodes.append(helper.make_node("Identity", [current], ["output"]))
+    graph = helper.make_graph(
+        nodes, "fraud_model",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["rows", layers[0][0].shape[0]])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["rows", layers[-1][0].shape[1]])],
+        initializers
+    )
+    onnx_model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], producer_name="model_backends")
+    onnx_model.ir_version = 8
+    onnx.checker.check_model(onnx_model)
+    return onnx_model.SerializeToString()
+
+
+def export_model(model, model_version, fmt, path=None):
+    """
+    Export the Keras model and record which weights it came from.
+
+    Returns:
+        str: Path of the exported file
+    """
+    path = path or EXPORT_PATHS[fmt]
+    content = export_tflite(model) if fmt == "tflite" else export_onnx(model)
+    with open(path, 'wb') as f:
+        f.write(content)
+    with open(export_metadata_path(path), 'w') as f:
+        json.dump({
+            "format": fmt,
+            "model_version": model_version,
+            "exported_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "bytes": len(content)
+        }, f, indent=2)
+    logger.info("Exported %s model (%s bytes) to %s", fmt, len(content), path)
+    return path
+
+
+def sample_inputs(rows, width, seed=0):
+    """
+    Random scaled inputs shaped like production ones.
+
+    Single predictions scale every non-zero feature to +-1, so inputs are
+    mostly -1/0/1 with some fractional values for good measure.
+    """
+    rng = np.random.default_rng(seed)
+    inputs = rng.choice(np.array([-1.0, 0.0, 1.0], dtype=np.float32), size=(rows, width), p=[0.05, 0.45, 0.5])
+    fractional = rng.random((rows, width)) < 0.1
+    inputs[fractional] = rng.uniform(-1, 1, fractional.sum()).astype(np.float32)
+    return inputs
+
+
+def parity(backends, inputs, reference="keras"):
+    """
+    Compare every backend with the reference backend on the same inputs.
+
+    Returns:
+        dict: backend -> max and mean absolute output difference, tolerances and pass flag
+    """
+    expected = backends[reference].predict(inputs)
+    report = {}
+    for name, backend in backends.items():
+        if name == reference:
+            continue
+        difference = np.abs(backend.predict(inputs).astype(np.float64) - expected)
+        max_tolerance, mean_tolerance = PARITY_TOLERANCE.get(name, (1e-5, 1e-6))
+        report[name] = {
+            "max_abs_diff": float(difference.max()),
+            "mean_abs_diff": float(difference.mean()),
+            "tolerance": {"max": max_tolerance, "mean": mean_tolerance},
+            "ok": bool(difference.max() <= max_tolerance and difference.mean() <= mean_tolerance)
+        }
+    return report
+
+
+def benchmark(backends, inputs, iterations=200):
+    """
+    Single-row latency and batch throughput of each backend.
+
+    Returns:
+        dict: backend -> p50/p95 single-row latency in ms and batch rows per second
+    """
+    results = {}
+    for name, backend in backends.items():
+        row = inputs[:1]
+        for _ in range(10):
+            backend.predict(row)
+        durations = []
+        for i in range(iterations):
+            single = inputs[i % len(inputs):i % len(inputs) + 1]
+            start = time.perf_counter()
+            backend.predict(single)
+            durations.append(time.perf_counter() - start)
+        durations.sort()
+        backend.predict(inputs)
+        start = time.perf_counter()
+        backend.predict(inputs)
+        batch_seconds = time.perf_counter() - start
+        results[name] = {
+            "single_p50_ms": round(durations[len(durations) // 2] * 1000, 4),
+            "single_p95_ms": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 4),
+            "batch_rows": len(inputs),
+            "batch_rows_per_sec": round(len(inputs) / batch_seconds, 1) if batch_seconds else None
+        }
+    return results
+
+
+def load_backends(names, model_version, keras_model):
+    """Load the named backends, skipping (and logging) those that are unavailable"""
+    backends = {}
+    for name in names:
+        try:
+            backends[name] = load_backend(name, model_version, keras_model)
+        except BackendError as e:
+            logger.warning("Skipping backend %s: %s", name, e)
+    return backends
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the model and compare inference backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Convert the .h5 model")
+    export.add_argument("--format", choices=sorted(EXPORT_PATHS), required=True)
+    export.add_argument("-o", "--output", help="Output path (default: next to the .h5)")
+    for name, help_text in (("parity", "Check backends against Keras; exit 1 on a mismatch"),
+                            ("bench", "Latency and throughput per backend")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--backends", default=",".join(BACKENDS))
+        command.add_argument("--rows", type=int, default=2000, help="Sample inputs")
+        command.add_argument("--vectors", help=".npy file of raw feature vectors instead of random inputs")
+        command.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from model_service import get_model, get_scaler, get_model_version
+
+    model = get_model()
+    if args.command == "export":
+        export_model(model, get_model_version(), args.format, args.output)
+        return 0
+
+    if args.vectors:
+        inputs = get_scaler().transform_rows(np.load(args.vectors)[:args.rows])
+    else:
+        inputs = sample_inputs(args.rows, int(model.input_shape[-1]))
+    names = [name.strip() for name in args.backends.split(',') if name.strip()]
+    backends = load_backends(dict.fromkeys(["keras"] + names), get_model_version(), model)
+    if args.command == "parity":
+        report = parity(backends, inputs)
+        print(json.dumps(report, indent=2))
+        return 0 if all(entry["ok"] for entry in report.values()) else 1
+    print(json.dumps(benchmark(backends, inputs, args.iterations), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""
+Low-precision inference for the fraud model.
+
+The model is a small stack of Dense layers, so it can be run as a few numpy
+matrix products without Keras. Two variants are supported:
+
+- float16: weights and the activations passed between layers are kept in
+  float16; products are accumulated in float32.
+- int8: weights are quantized per output unit and layer inputs per tensor,
+  with activation scales from a calibration run over stored feature vectors.
+  Products of int8 values are summed in float32, which is exact at these
+  layer sizes, so the results equal integer arithmetic.
+
+numpy has no fast float16 or int8 matrix product, so the low precision saves
+memory per row and per weight while the arithmetic runs on float32 BLAS.
+
+    python model_quantization.py calibrate --history data/history_details.db
+    python model_quantization.py calibrate --vectors vectors.npy --sample 20000
+    python model_quantization.py report --vectors vectors.npy
+
+calibrate writes the activation scales and an accuracy-drift report of both
+variants against the float32 Keras model to MODEL_CALIBRATION; report only
+prints the drift report.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_CALIBRATION = os.environ.get('MODEL_CALIBRATION', os.path.join(current_dir, 'models', 'fraud_model.calibration.json'))
+# Rows per matrix product; bounds the float32 scratch memory of large batches
+QUANTIZED_BATCH_ROWS = int(os.environ.get('QUANTIZED_BATCH_ROWS', 65536))
+
+PRECISIONS = ("float16", "int8")
+# Boundaries of get_risk_level() in app.py, for counting risk level changes
+RISK_THRESHOLDS = (20, 50, 75)
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-np.clip(x, -88, 88))),
+    "tanh": np.tanh,
+}
+
+
+class QuantizationError(ValueError):
+    """Raised when a model or calibration cannot be used for low-precision inference"""
+    pass
+
+
+def dense_stack(model):
+    """
+    Get the layers of a model made only of Dense layers.
+
+    Returns:
+        list: (kernel, bias, activation name) per layer, float32
+
+    Raises:
+        QuantizationError: For any other architecture
+    """
+    layers = []
+    for layer in getattr(model, 'layers', None) or []:
+        if layer.__class__.__name__ == 'InputLayer':
+            continue
+        if layer.__class__.__name__ != 'Dense':
+            raise QuantizationError(f"Unsupported layer {layer.__class__.__name__} ({layer.name})")
+        activation = layer.get_config().get('activation', 'linear')
+        if activation not in _ACTIVATIONS:
+            raise QuantizationError(f"Unsupported activation {activation} ({layer.name})")
+        weights = layer.get_weights()
+        kernel = np.asarray(weights[0], dtype=np.float32)
+        bias = np.asarray(weights[1], dtype=np.float32) if len(weights) > 1 else np.zeros(kernel.shape[1], np.float32)
+        layers.append((kernel, bias, activation))
+    if not layers:
+        raise QuantizationError("Model has no Dense layers")
+    return layers
+
+
+def calibrate(layers, inputs, percentile=99.99):
+    """
+    Measure the input range of every layer on sample inputs.
+
+    Args:
+        layers: Result of dense_stack
+        inputs: (rows, width) scaled model inputs
+        percentile: Percentile of the absolute values used as the range, so
+            single outliers do not stretch the quantization grid
+
+    Returns:
+        list: int8 scale (range / 127) of each layer's input
+    """
+    scales = []
+    x = np.asarray(inputs, dtype=np.float32)
+    for kernel, bias, activation in layers:
+        bound = float(np.percentile(np.abs(x), percentile)) if x.size else 0.0
+        scales.append(bound / 127 if bound > 0 else 1.0)
+        x = _ACTIVATIONS[activation](x @ kernel + bias)
+    return scales
+
+
+class QuantizedModel:
+    """
+    Low-precision copy of a Dense-stack model with a Keras-like predict().
+
+    Args:
+        layers: Result of dense_stack
+        precision: "float16" or "int8"
+        input_scales: Calibrated input scales per layer (int8 only)
+    """
+    def __init__(self, layers, precision, input_scales=None):
+        if precision not in PRECISIONS:
+            raise QuantizationError(f"Unknown precision {precision!r} (choose from {', '.join(PRECISIONS)})")
+        self.precision = precision
+        self.activations = [activation for _, _, activation in layers]
+        self.biases = [bias for _, bias, _ in layers]
+        if precision == "float16":
+            self.kernels = [kernel.astype(np.float16) for kernel, _, _ in layers]
+            # float16 values are exact in float32; kept once so predict() does not convert per call
+            self._compute_kernels = [kernel.astype(np.float32) for kernel in self.kernels]
+            self.input_scales = None
+            return
+
+        if input_scales is None or len(input_scales) != len(layers):
+            raise QuantizationError("int8 inference needs one calibrated input scale per layer")
+        self.input_scales = [float(scale) for scale in input_scales]
+        self.kernels = []
+        self.kernel_scales = []
+        for kernel, _, _ in layers:
+            # Symmetric per output unit
+            bound = np.abs(kernel).max(axis=0)
+            scale = np.where(bound > 0, bound / 127, 1.0).astype(np.float32)
+            self.kernels.append(np.clip(np.rint(kernel / scale), -127, 127).astype(np.int8))
+            self.kernel_scales.append(scale)
+        self._compute_kernels = [kernel.astype(np.float32) for kernel in self.kernels]
+        self._output_scales = [input_scale * kernel_scale
+                               for input_scale, kernel_scale in zip(self.input_scales, self.kernel_scales)]
+
+    @classmethod
+    def from_keras(cls, model, precision, input_scales=None):
+        return cls(dense_stack(model), precision, input_scales)
+
+    def quantize_inputs(self, inputs):
+        """
+        Convert scaled inputs to the stored form of the first layer.
+
+        Bulk jobs can keep feature matrices in this form: 1 byte per value
+        for int8 and 2 for float16 instead of 4.
+        """
+        inputs = np.asarray(inputs, dtype=np.float32)
+        if self.precision == "float16":
+            return inputs.astype(np.float16)
+        return self._quantize(inputs, self.input_scales[0])
+
+    @staticmethod
+    def _quantize(x, scale):
+        return np.clip(np.rint(x / scale), -127, 127).astype(np.int8)
+
+    def _forward(self, x):
+        last = len(self._compute_kernels) - 1
+        for i, (kernel, bias, activation) in enumerate(zip(self._compute_kernels, self.biases, self.activations)):
+            if self.precision == "float16":
+                x = x.astype(np.float32) @ kernel
+                x += bias
+            else:
+                if x.dtype != np.int8:
+                    x = self._quantize(x, self.input_scales[i])
+                x = x.astype(np.float32) @ kernel
+                x *= self._output_scales[i]
+                x += bias
+            x = _ACTIVATIONS[activation](x)
+            if i < last and self.precision == "float16":
+                x = x.astype(np.float16)
+        return x
+
+    def predict(self, inputs, batch_size=QUANTIZED_BATCH_ROWS, verbose=0):
+        """
+        Score scaled inputs (float32, or the output of quantize_inputs).
+
+        Returns:
+            numpy.ndarray: (rows, outputs) float32 model outputs
+        """
+        inputs = np.asarray(inputs)
+        if inputs.ndim == 1:
+            inputs = inputs.reshape(1, -1)
+        if len(inputs) <= batch_size:
+            return self._forward(inputs).astype(np.float32, copy=False)
+        return np.concatenate([self._forward(inputs[start:start + batch_size])
+                               for start in range(0, len(inputs), batch_size)]).astype(np.float32, copy=False)
+
+    def weight_bytes(self):
+        return int(sum(kernel.nbytes for kernel in self.kernels) + sum(bias.nbytes for bias in self.biases))
+
+    def summary(self):
+        return f"Quantized model ({self.precision}, {self.weight_bytes()} weight bytes)"
+
+
+def load_calibration(path=MODEL_CALIBRATION):
+    """
+    Read a calibration file.
+
+    Returns:
+        dict or None: The calibration, None when the file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def build_quantized_model(model, precision, model_version, calibration_path=MODEL_CALIBRATION):
+    """
+    Build the low-precision model of a deployment.
+
+    Args:
+        model: Loaded Keras model
+        precision: "float16" or "int8"
+        model_version: Version of the loaded weights; int8 calibrations must match it
+
+    Returns:
+        QuantizedModel: The model to serve predictions with
+
+    Raises:
+        QuantizationError: When the model or calibration cannot be used
+    """
+    if precision == "float16":
+        return QuantizedModel.from_keras(model, precision)
+    calibration = load_calibration(calibration_path)
+    if calibration is None:
+        raise QuantizationError(f"No calibration at {calibration_path}; run model_quantization.py calibrate")
+    if calibration.get("model_version") != model_version:
+        raise QuantizationError(f"Calibration is for model {calibration.get('model_version')}, "
+                                f"loaded model is {model_version}; recalibrate")
+    return QuantizedModel.from_keras(model, precision, calibration["input_scales"])
+
+
+def drift_report(reference_scores, quantized_scores, thresholds=RISK_THRESHOLDS):
+    """
+    Compare quantized scores with the float32 scores.
+
+    Args:
+        reference_scores: float32 model outputs (0-1)
+        quantized_scores: Low-precision outputs for the same rows
+
+    Returns:
+        dict: Absolute score differences in points (0-100) and the share of
+            rows whose risk level changes
+    """
+    reference = np.asarray(reference_scores, dtype=np.float64).ravel() * 100
+    quantized = np.asarray(quantized_scores, dtype=np.float64).ravel() * 100
+    difference = np.abs(quantized - reference)
+    levels_reference = np.searchsorted(thresholds, reference, side='right')
+    levels_quantized = np.searchsorted(thresholds, quantized, side='right')
+    return {
+        "rows": int(len(reference)),
+        "mean_abs_diff": round(float(difference.mean()), 5) if len(difference) else 0.0,
+        "p99_abs_diff": round(float(np.percentile(difference, 99)), 5) if len(difference) else 0.0,
+        "max_abs_diff": round(float(difference.max()), 5) if len(difference) else 0.0,
+        "risk_level_changes": int((levels_reference != levels_quantized).sum()),
+        "risk_level_change_rate": round(float((levels_reference != levels_quantized).mean()), 6) if len(difference) else 0.0
+    }
+
+
+def _rows_per_second(predict, inputs, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(inputs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(len(inputs) / best, 1) if best else None
+
+
+def evaluate(model, inputs, input_scales):
+    """
+    Drift, throughput and memory of each precision against the float32 model.
+
+    Args:
+        model: Keras model
+        inputs: (rows, width) scaled inputs
+        input_scales: int8 calibration
+
+    Returns:
+        dict: precision -> report
+    """
+    inputs = np.asarray(inputs, dtype=np.float32)
+    reference = model.predict(inputs, verbose=0)
+    layers = dense_stack(model)
+    float32_bytes = sum(kernel.nbytes + bias.nbytes for kernel, bias, _ in layers)
+    report = {"float32": {
+        "rows_per_sec": _rows_per_second(lambda x: model.predict(x, verbose=0), inputs),
+        "weight_bytes": int(float32_bytes),
+        "input_bytes_per_row": int(inputs.shape[1] * 4)
+    }}
+    for precision in PRECISIONS:
+        quantized = QuantizedModel(layers, precision, input_scales)
+        stored = quantized.quantize_inputs(inputs)
+        report[precision] = {
+            **drift_report(reference, quantized.predict(stored)),
+            "rows_per_sec": _rows_per_second(quantized.predict, stored),
+            "weight_bytes": quantized.weight_bytes(),
+            "input_bytes_per_row": int(stored.itemsize * stored.shape[1])
+        }
+    return report
+
+
+def vectors_from_history(path, limit=None):
+    """
+    Collect raw feature vectors from the full results kept for the history.
+
+    Returns:
+        numpy.ndarray: (rows, width) float32 vectors laid out by FEATURE_SCHEMA
+    """
+    from feature_schema import FEATURE_SCHEMA
+
+    conn = sqlite3.connect(path)
+    query = "SELECT body FROM details ORDER BY created_at DESC"
+    rows = []
+    for (body,) in conn.execute(query + (f" LIMIT {int(limit)}" if limit else "")):
+        features = json.loads(zlib.decompress(body)).get("feature_values")
+        if isinstance(features, dict) and "error" not in features:
+            rows.append(FEATURE_SCHEMA.row_from_dict(features))
+    conn.close()
+    if not rows:
+        return np.zeros((0, FEATURE_SCHEMA.width), dtype=np.float32)
+    return np.stack(rows)
+
+
+def _load_sample(args):
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = vectors_from_history(args.history, args.sample)
+    if len(vectors) > args.sample:
+        rng = np.random.default_rng(args.seed)
+        vectors = vectors[rng.choice(len(vectors), args.sample, replace=False)]
+    if not len(vectors):
+        raise SystemExit("No stored feature vectors found")
+    return vectors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate and evaluate low-precision inference")
+    parser.add_argument("command", choices=["calibrate", "report"])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--history", default=os.path.join(current_dir, 'data', 'history_details.db'),
+                        help="History details database to sample feature vectors from")
+    source.add_argument("--vectors", help=".npy file of raw (unscaled) feature vectors")
+    parser.add_argument("--sample", type=int, default=20000, help="Maximum number of vectors used")
+    parser.add_argument("--percentile", type=float, default=99.99, help="Range percentile of activations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=MODEL_CALIBRATION, help="Calibration file to write")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from model_service import get_model, get_scaler, get_model_version
+
+    model = get_model()
+    inputs = get_scaler().transform_rows(_load_sample(args))
+    input_scales = calibrate(dense_stack(model), inputs, args.percentile)
+    report = evaluate(model, inputs, input_scales)
+    if args.command == "calibrate":
+        calibration = {
+            "model_version": get_model_version(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "sample_rows": int(len(inputs)),
+            "percentile": args.percentile,
+            "input_scales": input_scales,
+            "report": report
+        }
+        with open(args.output, 'w') as f:
+            json.dump(calibration, f, indent=2)
+        logger.info("Wrote calibration of %s vectors to %s", len(inputs), args.output)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,13 @@
 import os
+import time
+import hashlib
 import logging
+import threading
 import numpy as np
 import tensorflow as tf
 
+from metrics import model_warmup_duration
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -10,6 +15,32 @@ logger = logging.getLogger(__name__)
 # Global variables for model and scaler
 _model = None
 _scaler = None
+_model_version = None
+_inference_model = None
+_threads = None
+_warmup = {"state": "pending"}
+_warmup_lock = threading.Lock()
+
+# Precision predictions are served with: "float32" (the Keras model), "float16" or "int8"
+MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'float32').lower()
+# Runtime predictions are served with: keras, tflite, onnx, float16 or int8 (see model_backends.py);
+# defaults to the Keras model, or to the low-precision model chosen by MODEL_PRECISION
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'keras' if MODEL_PRECISION == 'float32' else MODEL_PRECISION).lower()
+
+# TensorFlow thread pools; unset: the CPUs available to this process shared by the gunicorn
+# workers (MODEL_WORKERS, else WEB_CONCURRENCY), 0: TensorFlow's default of one thread per core
+MODEL_INTRA_OP_THREADS = os.environ.get('MODEL_INTRA_OP_THREADS')
+MODEL_INTER_OP_THREADS = os.environ.get('MODEL_INTER_OP_THREADS')
+MODEL_WORKERS = int(os.environ.get('MODEL_WORKERS', os.environ.get('WEB_CONCURRENCY', 1)))
+# Warmup when the service starts: "sync" (before the module finishes importing),
+# "background" (in a thread; /ready reports 503 until it is done) or "off"
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', 'sync').lower()
+# Batch sizes predicted once each during warmup
+MODEL_WARMUP_BATCH_SIZES = tuple(int(size) for size in os.environ.get('MODEL_WARMUP_BATCH_SIZES', '1,64').split(',')
+                                 if size.strip())
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(current_dir, 'models', 'fraud_model.h5')
 
 class DirectScaler:
     """
@@ -26,6 +57,13 @@ class DirectScaler:
             
             return X / max_values
         return X
+    
+    def transform_rows(self, X):
+        """Normalize every row on its own, as transform() does for single-row batches"""
+        X = np.asarray(X, dtype=np.float32)
+        magnitude = np.abs(X)
+        magnitude[magnitude < 1e-10] = 1.0
+        return X / magnitude
 
 def create_model():
     """
@@ -35,21 +73,20 @@ def create_model():
         tf.keras.Sequential: The loaded or created model
     """
     # Define the path to the model file
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = os.path.join(current_dir, 'models', 'fraud_model.h5')
+    model_path = MODEL_PATH
     
     # First try to load the user's model
     if os.path.exists(model_path):
         try:
-            logger.info(f"Loading model from {model_path}")
+            logger.info("Loading model from %s", model_path)
             model = tf.keras.models.load_model(model_path)
             logger.info("Successfully loaded user's model")
             return model
         except Exception as e:
-            logger.error(f"Error loading model: {str(e)}")
+            logger.error("Error loading model: %s", e)
             logger.info("Falling back to creating a new model")
     else:
-        logger.warning(f"Model file not found at {model_path}")
+        logger.warning("Model file not found at %s", model_path)
     
     # If loading fails, create a new model
     logger.info("Creating model with fixed architecture")
@@ -82,13 +119,16 @@ def initialize():
     
     logger.info("Initializing model service")
     
+    # Thread pools can only be set before TensorFlow runs its first operation
+    configure_threads()
+    
     # Create scaler
     try:
         _scaler = DirectScaler()
         logger.info("Scaler created successfully")
         scaler_success = True
     except Exception as e:
-        logger.error(f"Error creating scaler: {str(e)}")
+        logger.error("Error creating scaler: %s", e)
         _scaler = None
         scaler_success = False
     
@@ -97,12 +137,116 @@ def initialize():
         _model = create_model()
         model_success = True
     except Exception as e:
-        logger.error(f"Error creating model: {str(e)}")
+        logger.error("Error creating model: %s", e)
         _model = None
         model_success = False
     
+    start_warmup()
+    
     return model_success, scaler_success
 
+def _available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def configure_threads():
+    """
+    Size TensorFlow's thread pools so that the workers on a host do not oversubscribe its cores.
+    
+    Returns:
+        dict: Intra-op and inter-op thread counts in effect (0: TensorFlow's default)
+    """
+    global _threads
+    if _threads is not None:
+        return _threads
+    per_worker = max(1, _available_cpus() // max(1, MODEL_WORKERS))
+    intra_op = int(MODEL_INTRA_OP_THREADS) if MODEL_INTRA_OP_THREADS is not None else per_worker
+    inter_op = int(MODEL_INTER_OP_THREADS) if MODEL_INTER_OP_THREADS is not None else min(2, per_worker)
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError as e:
+        # TensorFlow already ran an operation in this process
+        logger.warning("Could not set TensorFlow thread pools: %s", e)
+    _threads = {
+        "intra_op": tf.config.threading.get_intra_op_parallelism_threads(),
+        "inter_op": tf.config.threading.get_inter_op_parallelism_threads(),
+        "available_cpus": _available_cpus(),
+        "workers": MODEL_WORKERS
+    }
+    logger.info("TensorFlow thread pools: %s intra-op, %s inter-op", _threads['intra_op'], _threads['inter_op'])
+    return _threads
+
+def warmup(batch_sizes=MODEL_WARMUP_BATCH_SIZES):
+    """
+    Run the serving backend once for every batch size, so that graph tracing
+    and buffer allocation happen before the first request.
+    
+    Args:
+        batch_sizes: Batch sizes to predict
+    
+    Returns:
+        dict: Warmup state with the total and per-batch-size durations
+    """
+    from model_backends import sample_inputs
+    
+    with _warmup_lock:
+        _warmup.clear()
+        _warmup.update({"state": "running", "started_at": time.time()})
+    start = time.perf_counter()
+    durations = {}
+    try:
+        model = get_inference_model()
+        if model is None:
+            raise ValueError("Model is not initialized")
+        width = get_input_width() or 96
+        for size in batch_sizes:
+            batch_start = time.perf_counter()
+            model.predict(sample_inputs(size, width))
+            durations[str(size)] = round((time.perf_counter() - batch_start) * 1000, 2)
+        state = {"state": "done"}
+    except Exception as e:
+        logger.error("Model warmup failed: %s", e)
+        state = {"state": "failed", "error": str(e)}
+    elapsed = time.perf_counter() - start
+    backend = get_inference_backend() or "none"
+    model_warmup_duration.observe(elapsed, backend, state["state"])
+    state.update({"duration_ms": round(elapsed * 1000, 2), "batch_ms": durations, "backend": backend})
+    with _warmup_lock:
+        _warmup.update(state)
+    logger.info("Model warmup %s in %.0f ms (%s backend)", state['state'], state['duration_ms'], backend)
+    return get_warmup_status()
+
+def start_warmup():
+    """Start the warmup configured by MODEL_WARMUP, once per process"""
+    with _warmup_lock:
+        if _warmup["state"] != "pending":
+            return
+        if MODEL_WARMUP == 'off':
+            _warmup["state"] = "off"
+            return
+        _warmup["state"] = "running"
+    if MODEL_WARMUP == 'background':
+        threading.Thread(target=warmup, name="model-warmup", daemon=True).start()
+    else:
+        warmup()
+
+def get_warmup_status():
+    """
+    Get the warmup state.
+    
+    Returns:
+        dict: state (pending, running, done, failed or off), duration and per-batch-size timings
+    """
+    with _warmup_lock:
+        return dict(_warmup)
+
+def is_ready():
+    """Whether requests can be served at full speed: warmup finished (or was turned off)"""
+    return get_warmup_status()["state"] in ("done", "failed", "off")
+
 def get_model():
     """
     Get the model instance, initializing if necessary.
@@ -127,6 +271,45 @@ def get_scaler():
         initialize()
     return _scaler
 
+def get_inference_model():
+    """
+    Get the backend predictions are served with.
+    
+    MODEL_BACKEND selects the Keras model, an exported TFLite or ONNX file,
+    or a low-precision copy of the Keras model. Exported files are served
+    even when the .h5 cannot be loaded; any other failure falls back to the
+    Keras model.
+    
+    Returns:
+        model_backends.ModelBackend, or None without a model
+    """
+    global _inference_model
+    if _inference_model is None:
+        from model_backends import load_backend, KerasBackend, BackendError
+        model = get_model()
+        if MODEL_BACKEND != 'keras':
+            try:
+                _inference_model = load_backend(MODEL_BACKEND, get_model_version(), model,
+                                                num_threads=configure_threads()["intra_op"] or 1)
+                logger.info("Serving predictions with the %s backend: %s", MODEL_BACKEND, _inference_model.describe())
+            except (BackendError, OSError, ValueError) as e:
+                logger.error("Could not load the %s backend, serving the Keras model: %s", MODEL_BACKEND, e)
+        if _inference_model is None and model is not None:
+            _inference_model = KerasBackend(model)
+    return _inference_model
+
+def get_inference_backend():
+    """Name of the backend returned by get_inference_model()"""
+    model = get_inference_model()
+    return model.name if model is not None else None
+
+def get_inference_precision():
+    """Precision of the backend returned by get_inference_model()"""
+    backend = get_inference_backend()
+    if backend is None:
+        return None
+    return backend if backend in ('float16', 'int8') else 'float32'
+
 def predict(features):
     """
     Make a prediction using the model.
@@ -137,7 +320,7 @@ def predict(features):
     Returns:
         numpy.ndarray: Prediction result
     """
-    model = get_model()
+    model = get_inference_model()
     scaler = get_scaler()
     
     if model is None:
@@ -150,6 +333,39 @@ def predict(features):
     # Make prediction
     return model.predict(features)
 
+def get_input_width():
+    """
+    Get the number of inputs the model expects.
+    
+    Returns:
+        int: Size of the last input dimension, or None without a model
+    """
+    model = get_model()
+    try:
+        return int(model.input_shape[-1]) if model is not None else None
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def get_model_version():
+    """
+    Get a short identifier of the deployed model weights.
+    
+    Returns:
+        str: First 12 hex digits of the model file's SHA-256, or "fallback"
+            when the model file is missing and an untrained model is used
+    """
+    global _model_version
+    if _model_version is None:
+        try:
+            digest = hashlib.sha256()
+            with open(MODEL_PATH, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            _model_version = digest.hexdigest()[:12]
+        except OSError:
+            _model_version = "fallback"
+    return _model_version
+
 def get_status():
     """
     Get the status of the model service.
@@ -168,6 +384,11 @@ def get_status():
         "model_type": str(type(_model)) if _model else "None",
         "scaler_loaded": _scaler is not None,
         "status": "operational" if _model is not None and _scaler is not None else "error",
+        "model_version": get_model_version(),
+        "backend": get_inference_backend(),
+        "precision": get_inference_precision(),
+        "threads": configure_threads(),
+        "warmup": get_warmup_status(),
         "using_fallback": False
     }
     
@@ -0,0 +1,448 @@
+"""
+Record and replay of outbound provider traffic.
+
+In record mode every call the app makes through its provider seams (DNS,
+ip-api geo, WHOIS, crt.sh, TLS probes and page fetches) is written to a
+SQLite archive together with its outcome and how long it took. Response
+bodies are stored once per distinct content, zlib-compressed.
+
+In replay mode the same seams answer from the archive instead of the
+network, optionally sleeping for the recorded duration (scaled), so load
+tests and benchmarks run locally and deterministically.
+
+    PROVIDER_ARCHIVE_MODE=record PROVIDER_ARCHIVE=data/capture.db python app.py
+    PROVIDER_ARCHIVE_MODE=replay PROVIDER_ARCHIVE=data/capture.db PROVIDER_REPLAY_LATENCY=1 python app.py
+    python provider_archive.py info data/capture.db
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import argparse
+import importlib
+import threading
+from datetime import datetime, date
+
+from metrics import outbound_calls
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_MODE = os.environ.get('PROVIDER_ARCHIVE_MODE', '').lower()
+ARCHIVE_PATH = os.environ.get('PROVIDER_ARCHIVE', os.path.join(current_dir, 'data', 'provider_archive.db'))
+# Multiplier for recorded durations during replay; 0 answers immediately
+REPLAY_LATENCY = float(os.environ.get('PROVIDER_REPLAY_LATENCY', 0))
+# What a replay does for a lookup that was never recorded: "error" or "live"
+REPLAY_MISS = os.environ.get('PROVIDER_REPLAY_MISS', 'error').lower()
+
+# Module attributes of app.py that perform network calls, by provider
+PROVIDER_SEAMS = {
+    "dns": "_request_dns",
+    "geo": "_request_geo",
+    "whois": "_request_whois",
+    "ct": "_request_ct",
+    "page": "_request_page",
+    "tls": "_probe_ssl_certificate",
+}
+
+# Providers whose seam returns a requests.Response
+_RESPONSE_PROVIDERS = ("geo", "ct")
+
+
+class ReplayMissError(LookupError):
+    """Raised in replay mode for a lookup the archive has no recording of"""
+
+
+class ReplayedProviderError(Exception):
+    """Stand-in for a recorded exception whose type cannot be rebuilt"""
+
+
+class ReplayedResponse:
+    """The parts of requests.Response the app reads"""
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+
+class ReplayedWhois(dict):
+    """WHOIS record with attribute access, like python-whois results"""
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            return None
+
+
+def _encode_value(value):
+    # datetimes inside WHOIS records survive the round trip
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, (list, tuple)):
+        return [_encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _encode_value(item) for key, item in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _decode_hook(obj):
+    if "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    if "$date" in obj:
+        return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def encode_result(provider, value):
+    """Turn a seam's return value into JSON-serializable data"""
+    if provider in _RESPONSE_PROVIDERS:
+        return {"status_code": value.status_code, "text": value.text}
+    if provider == "whois":
+        return _encode_value(dict(value) if isinstance(value, dict) else vars(value))
+    return _encode_value(value)
+
+
+def decode_result(provider, data):
+    """Rebuild what the seam returned from encode_result data"""
+    if provider in _RESPONSE_PROVIDERS:
+        return ReplayedResponse(data["status_code"], data["text"])
+    if provider == "whois":
+        return ReplayedWhois(data)
+    return data
+
+
+def encode_error(error):
+    error_type = type(error)
+    return {
+        "type": f"{error_type.__module__}.{error_type.__qualname__}",
+        "args": [_encode_value(arg) for arg in error.args]
+    }
+
+
+def decode_error(data):
+    """
+    Rebuild a recorded exception with its original type when possible.
+
+    Keeping the type matters: not-found errors (NXDOMAIN, unknown WHOIS
+    domains) are treated differently by the circuit breakers.
+    """
+    module_name, _, qualname = data["type"].rpartition(".")
+    try:
+        error_type = importlib.import_module(module_name)
+        for part in qualname.split("."):
+            error_type = getattr(error_type, part)
+        if isinstance(error_type, type) and issubclass(error_type, BaseException):
+            return error_type(*data["args"])
+    except Exception:
+        pass
+    return ReplayedProviderError(f"{data['type']}: {', '.join(str(arg) for arg in data['args'])}")
+
+
+class ProviderArchive:
+    """
+    SQLite archive of provider interactions.
+
+    Args:
+        path: Database file (created when recording)
+    """
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        self.mode = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._index = None
+        self._bodies = {}
+        self._positions = {}
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS interactions ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, provider TEXT NOT NULL, key TEXT NOT NULL, "
+                "outcome TEXT NOT NULL, elapsed REAL NOT NULL, recorded_at REAL NOT NULL, body_hash TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS interactions_lookup ON interactions (provider, key)")
+            conn.execute("CREATE TABLE IF NOT EXISTS bodies (hash TEXT PRIMARY KEY, body BLOB NOT NULL)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, provider, key, outcome, payload, elapsed):
+        """
+        Store one interaction.
+
+        Args:
+            provider: Provider name
+            key: Lookup key (domain, IP or URL)
+            outcome: "ok" or "error"
+            payload: Encoded result or error
+            elapsed: Seconds the call took
+        """
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO bodies VALUES (?, ?)", (digest, zlib.compress(body)))
+            conn.execute(
+                "INSERT INTO interactions (provider, key, outcome, elapsed, recorded_at, body_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (provider, key, outcome, elapsed, time.time(), digest)
+            )
+        with self._lock:
+            self._stats["recorded"] += 1
+
+    def _load_index(self):
+        index = {}
+        rows = self._connection().execute(
+            "SELECT provider, key, outcome, elapsed, body_hash FROM interactions ORDER BY id"
+        ).fetchall()
+        for provider, key, outcome, elapsed, digest in rows:
+            index.setdefault((provider, key), []).append((outcome, elapsed, digest))
+        return index
+
+    def _body(self, digest):
+        payload = self._bodies.get(digest)
+        if payload is None:
+            row = self._connection().execute("SELECT body FROM bodies WHERE hash = ?", (digest,)).fetchone()
+            payload = json.loads(zlib.decompress(row[0]), object_hook=_decode_hook)
+            self._bodies[digest] = payload
+        return payload
+
+    def next_interaction(self, provider, key):
+        """
+        Get the next recorded interaction for a lookup.
+
+        Repeated lookups of the same key cycle through its recordings in the
+        order they were captured.
+
+        Returns:
+            tuple or None: (outcome, payload, elapsed), None if never recorded
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            entries = self._index.get((provider, key))
+            if not entries:
+                self._stats["misses"] += 1
+                return None
+            position = self._positions.get((provider, key), 0)
+            self._positions[(provider, key)] = position + 1
+            self._stats["replayed"] += 1
+            outcome, elapsed, digest = entries[position % len(entries)]
+            payload = self._body(digest)
+        return outcome, payload, elapsed
+
+    def keys(self, provider, outcome=None):
+        """Recorded keys of a provider in capture order (optionally only one outcome)"""
+        query = "SELECT key FROM interactions WHERE provider = ?"
+        params = [provider]
+        if outcome:
+            query += " AND outcome = ?"
+            params.append(outcome)
+        seen = {}
+        for (key,) in self._connection().execute(query + " ORDER BY id", params):
+            seen.setdefault(key, None)
+        return list(seen)
+
+    def summary(self):
+        """
+        Describe the archive contents.
+
+        Returns:
+            dict: Per provider the number of interactions, distinct keys,
+                errors and recorded latency
+        """
+        conn = self._connection()
+        providers = {}
+        rows = conn.execute(
+            "SELECT provider, COUNT(*), COUNT(DISTINCT key), SUM(outcome = 'error'), AVG(elapsed), MAX(elapsed) "
+            "FROM interactions GROUP BY provider ORDER BY provider"
+        ).fetchall()
+        for provider, count, keys, errors, mean, longest in rows:
+            providers[provider] = {
+                "interactions": count,
+                "keys": keys,
+                "errors": errors,
+                "mean_ms": round(mean * 1000, 2),
+                "max_ms": round(longest * 1000, 2)
+            }
+        bodies, stored = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM bodies").fetchone()
+        return {"path": self.path, "providers": providers, "bodies": bodies, "stored_bytes": stored}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mode"] = self.mode
+        stats["path"] = self.path
+        return stats
+
+
+def recording(provider, func, archive):
+    """
+    Wrap a seam so every call is written to the archive.
+
+    Returns:
+        callable: Behaves like func
+    """
+    def record_call(key):
+        start = time.perf_counter()
+        try:
+            value = func(key)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            try:
+                archive.record(provider, key, "error", encode_error(e), elapsed)
+            except Exception as record_error:
+                logger.warning("Could not record %s interaction: %s", provider, record_error)
+            raise
+        elapsed = time.perf_counter() - start
+        try:
+            archive.record(provider, key, "ok", encode_result(provider, value), elapsed)
+        except Exception as record_error:
+            logger.warning("Could not record %s interaction: %s", provider, record_error)
+        return value
+    return record_call
+
+
+def replaying(provider, archive, latency_scale=REPLAY_LATENCY, live=None):
+    """
+    Build a seam that answers from the archive.
+
+    Args:
+        provider: Provider name
+        archive: ProviderArchive
+        latency_scale: Multiplier for the recorded durations (0 = no delay)
+        live: Original seam used for unrecorded lookups (None raises ReplayMissError)
+
+    Returns:
+        callable: Replacement for the seam
+    """
+    def replay_call(key):
+        interaction = archive.next_interaction(provider, key)
+        if interaction is None:
+            outbound_calls.inc(provider, "replay_miss")
+            if live is not None:
+                return live(key)
+            raise ReplayMissError(f"No recorded {provider} interaction for {key}")
+        outcome, payload, elapsed = interaction
+        if latency_scale > 0:
+            time.sleep(elapsed * latency_scale)
+        if outcome == "error":
+            raise decode_error(payload)
+        return decode_result(provider, payload)
+    return replay_call
+
+
+def install_providers(module, providers):
+    """
+    Replace provider seams of a module.
+
+    Args:
+        module: Module holding the seams (app)
+        providers: Provider name to replacement function (a subset is fine)
+
+    Returns:
+        callable: Restores the original functions
+    """
+    originals = {}
+    for provider, func in providers.items():
+        attribute = PROVIDER_SEAMS[provider]
+        originals[attribute] = getattr(module, attribute)
+        setattr(module, attribute, func)
+
+    def restore():
+        for attribute, original in originals.items():
+            setattr(module, attribute, original)
+    return restore
+
+
+def install_recording(module, archive):
+    """Record every provider call of module into archive; returns a restore function"""
+    return install_providers(module, {
+        provider: recording(provider, getattr(module, attribute), archive)
+        for provider, attribute in PROVIDER_SEAMS.items()
+    })
+
+
+def install_replay(module, archive, latency_scale=REPLAY_LATENCY, miss=REPLAY_MISS):
+    """Answer every provider call of module from archive; returns a restore function"""
+    return install_providers(module, {
+        provider: replaying(provider, archive, latency_scale,
+                            live=getattr(module, attribute) if miss == "live" else None)
+        for provider, attribute in PROVIDER_SEAMS.items()
+    })
+
+
+def configure_provider_archive(module, mode=ARCHIVE_MODE, path=ARCHIVE_PATH):
+    """
+    Enable recording or replay from the environment.
+
+    Args:
+        module: The app module
+        mode: "record", "replay" or empty for neither
+
+    Returns:
+        ProviderArchive or None: The active archive
+    """
+    if mode not in ("record", "replay"):
+        if mode:
+            logger.warning("Unknown PROVIDER_ARCHIVE_MODE %r, provider calls go to the network", mode)
+        return None
+    if mode == "replay" and not os.path.exists(path):
+        raise FileNotFoundError(f"Provider archive {path} does not exist")
+    archive = ProviderArchive(path)
+    if mode == "record":
+        install_recording(module, archive)
+        logger.warning("Recording provider traffic to %s", path)
+    else:
+        install_replay(module, archive)
+        logger.warning("Replaying provider traffic from %s (latency x%s, misses: %s)", path, REPLAY_LATENCY, REPLAY_MISS)
+    archive.mode = mode
+    return archive
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect provider record/replay archives")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info = subparsers.add_parser("info", help="Summarize an archive")
+    info.add_argument("path")
+    keys = subparsers.add_parser("keys", help="List recorded keys of a provider")
+    keys.add_argument("path")
+    keys.add_argument("provider", choices=sorted(PROVIDER_SEAMS))
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+    archive = ProviderArchive(args.path)
+    if args.command == "info":
+        print(json.dumps(archive.summary(), indent=2))
+    else:
+        for key in archive.keys(args.provider):
+            print(key)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
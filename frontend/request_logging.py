@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+import logging.handlers
+from datetime import datetime, timezone
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# "json" for one structured record per line, "text" for readable local output
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+# Share of requests whose verbose payloads (bodies, results, provider data) are logged
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 0.01))
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Headers carrying credentials; their values never reach the logs
+REDACTED_HEADERS = frozenset({'authorization', 'proxy-authorization', 'cookie', 'set-cookie', 'x-api-key'})
+
+# Correlation id and payload sampling decision of the current request
+_request_id = contextvars.ContextVar('request_id', default=None)
+_sampled = contextvars.ContextVar('log_sampled', default=False)
+
+_listener = None
+_handler = None
+
+
+def get_request_id():
+    """Get the correlation id of the current request, or None outside requests"""
+    return _request_id.get()
+
+
+def set_request_id(request_id=None, sampled=None):
+    """
+    Bind a correlation id (and payload sampling decision) to the current context.
+
+    Returns:
+        str: The request id
+    """
+    request_id = request_id or uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    _sampled.set(random.random() < LOG_PAYLOAD_SAMPLE_RATE if sampled is None else sampled)
+    return request_id
+
+
+def is_sampled():
+    """Whether verbose payloads are logged for the current request"""
+    return _sampled.get()
+
+
+def log_payload(log, message, level=logging.INFO, **fields):
+    """
+    Log a verbose payload for sampled requests only.
+
+    Field values may be callables; they are only evaluated when the record is
+    actually emitted. With DEBUG enabled every request is logged.
+
+    Args:
+        log: Logger to write to
+        message: Short event description
+        level: Level of the record
+        **fields: Structured fields (values or zero-argument callables); a
+            "headers" field has its credential headers redacted
+    """
+    if not log.isEnabledFor(level):
+        return
+    if not (is_sampled() or log.isEnabledFor(logging.DEBUG)):
+        return
+    resolved = {key: value() if callable(value) else value for key, value in fields.items()}
+    if resolved.get("headers") is not None:
+        resolved["headers"] = redact_headers(resolved["headers"])
+    log.log(level, message, extra={"fields": resolved})
+
+
+def redact_headers(headers):
+    """
+    Copy request headers with the values of credential headers replaced.
+
+    Args:
+        headers: Mapping of header names to values
+
+    Returns:
+        dict: Headers safe to log
+    """
+    return {name: "[redacted]" if name.lower() in REDACTED_HEADERS else value
+            for name, value in dict(headers).items()}
+
+
+def _json_default(value):
+    # numpy scalars and datetimes that end up in payloads
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the request id while still on the logging thread"""
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; structured fields come from extra={"fields": ...}"""
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry["request_id"] = request_id
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=_json_default)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable single-line records with the request id and structured fields appended"""
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = None
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += " " + json.dumps(fields, default=_json_default)
+        return text
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the request thread.
+
+    Records are handed to the listener thread unformatted, so message
+    interpolation and JSON encoding happen off the request path. When the
+    queue is full the record is dropped and counted.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens in the listener; only make the record safe to hand over
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """
+    Route all logging through a bounded queue to a background writer thread.
+
+    Replaces the root logger's handlers; safe to call more than once.
+
+    Args:
+        level: Root log level
+        fmt: "json" or "text"
+        stream: Output stream (default: stderr)
+    """
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    _handler = handler
+    return handler
+
+
+def get_logging_stats():
+    """
+    Get queue statistics of the background log writer.
+
+    Returns:
+        dict or None: Queue depth and dropped records, None if not configured
+    """
+    if _handler is None:
+        return None
+    return {
+        "queue_depth": _handler.queue.qsize(),
+        "queue_capacity": _handler.queue.maxsize,
+        "dropped": _handler.dropped,
+        "payload_sample_rate": LOG_PAYLOAD_SAMPLE_RATE
+    }
+
+
+def init_request_logging(app, access_logger_name='request'):
+    """
+    Give every Flask request a correlation id and one structured access record.
+
+    The id is taken from an incoming X-Request-ID header when present and is
+    returned in the response headers.
+    """
+    from flask import request, g
+
+    access_log = logging.getLogger(access_logger_name)
+
+    @app.before_request
+    def _start_request_log():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        # Only accept short printable ids from clients
+        request_id = incoming if 0 < len(incoming) <= 64 and incoming.isprintable() else None
+        g.request_id = set_request_id(request_id)
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_log(response):
+        request_id = getattr(g, 'request_id', None)
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        started = getattr(g, 'request_started', None)
+        if started is not None and access_log.isEnabledFor(logging.INFO):
+            access_log.info("%s %s %s", request.method, request.path, response.status_code, extra={"fields": {
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+            }})
+        return response
+
+    @app.teardown_request
+    def _clear_request_log(exc=None):
+        # Threads are reused across requests; do not leak the id into later records
+        _request_id.set(None)
+        _sampled.set(False)
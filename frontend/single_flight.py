@@ -0,0 +1,220 @@
+"""
+Single-flight coalescing of identical concurrent work.
+
+When several requests ask for the same key at once, the first one (the
+leader) runs the work and the others wait for its outcome instead of
+repeating it. Within a process the waiters get a copy of the leader's result
+or of its exception. With a lock directory configured, leaders in other worker
+processes are found through striped fcntl locks, and their results are
+handed over as JSON files in the same directory.
+"""
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from metrics import coalesced_requests
+from circuit_breaker import fresh_error
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+    fcntl_available = True
+except ImportError:
+    fcntl_available = False
+
+# Directory for cross-process coalescing (unset: within each process only)
+COALESCE_LOCK_DIR = os.environ.get('COALESCE_LOCK_DIR')
+# Number of lock files keys are spread over
+COALESCE_LOCK_STRIPES = int(os.environ.get('COALESCE_LOCK_STRIPES', 1024))
+# Longest a waiter waits for a leader before doing the work itself
+COALESCE_WAIT_TIMEOUT = float(os.environ.get('COALESCE_WAIT_TIMEOUT', 60))
+# Age after which handed-over result files are deleted
+COALESCE_RESULT_TTL = float(os.environ.get('COALESCE_RESULT_TTL', 60))
+
+
+def _json_default(value):
+    # numpy scalars and datetimes that end up in result dictionaries
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key.
+
+    Args:
+        level: Name used in metrics and stats, e.g. "url" or "enrichment"
+        lock_dir: Directory for cross-process coalescing (None: threads only)
+    """
+    def __init__(self, level, lock_dir=COALESCE_LOCK_DIR, wait_timeout=COALESCE_WAIT_TIMEOUT,
+                 stripes=COALESCE_LOCK_STRIPES, result_ttl=COALESCE_RESULT_TTL):
+        self.level = level
+        self.wait_timeout = wait_timeout
+        self.stripes = stripes
+        self.result_ttl = result_ttl
+        self.lock_dir = None
+        if lock_dir:
+            if fcntl_available:
+                self.lock_dir = os.path.join(lock_dir, level)
+                os.makedirs(self.lock_dir, exist_ok=True)
+            else:
+                logger.warning("fcntl not available, requests are only coalesced within each process")
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "thread_waiters": 0, "process_waiters": 0, "timeouts": 0}
+        self._last_prune = time.time()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) unless the same key is already in flight.
+
+        Args:
+            key: String identifying the work
+            func: Function doing the work
+
+        Returns:
+            The result of func, from this call or a concurrent one
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                call.waiters += 1
+                self._stats["thread_waiters"] += 1
+
+        if not leader:
+            coalesced_requests.inc(self.level, "thread")
+            if call.done.wait(self.wait_timeout):
+                if call.error is not None:
+                    raise fresh_error(call.error)
+                return copy.deepcopy(call.result)
+            with self._lock:
+                self._stats["timeouts"] += 1
+            logger.warning("Gave up waiting for in-flight %s work on %r", self.level, key)
+            return func(*args, **kwargs)
+
+        try:
+            if self.lock_dir is not None:
+                result = self._do_across_processes(key, func, args, kwargs)
+            else:
+                result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            raise
+        call.result = result
+        with self._lock:
+            del self._calls[key]
+            shared = call.waiters > 0
+        call.done.set()
+        # Waiters copy from call.result, so the caller may change its result freely
+        return copy.deepcopy(result) if shared else result
+
+    def _do_across_processes(self, key, func, args, kwargs):
+        digest = hashlib.sha1(f"{self.level}:{key}".encode('utf-8')).hexdigest()
+        stripe = int(digest[:8], 16) % self.stripes
+        result_path = os.path.join(self.lock_dir, f"{digest}.json")
+        with open(os.path.join(self.lock_dir, f"{stripe}.lock"), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker holds the stripe: wait for it, then use its result if it was for this key
+                waiting_since = time.time()
+                if not self._wait_for_lock(lock_file):
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    return func(*args, **kwargs)
+                result = self._read_result(result_path, waiting_since)
+                if result is not None:
+                    coalesced_requests.inc(self.level, "process")
+                    with self._lock:
+                        self._stats["process_waiters"] += 1
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    return result[0]
+            try:
+                result = func(*args, **kwargs)
+                self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._prune()
+
+    def _wait_for_lock(self, lock_file):
+        deadline = time.time() + self.wait_timeout
+        delay = 0.005
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+    def _write_result(self, path, result):
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({"finished_at": time.time(), "result": result}, f, default=_json_default)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Could not hand over %s result: %s", self.level, e)
+
+    def _read_result(self, path, not_before):
+        """The result written at or after not_before, as a 1-tuple, or None"""
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("finished_at", 0) < not_before:
+            return None
+        return (entry["result"],)
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < self.result_ttl:
+                return
+            self._last_prune = now
+        for name in os.listdir(self.lock_dir):
+            if not name.endswith(('.json', '.tmp')):
+                continue
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.result_ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        stats["cross_process"] = self.lock_dir is not None
+        return stats
@@ -7,7 +7,8 @@ const ApiService = (function() {
 // API endpoints
     const API_ENDPOINTS = {
         predict: '/predict',
-        analyze: '/analyze'
+        analyze: '/analyze',
+        analyzeStream: '/api/analyze-url/stream'
     };
     
     /**
@@ -92,10 +93,96 @@ const ApiService = (function() {
         });
     }
     
+    /**
+     * Streams a progressive analysis of a URL over Server-Sent Events
+     * @param {string} url - The URL to analyze
+     * @param {Function} onEvent - Called with (eventName, data) for every event
+     * @param {Object} headers - Optional extra request headers (e.g. Authorization)
+     * @returns {Promise} A promise that resolves with the final analysis result
+     */
+    function streamAnalysis(url, onEvent, headers = {}) {
+        console.log('ApiService: Streaming analysis for URL:', url);
+        
+        // Ensure URL has scheme
+        let processedUrl = url;
+        if (!url.startsWith('http://') && !url.startsWith('https://')) {
+            processedUrl = 'http://' + url;
+        }
+        
+        // fetch (not EventSource) so the request can be a POST with auth headers
+        return fetch(API_ENDPOINTS.analyzeStream, {
+            method: 'POST',
+            headers: Object.assign({
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            }, headers),
+            body: JSON.stringify({ url: processedUrl })
+        })
+        .then(response => {
+            if (!response.ok || !response.body) {
+                throw new Error(`API request failed with status ${response.status}`);
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let finalResult = null;
+            
+            // Parse "event: name\ndata: json\n\n" messages as chunks arrive
+            function handleMessage(message) {
+                let eventName = 'message';
+                let data = '';
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                if (!data) return;
+                
+                const payload = JSON.parse(data);
+                if (eventName === 'error') {
+                    throw new Error(payload.details || payload.message || 'Streaming analysis failed');
+                }
+                if (eventName === 'result') {
+                    finalResult = payload;
+                }
+                onEvent(eventName, payload);
+            }
+            
+            function pump() {
+                return reader.read().then(({ done, value }) => {
+                    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                    let boundary = buffer.indexOf('\n\n');
+                    while (boundary !== -1) {
+                        handleMessage(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                        boundary = buffer.indexOf('\n\n');
+                    }
+                    if (done) {
+                        if (!finalResult) {
+                            throw new Error('Stream ended before the final result');
+                        }
+                        return finalResult;
+                    }
+                    return pump();
+                });
+            }
+            
+            return pump();
+        })
+        .catch(error => {
+            console.error('ApiService: Error streaming analysis:', error);
+            throw error;
+        });
+    }
+    
     // Public API
     return {
         predictUrl,
-        generateAnalysisReport
+        generateAnalysisReport,
+        streamAnalysis
     };
 })();
 
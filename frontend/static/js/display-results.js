@@ -2319,6 +2319,12 @@ const displayResults = (function() {
       console.error("Error displaying HTML security:", error);
     }
     
+    try {
+      displayTimingWaterfall(data);
+    } catch (error) {
+      console.error("Error displaying timing waterfall:", error);
+    }
+    
     // Update the result URL
     const resultUrlElement = document.getElementById('resultUrl');
     if (resultUrlElement && data.url) {
@@ -2331,6 +2337,146 @@ const displayResults = (function() {
     }
   }
   
+  /**
+   * Renders the per-step timing breakdown (requested with ?timings=1) as a waterfall
+   * @param {Object} data - The analysis data from the API
+   */
+  function displayTimingWaterfall(data) {
+    let container = document.getElementById('timingWaterfall');
+    
+    if (!data.timings) {
+      if (container) container.style.display = 'none';
+      return;
+    }
+    
+    // Create the container below the results if the page does not have one
+    if (!container) {
+      const resultsSection = document.getElementById('results');
+      if (!resultsSection) return;
+      container = document.createElement('div');
+      container.id = 'timingWaterfall';
+      container.style.marginTop = '20px';
+      container.style.padding = '16px';
+      container.style.borderRadius = '8px';
+      container.style.backgroundColor = 'rgba(15, 23, 42, 0.6)';
+      resultsSection.appendChild(container);
+    }
+    container.style.display = 'block';
+    container.innerHTML = '';
+    
+    const root = data.timings;
+    const total = Math.max(root.duration_ms, 0.001);
+    
+    const title = document.createElement('h3');
+    title.textContent = `Timing breakdown (${root.duration_ms.toFixed(1)} ms)`;
+    title.style.marginBottom = '12px';
+    container.appendChild(title);
+    
+    // Flatten the span tree depth-first, keeping the nesting depth for indentation
+    const rows = [];
+    (function walk(node, depth) {
+      rows.push({ node, depth });
+      (node.children || []).forEach(child => walk(child, depth + 1));
+    })(root, 0);
+    
+    rows.forEach(({ node, depth }) => {
+      const row = document.createElement('div');
+      row.style.display = 'flex';
+      row.style.alignItems = 'center';
+      row.style.fontSize = '0.8rem';
+      row.style.height = '20px';
+      
+      const label = document.createElement('div');
+      label.style.width = '240px';
+      label.style.flexShrink = '0';
+      label.style.paddingLeft = `${depth * 12}px`;
+      label.style.whiteSpace = 'nowrap';
+      label.style.overflow = 'hidden';
+      label.style.textOverflow = 'ellipsis';
+      const cached = node.attrs && node.attrs.cached ? ' (cached)' : '';
+      label.textContent = node.name + cached;
+      label.title = `${node.name}: starts at ${node.start_ms} ms, takes ${node.duration_ms} ms`;
+      
+      const track = document.createElement('div');
+      track.style.position = 'relative';
+      track.style.flexGrow = '1';
+      track.style.height = '12px';
+      
+      const bar = document.createElement('div');
+      const share = node.duration_ms / total;
+      bar.style.position = 'absolute';
+      bar.style.left = `${(node.start_ms / total) * 100}%`;
+      bar.style.width = `max(${share * 100}%, 2px)`;
+      bar.style.height = '100%';
+      bar.style.borderRadius = '2px';
+      bar.style.backgroundColor = share > 0.25 ? '#f87171' : share > 0.05 ? '#fbbf24' : '#34d399';
+      track.appendChild(bar);
+      
+      const duration = document.createElement('div');
+      duration.style.width = '80px';
+      duration.style.flexShrink = '0';
+      duration.style.textAlign = 'right';
+      duration.textContent = `${node.duration_ms.toFixed(1)} ms`;
+      
+      row.appendChild(label);
+      row.appendChild(track);
+      row.appendChild(duration);
+      container.appendChild(row);
+    });
+  }
+  
+  /**
+   * Displays the sections available so far while a streamed analysis is running
+   * @param {Object} data - Partial analysis data accumulated from stream events
+   */
+  function displayPartialResults(data) {
+    if (!data || typeof data !== 'object') return;
+    
+    // Show the results section as soon as the first stage arrives
+    const resultsSection = document.getElementById('results');
+    if (resultsSection) {
+      resultsSection.style.display = 'block';
+    }
+    
+    const resultUrlElement = document.getElementById('resultUrl');
+    if (resultUrlElement && data.url) {
+      resultUrlElement.textContent = data.url;
+    }
+    
+    // Preliminary (lexical) score until the model score arrives
+    if (typeof data.score !== 'undefined') {
+      try {
+        updateScoreDisplay(data.score);
+      } catch (error) {
+        console.error("Error displaying preliminary score:", error);
+      }
+    }
+    
+    if (data.suspicious_patterns) {
+      try {
+        displaySuspiciousPatterns(data);
+      } catch (error) {
+        console.error("Error displaying suspicious patterns:", error);
+      }
+    }
+    
+    if (data.domain_info && data.url) {
+      try {
+        displayDomainInfo(data);
+      } catch (error) {
+        console.error("Error displaying domain info:", error);
+      }
+    }
+    
+    if (data.html_security) {
+      try {
+        displayHtmlSecurity(data);
+      } catch (error) {
+        console.error("Error displaying HTML security:", error);
+      }
+    }
+  }
+  
   /**
    * Displays section risk meters based on section totals
    * @param {Object} data - The analysis data from the API
@@ -2718,11 +2864,13 @@ const displayResults = (function() {
   // Public API
   return {
     displayAllResults,
+    displayPartialResults,
     displayRiskFactors,
     displayDomainInfo,
     displaySuspiciousPatterns,
     displayFeatureDetails,
     displayHtmlSecurity,
+    displayTimingWaterfall,
     increaseIPResolutionRisk
   };
 })();
@@ -2730,6 +2878,7 @@ const displayResults = (function() {
 // Make display functions globally available
 window.displayResults = displayResults.displayAllResults;
 window.displayAllResults = displayResults.displayAllResults;
+window.displayPartialResults = displayResults.displayPartialResults;
 
 // Export displayResults object for ES module import
 if (typeof module !== 'undefined' && module.exports) {
@@ -73,8 +73,59 @@ document.addEventListener('DOMContentLoaded', function() {
         // Log analysis start
         console.log('Analyzing URL:', url);
         
+        // Opening the page with ?timings=1 requests a per-step timing breakdown,
+        // which only the single-response endpoint returns
+        const wantTimings = new URLSearchParams(window.location.search).get('timings') === '1';
+        
+        // Prefer the progressive stream so partial results show immediately
+        if (!wantTimings && window.ApiService && window.ApiService.streamAnalysis && window.ReadableStream) {
+            analyzeUrlStreaming(url);
+            return;
+        }
+        
+        analyzeUrlOnce(url, wantTimings);
+    }
+    
+    // Function to analyze URL over the Server-Sent Events stream
+    function analyzeUrlStreaming(url) {
+        const partial = {};
+        
+        window.ApiService.streamAnalysis(url, (eventName, payload) => {
+            if (eventName === 'result') return;
+            
+            // Merge each stage into the partial result and re-render it
+            Object.assign(partial, payload);
+            loadingElement.style.display = 'none';
+            if (typeof displayPartialResults === 'function') {
+                displayPartialResults(partial);
+            }
+        })
+        .then(data => {
+            console.log('Streamed analysis complete, data:', data);
+            loadingElement.style.display = 'none';
+            
+            if (typeof displayAllResults === 'function') {
+                displayAllResults(data, url);
+            }
+            resultsElement.style.display = 'block';
+            
+            // Save scan to Firestore if user is logged in
+            saveToFirestore(url, data);
+            
+            // Re-enable button
+            submitButton.disabled = false;
+        })
+        .catch(error => {
+            // Fall back to the single-response endpoint
+            console.warn('Streaming analysis failed, falling back to /predict:', error);
+            analyzeUrlOnce(url);
+        });
+    }
+    
+    // Function to analyze URL with a single request
+    function analyzeUrlOnce(url, withTimings) {
         // Make AJAX request to analyze URL
-        fetch('/predict', {
+        fetch(withTimings ? '/predict?timings=1' : '/predict', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
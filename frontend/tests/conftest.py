@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+FRONTEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FRONTEND_DIR)
+
+# Importing app must not touch the repo's data files, start background workers or
+# spend the test run warming up the model
+_data_dir = tempfile.mkdtemp(prefix="fraud-tests-")
+os.environ.setdefault('JOB_QUEUE_PATH', os.path.join(_data_dir, 'jobs.db'))
+os.environ.setdefault('HISTORY_JOURNAL_PATH', os.path.join(_data_dir, 'history_journal.jsonl'))
+os.environ.setdefault('HISTORY_DETAILS_PATH', os.path.join(_data_dir, 'history_details.db'))
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('FEATURE_STORE', 'off')
+os.environ.setdefault('MODEL_WARMUP', 'off')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
@@ -0,0 +1,57 @@
+import pytest
+
+from brand_lookalike import BRAND_OWNED_DOMAINS, DEFAULT_BRANDS, BrandIndex, find_lookalike, lookalike_features
+
+
+@pytest.mark.parametrize("host, brand, technique", [
+    ("paypa1-secure.xyz", "PayPal", "digit_substitution"),
+    ("xn--pypal-4ve.com", "PayPal", "homoglyph"),
+    ("rnicrosoft.com", "Microsoft", "homoglyph"),
+    ("gooogle.com", "Google", "typo"),
+    ("paypal-login.com", "PayPal", "combosquat"),
+    ("paypal.account-check.net", "PayPal", "subdomain"),
+])
+def test_lookalikes_are_detected(host, brand, technique):
+    found = find_lookalike(host)
+    assert (found.brand, found.technique) == (brand, technique)
+
+
+@pytest.mark.parametrize("host", [
+    "google.com", "mail.google.com", "google.co.uk",
+    # Owned by the brand, but read as a combosquat or typo of it
+    "google-analytics.com", "www.google-analytics.com", "slack-edge.com", "a.slack-edge.com", "apples.com",
+    "example.com",
+])
+def test_brand_hosts_and_unrelated_hosts_are_not_flagged(host):
+    assert find_lookalike(host) is None
+
+
+def test_combosquats_are_medium_severity():
+    assert find_lookalike("paypal-login.com").severity == "medium"
+    assert lookalike_features("paypal-login.com")["brand_match"] == 0.5
+    assert find_lookalike("paypa1.com").severity == "high"
+    assert lookalike_features("paypa1.com")["brand_match"] == 1
+
+
+def test_brand_list_file_adds_owned_domains(tmp_path):
+    path = tmp_path / "brands.txt"
+    path.write_text("Acme Bank: acmebank.com +acmebank-cdn.net\n", encoding="utf-8")
+    index = BrandIndex.from_file(str(path), DEFAULT_BRANDS, BRAND_OWNED_DOMAINS)
+
+    assert index.match("acmebank-login.com").brand == "Acme Bank"
+    assert index.match("static.acmebank-cdn.net") is None
+    assert index.match("google-analytics.com") is None
+
+
+def test_suspicious_pattern_weighs_combosquats_less():
+    import app
+
+    def lookalike_pattern(url):
+        return next(p for p in app.check_suspicious_patterns(url, resolve=False) if p["pattern"].startswith("Lookalike"))
+
+    assert (lookalike_pattern("http://paypal-login.com/")["severity"],
+            lookalike_pattern("http://paypal-login.com/")["risk_score"]) == ("medium", 10)
+    assert (lookalike_pattern("http://paypa1.com/")["severity"],
+            lookalike_pattern("http://paypa1.com/")["risk_score"]) == ("high", 20)
+    assert not any(p["pattern"].startswith("Lookalike")
+                   for p in app.check_suspicious_patterns("https://www.google-analytics.com/", resolve=False))
@@ -0,0 +1,31 @@
+import time
+
+from feature_store import FeatureStore
+
+
+def test_expired_entries_are_pruned_periodically(tmp_path, monkeypatch):
+    store = FeatureStore(str(tmp_path / "features.db"), freshness={"whois": 60}, prune_interval=3600)
+    store.put_many("whois", {"old.example": {"age": 1}, "fresh.example": {"age": 2}})
+    store.flush_access()
+
+    later = time.time() + 120
+    monkeypatch.setattr(time, "time", lambda: later)
+    store.put("whois", "fresh.example", {"age": 3})
+    # Within the interval nothing is deleted
+    store.flush_access()
+    assert store.count() == 2
+
+    monkeypatch.setattr(time, "time", lambda: later + 3600)
+    store.put("whois", "fresh.example", {"age": 4})
+    store.flush_access()
+    assert store.count() == 1
+    assert store.get("whois", "fresh.example") == {"age": 4}
+    assert store.stats()["pruned"] == 1
+
+
+def test_prune_deletes_in_batches(tmp_path, monkeypatch):
+    store = FeatureStore(str(tmp_path / "features.db"), freshness={"ct": 60}, prune_interval=0)
+    store.put_many("ct", {f"host{i}.example": {"certs": i} for i in range(25)})
+    monkeypatch.setattr(time, "time", lambda: 1e12)
+    assert store.prune(batch_size=10) == 25
+    assert store.count() == 0
@@ -0,0 +1,61 @@
+import sqlite3
+
+import numpy as np
+
+from history_schema import HistoryDetailStore, build_history_record, content_hash
+from history_writer import HistoryWriter
+
+
+def sample_result():
+    return {
+        "url": "https://example.com/login",
+        "score": np.float32(72.5),
+        "risk_level": "high",
+        "feature_contributions": [{"name": "url_length", "value": 24, "contribution": 0.12}],
+        "analysis_date": "2026-01-01T00:00:00"
+    }
+
+
+class RecordingDetailStore:
+    def __init__(self):
+        self.stored = []
+
+    def put_many(self, results):
+        self.stored.extend(results)
+
+
+def test_enqueued_details_are_a_snapshot(tmp_path):
+    store = RecordingDetailStore()
+    writer = HistoryWriter(None, journal_path=str(tmp_path / "journal.jsonl"), detail_store=store)
+    result = sample_result()
+    doc = build_history_record(result["url"], result, "v1")
+    writer.enqueue("alice", doc, details=result)
+
+    # /predict adds the UI table after saving
+    result["feature_table"] = [{"feature": "url_length", "value": 24, "impact": 12.0}]
+    writer._store_details(writer._drain(block=False))
+
+    digest, details = store.stored[0]
+    assert "feature_table" not in details
+    assert content_hash(details) == digest == doc["contentHash"]
+
+
+def test_stored_details_round_trip(tmp_path):
+    store = HistoryDetailStore(str(tmp_path / "details.db"))
+    result = sample_result()
+    digest = content_hash(result)
+    store.put_many([(digest, result)])
+    assert store.get(digest)["risk_level"] == "high"
+
+
+def test_mismatched_details_are_treated_as_missing(tmp_path):
+    path = str(tmp_path / "details.db")
+    store = HistoryDetailStore(path)
+    result = sample_result()
+    digest = content_hash(result)
+    store.put_many([(digest, dict(result, risk_level="low"))])
+    assert store.get(digest) is None
+
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE details SET body = ? WHERE content_hash = ?", (b"not zlib", digest))
+    assert store.get(digest) is None
@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+from job_queue import JobQueue, JobWorkerPool
+
+
+def wait_for_job(queue, job_id, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get_job(job_id)
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.2)
+    pytest.fail(f"Job {job_id} did not finish within {timeout}s: {queue.get_job(job_id)['counts']}")
+
+
+def echo_task(url, options):
+    return {"url": url, "pid": os.getpid()}
+
+
+def test_thread_workers_complete_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    pool = JobWorkerPool(queue, echo_task, workers=2, poll_interval=0.05)
+    pool.start()
+    try:
+        job_id, _ = queue.submit(["https://a.example/", "https://b.example/"])
+        job = wait_for_job(queue, job_id, timeout=10)
+    finally:
+        pool.stop()
+    assert job["status"] == "completed"
+    assert [r["result"]["url"] for r in job["results"]] == ["https://a.example/", "https://b.example/"]
+
+
+def test_process_workers_running_the_app_complete_jobs(tmp_path, monkeypatch):
+    import app
+
+    # App configured for in-app process workers: the spawned workers re-import app
+    # and must not start a pool of their own while bootstrapping
+    monkeypatch.setenv('JOB_WORKERS', '2')
+    monkeypatch.setenv('JOB_WORKER_MODE', 'process')
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    pool = JobWorkerPool(queue, app.run_job_task, workers=2, mode="process", poll_interval=0.1,
+                         batch_context=app.feature_store_batch)
+    pool.start()
+    try:
+        # Trusted domains are decided by the lexical fast path, without network access
+        job_id, _ = queue.submit(["https://www.google.com/", "https://github.com/"],
+                                 options={"scoring": "tiered"})
+        job = wait_for_job(queue, job_id, timeout=120)
+        assert pool.status()["alive"] == 2
+    finally:
+        pool.stop()
+    assert job["status"] == "completed"
+    assert all(r["result"]["scoring_tier"] == "lexical" for r in job["results"])
+
+
+def test_claimed_tasks_run_inside_one_batch_context(tmp_path):
+    from contextlib import contextmanager
+
+    batches = []
+    current = []
+
+    @contextmanager
+    def record_batch(urls):
+        batches.append(list(urls))
+        current.append(urls)
+        yield
+        current.pop()
+
+    def task(url, options):
+        assert current, "task ran outside its batch context"
+        return {"url": url}
+
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    urls = [f"https://site{i}.example/" for i in range(5)]
+    job_id, _ = queue.submit(urls)
+    pool = JobWorkerPool(queue, task, workers=1, poll_interval=0.05, batch_size=3, batch_context=record_batch)
+    pool.start()
+    try:
+        job = wait_for_job(queue, job_id, timeout=10)
+    finally:
+        pool.stop()
+    assert job["status"] == "completed"
+    assert batches == [urls[:3], urls[3:]]
@@ -0,0 +1,47 @@
+import json
+import os
+
+import pytest
+
+import metrics
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_writes_its_own_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_snapshot_path", None)
+    monkeypatch.setattr(metrics, "_flush_thread", None)
+    requests_seen = metrics.counter("test_fork_requests_total", "Requests seen in the fork test")
+    metrics.start()
+    requests_seen.inc(amount=3)
+    # The parent flushed before forking, as a preloading master may have
+    metrics.flush()
+    parent_path = metrics._snapshot_path
+    parent_thread = metrics._flush_thread
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            requests_seen.inc()
+            metrics.flush()
+            report = {
+                "path": metrics._snapshot_path,
+                "thread_alive": metrics._flush_thread is not parent_thread and metrics._flush_thread.is_alive(),
+            }
+            os.write(write_end, json.dumps(report).encode())
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        report = json.loads(f.read())
+    os.waitpid(pid, 0)
+
+    assert report["thread_alive"]
+    assert report["path"] != parent_path
+    with open(parent_path) as f:
+        assert json.load(f)["metrics"]["test_fork_requests_total"]["samples"] == [[[], 3.0]]
+    with open(report["path"]) as f:
+        assert json.load(f)["metrics"]["test_fork_requests_total"]["samples"] == [[[], 1.0]]
+    # Parent and child add up to what was counted
+    assert "test_fork_requests_total 4.0" in metrics.generate_latest().splitlines()
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+class LookupFailed(Exception):
+    pass
+
+
+def traceback_depth(error):
+    depth, tb = 0, error.__traceback__
+    while tb is not None:
+        depth, tb = depth + 1, tb.tb_next
+    return depth
+
+
+def test_waiters_share_the_leader_result():
+    flight = SingleFlight("test", lock_dir=None)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"value": 1}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", work)))
+    leader.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(3)]
+    for thread in waiters:
+        thread.start()
+    while flight.stats()["thread_waiters"] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [{"value": 1}] * 4
+    # Every caller owns its copy
+    assert len({id(result) for result in results}) == 4
+
+
+def test_waiters_raise_their_own_copy_of_the_error():
+    flight = SingleFlight("test", lock_dir=None)
+    started, release = threading.Event(), threading.Event()
+    original = LookupFailed("provider down")
+
+    def work():
+        started.set()
+        release.wait(5)
+        raise original
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", work)
+        except LookupFailed as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=call) for _ in range(3)]
+    for thread in waiters:
+        thread.start()
+    while flight.stats()["thread_waiters"] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(5)
+
+    assert len(errors) == 4
+    copies = [e for e in errors if e is not original]
+    assert len(copies) == 3
+    assert all(str(e) == "provider down" for e in copies)
+    # Each copy carries only the frames of its own raise
+    assert max(traceback_depth(e) for e in copies) <= 2
+
+    with pytest.raises(LookupFailed):
+        flight.do("key", work)
@@ -0,0 +1,118 @@
+import time as real_time
+
+import pytest
+
+import tls_cache
+from tls_cache import TLSCertCache
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(tls_cache, "time", clock)
+    return clock
+
+
+class FakeProbe:
+    """TLS probe handing out certificates valid for a fixed time from now"""
+    def __init__(self, clock, lifetime=30 * 86400):
+        self.clock = clock
+        self.lifetime = lifetime
+        self.failing = False
+        self.calls = []
+
+    def __call__(self, host):
+        self.calls.append(host)
+        if self.failing:
+            return {"has_ssl": False, "error": "connection refused"}
+        valid_until = real_time.strftime("%b %d %H:%M:%S %Y GMT",
+                                         real_time.gmtime(self.clock.now + self.lifetime))
+        return {"has_ssl": True, "valid_until": valid_until, "serial": len(self.calls)}
+
+
+def drain(cache):
+    # Single-worker executor: a no-op finishing means the queued refreshes have too
+    cache._executor.submit(lambda: None).result(timeout=5)
+
+
+def test_certificate_is_served_from_cache(clock):
+    probe = FakeProbe(clock)
+    cache = TLSCertCache(probe, workers=1)
+
+    assert cache.get("Example.com")["has_ssl"]
+    assert cache.get("example.com")["has_ssl"]
+    assert probe.calls == ["Example.com"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_entry_expires_before_certificate_does(clock):
+    probe = FakeProbe(clock, lifetime=7200)
+    cache = TLSCertCache(probe, expiry_margin=3600, workers=1)
+    cache.get("example.com")
+
+    clock.now += 3599
+    cache.get("example.com")
+    assert len(probe.calls) == 1
+
+    clock.now += 2
+    cache.get("example.com")
+    assert len(probe.calls) == 2
+
+
+def test_popular_host_keeps_its_hits_across_refreshes(clock):
+    probe = FakeProbe(clock)
+    cache = TLSCertCache(probe, max_age=3600, prefetch_min_hits=2, prefetch_window=900, workers=1)
+    for _ in range(3):
+        cache.get("example.com")
+
+    clock.now += 3000
+    assert cache.refresh_due() == 1
+    drain(cache)
+    assert cache.get("example.com")["serial"] == 2
+
+    # Still popular: the next refresh does not wait for new lookups to add up
+    clock.now += 3000
+    assert cache.refresh_due() == 1
+    drain(cache)
+    assert cache.get("example.com")["serial"] == 3
+    assert cache.stats()["prefetches"] == 2
+
+
+def test_idle_host_is_not_refreshed(clock):
+    probe = FakeProbe(clock)
+    cache = TLSCertCache(probe, max_age=3600, prefetch_min_hits=2, prefetch_window=900, workers=1)
+    for _ in range(3):
+        cache.get("example.com")
+
+    clock.now += 3000
+    assert cache.refresh_due() == 1
+    drain(cache)
+
+    # Not looked up since the first refresh, more than max_age ago
+    clock.now += 3000
+    assert cache.refresh_due() == 0
+    assert len(probe.calls) == 2
+
+
+def test_failed_refresh_keeps_cached_certificate(clock):
+    probe = FakeProbe(clock)
+    cache = TLSCertCache(probe, max_age=3600, prefetch_min_hits=1, prefetch_window=900, workers=1)
+    cache.get("example.com")
+    cache.get("example.com")
+
+    probe.failing = True
+    clock.now += 3000
+    assert cache.refresh_due() == 1
+    drain(cache)
+    info = cache.get("example.com")
+    assert info["has_ssl"] and info["serial"] == 1
+    assert cache.stats()["prefetch_errors"] == 1
@@ -0,0 +1,274 @@
+import base64
+import json
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+
+import token_cache
+from token_cache import InvalidTokenError, TokenVerificationCache, create_firebase_token_cache
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(token_cache, "time", clock)
+    return clock
+
+
+def mint(uid, exp):
+    """Unsigned stand-in for an ID token; the backends below decode it"""
+    return base64.urlsafe_b64encode(json.dumps({"sub": uid, "exp": exp}).encode()).decode()
+
+
+class FakeBackend:
+    """Token checks of the Admin SDK, with switchable revoked/disabled users and outages"""
+    def __init__(self, clock, auth=None):
+        self.clock = clock
+        self.auth = auth
+        self.revoked = set()
+        self.disabled = set()
+        self.outage = None
+        self.calls = {"verify": 0, "check_revoked": 0}
+
+    def verify(self, token, check_revoked=False):
+        self.calls["check_revoked" if check_revoked else "verify"] += 1
+        if self.outage is not None:
+            raise self.outage
+        claims = json.loads(base64.urlsafe_b64decode(token))
+        if claims["exp"] <= self.clock.now:
+            raise self._error("InvalidIdTokenError", "Token expired")
+        if check_revoked and claims["sub"] in self.disabled:
+            raise self._error("UserDisabledError", "The user record is disabled")
+        if check_revoked and claims["sub"] in self.revoked:
+            raise self._error("RevokedIdTokenError", "The Firebase ID token has been revoked")
+        claims["uid"] = claims["sub"]
+        return claims
+
+    def check_revoked(self, token):
+        return self.verify(token, check_revoked=True)
+
+    def _error(self, name, message):
+        if self.auth is None:
+            return InvalidTokenError(message)
+        return getattr(self.auth, name)(message)
+
+
+def fake_auth_module():
+    """The parts of firebase_admin.auth the token cache uses"""
+    auth = types.SimpleNamespace()
+    auth.InvalidIdTokenError = type("InvalidIdTokenError", (ValueError,), {})
+    auth.RevokedIdTokenError = type("RevokedIdTokenError", (auth.InvalidIdTokenError,), {})
+    # Not an InvalidIdTokenError in the Admin SDK either
+    auth.UserDisabledError = type("UserDisabledError", (ValueError,), {})
+    auth.CertificateFetchError = type("CertificateFetchError", (Exception,), {})
+    return auth
+
+
+def test_verified_token_is_served_from_cache(clock):
+    backend = FakeBackend(clock)
+    cache = TokenVerificationCache(backend.verify, revocation_check_interval=0)
+    token = mint("alice", clock.now + 3600)
+
+    assert cache.verify(token)["uid"] == "alice"
+    assert cache.verify(token)["uid"] == "alice"
+    assert backend.calls["verify"] == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_cached_token_expires_with_its_exp_claim(clock):
+    backend = FakeBackend(clock)
+    cache = TokenVerificationCache(backend.verify, revocation_check_interval=0)
+    token = mint("alice", clock.now + 60)
+    cache.verify(token)
+
+    clock.now += 61
+    with pytest.raises(InvalidTokenError):
+        cache.verify(token)
+    assert backend.calls["verify"] == 2
+
+
+def test_rejected_token_is_remembered(clock):
+    backend = FakeBackend(clock)
+    cache = TokenVerificationCache(backend.verify, revocation_check_interval=0, invalid_ttl=30)
+    token = mint("alice", clock.now - 1)
+
+    for _ in range(2):
+        with pytest.raises(InvalidTokenError):
+            cache.verify(token)
+    assert backend.calls["verify"] == 1
+    assert cache.stats()["rejected"] == 1
+
+
+def test_revocation_is_rechecked_after_interval(clock):
+    backend = FakeBackend(clock)
+    cache = TokenVerificationCache(backend.verify, check_revoked=backend.check_revoked,
+                                   revocation_check_interval=300)
+    token = mint("alice", clock.now + 3600)
+    cache.verify(token)
+
+    clock.now += 100
+    cache.verify(token)
+    assert backend.calls["check_revoked"] == 1
+
+    clock.now += 300
+    cache.verify(token)
+    assert backend.calls["check_revoked"] == 2
+    assert cache.stats()["revocation_checks"] == 2
+
+
+def test_revoked_token_is_rejected_on_recheck(clock):
+    backend = FakeBackend(clock)
+    cache = TokenVerificationCache(backend.verify, check_revoked=backend.check_revoked,
+                                   revocation_check_interval=300)
+    token = mint("alice", clock.now + 3600)
+    cache.verify(token)
+
+    backend.revoked.add("alice")
+    clock.now += 301
+    with pytest.raises(InvalidTokenError):
+        cache.verify(token)
+    # The rejection is cached, not the earlier verification
+    with pytest.raises(InvalidTokenError):
+        cache.verify(token)
+    assert backend.calls["check_revoked"] == 2
+
+
+def test_disabled_user_is_logged_out_on_recheck(clock):
+    auth = fake_auth_module()
+    backend = FakeBackend(clock, auth)
+    auth.verify_id_token = backend.verify
+    cache = create_firebase_token_cache(auth)
+    cache.revocation_check_interval = 300
+    token = mint("bob", clock.now + 3600)
+    assert cache.verify(token)["uid"] == "bob"
+
+    backend.disabled.add("bob")
+    clock.now += 301
+    with pytest.raises(auth.UserDisabledError):
+        cache.verify(token)
+    with pytest.raises(auth.UserDisabledError):
+        cache.verify(token)
+
+
+@pytest.mark.parametrize("outage", [requests.ConnectionError("connection reset"), "CertificateFetchError"])
+def test_unreachable_backend_keeps_cached_verification(clock, outage):
+    auth = fake_auth_module()
+    backend = FakeBackend(clock, auth)
+    auth.verify_id_token = backend.verify
+    cache = create_firebase_token_cache(auth)
+    cache.revocation_check_interval = 300
+    token = mint("carol", clock.now + 3600)
+    cache.verify(token)
+
+    backend.outage = getattr(auth, outage)("keys unavailable") if isinstance(outage, str) else outage
+    clock.now += 301
+    assert cache.verify(token)["uid"] == "carol"
+
+
+def test_unexpected_recheck_error_is_raised(clock):
+    auth = fake_auth_module()
+    backend = FakeBackend(clock, auth)
+    auth.verify_id_token = backend.verify
+    cache = create_firebase_token_cache(auth)
+    cache.revocation_check_interval = 300
+    token = mint("dave", clock.now + 3600)
+    cache.verify(token)
+
+    backend.outage = RuntimeError("unexpected")
+    clock.now += 301
+    with pytest.raises(RuntimeError):
+        cache.verify(token)
+
+
+class StaticKeys:
+    def __init__(self, certs):
+        self.certs = certs
+
+    def get(self):
+        return self.certs
+
+
+@pytest.fixture(scope="module")
+def signing_key():
+    """An RSA key and self-signed certificate to mint RS256 ID tokens with"""
+    pytest.importorskip("google.auth")
+    pytest.importorskip("cryptography")
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from google.auth import crypt
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.test")])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    signer = crypt.RSASigner.from_string(private_pem, key_id="test-key")
+    return signer, {"test-key": cert.public_bytes(serialization.Encoding.PEM).decode()}
+
+
+def mint_id_token(signer, project_id="demo-project", uid="alice", lifetime=3600, **overrides):
+    from google.auth import jwt as google_jwt
+    now = int(datetime.now(timezone.utc).timestamp())
+    payload = {
+        "iss": f"https://securetoken.google.com/{project_id}",
+        "aud": project_id,
+        "sub": uid,
+        "iat": now - 10,
+        "exp": now + lifetime,
+        **overrides
+    }
+    return google_jwt.encode(signer, payload).decode()
+
+
+def test_locally_verified_token_is_cached(signing_key):
+    signer, certs = signing_key
+    verifier = token_cache.FirebaseTokenVerifier("demo-project", StaticKeys(certs))
+    calls = []
+
+    def verify(token):
+        calls.append(token)
+        return verifier(token)
+
+    cache = TokenVerificationCache(verify, revocation_check_interval=0)
+    token = mint_id_token(signer)
+    assert cache.verify(token)["uid"] == "alice"
+    assert cache.verify(token)["uid"] == "alice"
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("overrides", [
+    {"aud": "other-project"},
+    {"iss": "https://securetoken.google.com/other-project"},
+    {"sub": ""},
+    {"exp": 1_000_000_000, "iat": 999_999_000},
+])
+def test_locally_minted_bad_tokens_are_rejected(signing_key, overrides):
+    signer, certs = signing_key
+    verifier = token_cache.FirebaseTokenVerifier("demo-project", StaticKeys(certs))
+    cache = TokenVerificationCache(verifier, revocation_check_interval=0)
+    with pytest.raises(InvalidTokenError):
+        cache.verify(mint_id_token(signer, **overrides))
+
+
+def test_token_signed_by_unknown_key_is_rejected(signing_key):
+    signer, certs = signing_key
+    verifier = token_cache.FirebaseTokenVerifier("demo-project", StaticKeys({"another-key": certs["test-key"]}))
+    with pytest.raises(InvalidTokenError):
+        verifier(mint_id_token(signer))
@@ -0,0 +1,167 @@
+import time
+import functools
+import contextvars
+
+# Innermost open span of the current request; None when timings are off
+_current_span = contextvars.ContextVar('timing_span', default=None)
+
+TIMINGS_HEADER = 'X-Timings'
+
+
+class Span:
+    """One timed step; children are the steps that ran inside it"""
+    __slots__ = ("name", "start", "end", "attrs", "children", "origin")
+
+    def __init__(self, name, origin=None, attrs=None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+        self.children = []
+        self.origin = self.start if origin is None else origin
+
+    def to_dict(self):
+        """
+        Convert the span tree for JSON responses.
+
+        Returns:
+            dict: name, start_ms (offset from the root), duration_ms, optional
+                attrs and children ordered by start
+        """
+        end = self.end if self.end is not None else time.perf_counter()
+        entry = {
+            "name": self.name,
+            "start_ms": round((self.start - self.origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3)
+        }
+        if self.attrs:
+            entry["attrs"] = self.attrs
+        if self.children:
+            entry["children"] = [child.to_dict() for child in sorted(self.children, key=lambda c: c.start)]
+        return entry
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _ChildSpan:
+    __slots__ = ("parent", "span", "token")
+
+    def __init__(self, parent, name, attrs):
+        self.parent = parent
+        self.span = Span(name, parent.origin, attrs)
+        self.token = None
+
+    def __enter__(self):
+        self.span.start = time.perf_counter()
+        # list.append is atomic, so spans from worker threads can share a parent
+        self.parent.children.append(self.span)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, *exc):
+        self.span.end = time.perf_counter()
+        _current_span.reset(self.token)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Time a block as a child of the current span.
+
+    Costs a single context variable lookup when no timings are being collected.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP
+    return _ChildSpan(parent, name, attrs or None)
+
+
+def timed(name=None):
+    """Decorator recording each call of a function as a span"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parent = _current_span.get()
+            if parent is None:
+                return func(*args, **kwargs)
+            with _ChildSpan(parent, label, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_collection(name="request"):
+    """
+    Open a root span for the current context.
+
+    Returns:
+        tuple: (root span, token for stop_collection)
+    """
+    root = Span(name)
+    return root, _current_span.set(root)
+
+
+def stop_collection(root, token):
+    root.end = time.perf_counter()
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Token from another context (e.g. a server that switched contexts mid-request)
+        _current_span.set(None)
+
+
+def timings_requested(req):
+    """Check the timings=1 query flag or the X-Timings header"""
+    value = req.args.get('timings') or req.headers.get(TIMINGS_HEADER, '')
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def init_app(app, endpoints):
+    """
+    Add a "timings" span tree to JSON responses of the given endpoints on request.
+
+    Args:
+        app: Flask app
+        endpoints: Endpoint names that support timings
+    """
+    from flask import request, g
+
+    endpoints = set(endpoints)
+
+    @app.before_request
+    def _start_timings():
+        if request.endpoint in endpoints and request.method != 'OPTIONS' and timings_requested(request):
+            g.timing_root, g.timing_token = start_collection(f"{request.method} {request.path}")
+
+    @app.after_request
+    def _attach_timings(response):
+        root = g.get('timing_root')
+        if root is None:
+            return response
+        root.end = time.perf_counter()
+        if response.is_json and not response.is_streamed:
+            data = response.get_json(silent=True)
+            if isinstance(data, dict):
+                data["timings"] = root.to_dict()
+                response.set_data(app.json.dumps(data))
+        return response
+
+    @app.teardown_request
+    def _stop_timings(exc=None):
+        # Also runs when the view raised, so the root never leaks into later requests
+        root = g.pop('timing_root', None)
+        if root is not None:
+            stop_collection(root, g.pop('timing_token'))
@@ -0,0 +1,289 @@
+"""
+Expiry-aware cache of TLS certificate information.
+
+Certificates change every few weeks at most, so a host's certificate details
+are kept until shortly before the certificate's notAfter date or a maximum
+age, whichever comes first. Failed probes are remembered briefly. Hosts that
+keep being looked up are re-probed in the background before their entry
+expires, so repeat domains never wait on a TLS handshake; batches probe
+their uncached hosts concurrently.
+"""
+import os
+import ssl
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import cache_lookups
+from single_flight import SingleFlight
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# "off" probes every host on every lookup
+TLS_CACHE_MODE = os.environ.get('TLS_CACHE', 'on').lower()
+TLS_CACHE_SIZE = int(os.environ.get('TLS_CACHE_SIZE', 10000))
+# Longest a certificate is trusted without looking at it again (seconds)
+TLS_CACHE_MAX_AGE = float(os.environ.get('TLS_CACHE_MAX_AGE', 86400))
+# Entries expire this many seconds before the certificate's notAfter
+TLS_CACHE_EXPIRY_MARGIN = float(os.environ.get('TLS_CACHE_EXPIRY_MARGIN', 3600))
+# Seconds a failed probe (no TLS, refused, timed out) is remembered
+TLS_CACHE_ERROR_TTL = float(os.environ.get('TLS_CACHE_ERROR_TTL', 300))
+# Lookups an entry needs before it is refreshed in the background
+TLS_PREFETCH_MIN_HITS = int(os.environ.get('TLS_PREFETCH_MIN_HITS', 2))
+# Refresh popular entries this many seconds before they expire
+TLS_PREFETCH_WINDOW = float(os.environ.get('TLS_PREFETCH_WINDOW', 900))
+TLS_PREFETCH_INTERVAL = float(os.environ.get('TLS_PREFETCH_INTERVAL', 60))
+# Concurrent probes for batches and background refreshes
+TLS_PROBE_WORKERS = int(os.environ.get('TLS_PROBE_WORKERS', 8))
+
+
+def certificate_expiry(info):
+    """
+    Epoch seconds of a probe result's notAfter date.
+
+    Args:
+        info: Result of the TLS probe
+
+    Returns:
+        float: Expiry time, or None when the result has no parseable date
+    """
+    valid_until = info.get("valid_until")
+    if not info.get("has_ssl") or not isinstance(valid_until, str):
+        return None
+    try:
+        return float(ssl.cert_time_to_seconds(valid_until))
+    except ValueError:
+        return None
+
+
+class _Entry:
+    __slots__ = ("info", "expires_at", "fetched_at", "hits", "last_hit", "refreshing")
+
+    def __init__(self, info, expires_at, fetched_at, hits=0, last_hit=None):
+        self.info = info
+        self.expires_at = expires_at
+        self.fetched_at = fetched_at
+        self.hits = hits
+        self.last_hit = fetched_at if last_hit is None else last_hit
+        self.refreshing = False
+
+
+class TLSCertCache:
+    """
+    Bounded cache of certificate information, keyed by host.
+
+    Args:
+        probe: Callable(host) -> certificate info dict (never raises for network errors)
+        enabled: False passes every lookup straight to the probe
+    """
+    def __init__(self, probe, enabled=True, max_size=TLS_CACHE_SIZE, max_age=TLS_CACHE_MAX_AGE,
+                 expiry_margin=TLS_CACHE_EXPIRY_MARGIN, error_ttl=TLS_CACHE_ERROR_TTL,
+                 prefetch_min_hits=TLS_PREFETCH_MIN_HITS, prefetch_window=TLS_PREFETCH_WINDOW,
+                 prefetch_interval=TLS_PREFETCH_INTERVAL, workers=TLS_PROBE_WORKERS):
+        self._probe = probe
+        self.enabled = enabled
+        self.max_size = max_size
+        self.max_age = max_age
+        self.expiry_margin = expiry_margin
+        self.error_ttl = error_ttl
+        self.prefetch_min_hits = prefetch_min_hits
+        self.prefetch_window = prefetch_window
+        self.prefetch_interval = prefetch_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("tls", lock_dir=None)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tls-probe")
+        self._thread = None
+        self._stats = {"hits": 0, "misses": 0, "probes": 0, "failed_probes": 0, "prefetches": 0,
+                       "prefetch_errors": 0}
+
+    def get(self, host):
+        """
+        Certificate information of a host, from the cache when possible.
+
+        Args:
+            host: Host name (as found in the URL's netloc)
+
+        Returns:
+            dict: Certificate information, owned by the caller
+        """
+        if not self.enabled:
+            return self._probe(host)
+        key = host.lower()
+        info = self._lookup(key)
+        if info is not None:
+            return info
+        return self._get_uncached(host)
+
+    def _get_uncached(self, host):
+        # Concurrent misses for the same host share one probe
+        key = host.lower()
+        return dict(self._flight.do(key, self._fetch, key, host))
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() >= entry.expires_at:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                cache_lookups.inc("tls", "miss")
+                return None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            entry.last_hit = time.time()
+            self._stats["hits"] += 1
+            info = dict(entry.info)
+            age_days = int((time.time() - entry.fetched_at) // 86400)
+        cache_lookups.inc("tls", "hit")
+        if age_days and info.get("has_ssl") and isinstance(info.get("days_until_expiry"), int):
+            # The probe counted days from when it ran
+            info["days_until_expiry"] = max(0, info["days_until_expiry"] - age_days)
+        return info
+
+    def _fetch(self, key, host):
+        info = self._probe(host)
+        self._store(key, info)
+        return info
+
+    def _store(self, key, info, refresh=False):
+        now = time.time()
+        with self._lock:
+            self._stats["probes"] += 1
+            if not info.get("has_ssl"):
+                self._stats["failed_probes"] += 1
+        expires_at = self.expires_at(info, now)
+        if expires_at <= now:
+            return
+        with self._lock:
+            current = self._entries.get(key)
+            if refresh and current is not None:
+                # A refresh is not a lookup: the host keeps its popularity and its place in the LRU order
+                self._entries[key] = _Entry(dict(info), expires_at, now, current.hits, current.last_hit)
+                return
+            self._entries[key] = _Entry(dict(info), expires_at, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def expires_at(self, info, now):
+        """
+        When a probe result stops being served.
+
+        Args:
+            info: Result of the TLS probe
+            now: Time of the probe (epoch seconds)
+
+        Returns:
+            float: Epoch seconds; the earlier of the maximum age and the
+                certificate's notAfter minus the margin
+        """
+        if not info.get("has_ssl"):
+            return now + self.error_ttl
+        expires_at = now + self.max_age
+        not_after = certificate_expiry(info)
+        if not_after is not None:
+            expires_at = min(expires_at, not_after - self.expiry_margin)
+        return expires_at
+
+    def prefetch(self, hosts):
+        """
+        Probe the uncached hosts of a batch concurrently, in the background.
+
+        Args:
+            hosts: Host names about to be analyzed
+
+        Returns:
+            int: Number of probes queued
+        """
+        if not self.enabled:
+            return 0
+        queued = 0
+        now = time.time()
+        for host in dict.fromkeys(host.lower() for host in hosts if host):
+            with self._lock:
+                entry = self._entries.get(host)
+                if entry is not None and entry.expires_at > now:
+                    continue
+            self._executor.submit(self._background_get, host)
+            queued += 1
+        return queued
+
+    def _background_get(self, host):
+        try:
+            self._flight.do(host, self._fetch, host, host)
+        except Exception as e:
+            logger.debug("Background TLS probe of %s failed: %s", host, e)
+
+    def start(self):
+        """Start refreshing popular entries in the background"""
+        if self._thread is not None or not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, name="tls-prefetch", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.prefetch_interval)
+            try:
+                self.refresh_due()
+            except Exception as e:
+                logger.warning("TLS certificate prefetch failed: %s", e)
+
+    def refresh_due(self):
+        """
+        Queue a refresh for every popular entry that expires within the prefetch window.
+
+        Popular entries not looked up for longer than the maximum age are
+        left to expire, so hosts that stopped being seen are not re-probed forever.
+
+        Returns:
+            int: Number of refreshes queued
+        """
+        now = time.time()
+        due = []
+        with self._lock:
+            for key, entry in self._entries.items():
+                if (entry.hits >= self.prefetch_min_hits and not entry.refreshing
+                        and entry.expires_at - now <= self.prefetch_window
+                        and now - entry.last_hit <= self.max_age):
+                    entry.refreshing = True
+                    due.append(key)
+        for key in due:
+            self._executor.submit(self._refresh, key)
+        return len(due)
+
+    def _refresh(self, key):
+        try:
+            info = self._probe(key)
+        except Exception as e:
+            info = {"has_ssl": False, "error": str(e)}
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None:
+                current.refreshing = False
+            if (info.get("has_ssl") or current is None or not current.info.get("has_ssl")
+                    or current.expires_at <= time.time()):
+                self._stats["prefetches"] += 1
+            else:
+                # The cached certificate stays usable until it expires; lookups after that probe again
+                self._stats["prefetch_errors"] += 1
+                logger.info("Background TLS refresh of %s failed, keeping the cached certificate", key)
+                return
+        self._store(key, info, refresh=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["popular"] = sum(1 for entry in self._entries.values() if entry.hits >= self.prefetch_min_hits)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+        stats["enabled"] = self.enabled
+        stats["max_age"] = self.max_age
+        stats["background_prefetch"] = self._thread is not None
+        return stats
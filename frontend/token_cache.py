@@ -0,0 +1,314 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import requests
+
+from metrics import cache_lookups
+
+# google-auth ships with firebase-admin; without it tokens are verified by the SDK
+try:
+    from google.auth import jwt as google_jwt
+    google_auth_available = True
+except ImportError:
+    google_jwt = None
+    google_auth_available = False
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Public certificates Google signs Firebase ID tokens with
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 50000))
+# Seconds between revocation checks of a cached token; 0 disables revocation checks
+REVOCATION_CHECK_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_CHECK_INTERVAL', 0))
+# Seconds a rejected token is remembered so repeated bad tokens are not re-verified
+INVALID_TOKEN_TTL = float(os.environ.get('INVALID_TOKEN_CACHE_TTL', 60))
+# Refresh the signing keys this many seconds before Google's max-age runs out
+KEY_REFRESH_MARGIN = float(os.environ.get('TOKEN_KEY_REFRESH_MARGIN', 300))
+KEY_RETRY_INTERVAL = 30.0
+
+
+class InvalidTokenError(ValueError):
+    """Raised when an ID token fails local verification"""
+
+
+class PublicKeySet:
+    """
+    Google's token signing certificates.
+
+    Keys are fetched once and kept for the max-age Google sends with them.
+    Once start() is called a background thread refreshes them shortly before
+    they expire, so verification never waits on the certificate download.
+    """
+    def __init__(self, url=GOOGLE_CERTS_URL, refresh_margin=KEY_REFRESH_MARGIN):
+        self.url = url
+        self.refresh_margin = refresh_margin
+        self._certs = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.refreshes = 0
+        self.last_error = None
+
+    def get(self):
+        """
+        Get the current certificates, fetching them if they have expired.
+
+        Returns:
+            dict: Key id to PEM certificate
+        """
+        if self._certs is None or time.time() >= self._expires_at:
+            with self._lock:
+                if self._certs is None or time.time() >= self._expires_at:
+                    self.refresh()
+        return self._certs
+
+    def refresh(self):
+        """Download the certificates and record when they expire"""
+        response = requests.get(self.url, timeout=10)
+        response.raise_for_status()
+        self._certs = response.json()
+        self._expires_at = time.time() + self._max_age(response.headers.get('Cache-Control', ''))
+        self.refreshes += 1
+        self.last_error = None
+        logger.info("Refreshed %s token signing keys", len(self._certs))
+
+    @staticmethod
+    def _max_age(cache_control):
+        match = re.search(r'max-age=(\d+)', cache_control)
+        return int(match.group(1)) if match else 3600
+
+    def start(self):
+        """Start refreshing the keys in the background"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="token-key-refresh", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self._lock:
+                    self.refresh()
+                wait = max(KEY_RETRY_INTERVAL, self._expires_at - time.time() - self.refresh_margin)
+            except Exception as e:
+                # Cached keys stay usable until they expire; get() refetches after that
+                self.last_error = str(e)
+                logger.warning("Could not refresh token signing keys: %s", e)
+                wait = KEY_RETRY_INTERVAL
+            time.sleep(wait)
+
+    def status(self):
+        return {
+            "keys": len(self._certs) if self._certs else 0,
+            "expires_in_seconds": round(max(0.0, self._expires_at - time.time()), 1),
+            "refreshes": self.refreshes,
+            "background_refresh": self._thread is not None,
+            "last_error": self.last_error
+        }
+
+
+class FirebaseTokenVerifier:
+    """
+    Verify Firebase ID tokens locally, the same checks the Admin SDK makes.
+
+    Args:
+        project_id: Firebase project the tokens are issued for
+        keys: PublicKeySet (or any object with get() returning kid -> PEM)
+    """
+    def __init__(self, project_id, keys):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.keys = keys
+
+    def __call__(self, token):
+        try:
+            header = google_jwt.decode_header(token)
+            if header.get('alg') != 'RS256' or not header.get('kid'):
+                raise InvalidTokenError("ID token must be RS256-signed and carry a key id")
+            claims = google_jwt.decode(token, certs=self.keys.get(), audience=self.project_id)
+        except InvalidTokenError:
+            raise
+        except ValueError as e:
+            raise InvalidTokenError(str(e))
+
+        if claims.get('iss') != self.issuer:
+            raise InvalidTokenError(f"ID token has incorrect issuer: {claims.get('iss')}")
+        subject = claims.get('sub')
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidTokenError("ID token has an invalid subject")
+        claims['uid'] = subject
+        return claims
+
+
+class _Entry:
+    __slots__ = ("claims", "error", "expires_at", "checked_at")
+
+    def __init__(self, claims, error, expires_at, checked_at):
+        self.claims = claims
+        self.error = error
+        self.expires_at = expires_at
+        self.checked_at = checked_at
+
+
+class TokenVerificationCache:
+    """
+    Bounded cache of verified ID tokens, keyed by the SHA-256 of the token.
+
+    A verified token is served from memory until its exp claim. If a
+    revocation check interval is set, tokens are re-checked for revocation
+    at most that often. Rejected tokens are remembered for a short while.
+
+    Args:
+        verify: Callable(token) -> claims; raises for invalid tokens
+        check_revoked: Callable(token) -> claims that also checks revocation
+        invalid_errors: Exception types that mean the token itself is bad
+            (as opposed to e.g. a failed key download) and may be cached
+        transient_errors: Exception types of a failed revocation re-check
+            (transport, key download) that keep the cached verification;
+            any other error of a re-check is raised
+        keys: PublicKeySet used by verify, reported in stats (optional)
+    """
+    def __init__(self, verify, check_revoked=None, invalid_errors=(InvalidTokenError,),
+                 transient_errors=(requests.RequestException,),
+                 revocation_check_interval=REVOCATION_CHECK_INTERVAL, max_size=TOKEN_CACHE_SIZE,
+                 invalid_ttl=INVALID_TOKEN_TTL, keys=None):
+        self._verify = verify
+        self.keys = keys
+        self._check_revoked = check_revoked
+        self.invalid_errors = invalid_errors
+        self.transient_errors = transient_errors
+        self.revocation_check_interval = revocation_check_interval if check_revoked else 0
+        self.max_size = max_size
+        self.invalid_ttl = invalid_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rejected": 0, "revocation_checks": 0}
+
+    def verify(self, token):
+        """
+        Verify an ID token, from the cache when possible.
+
+        Returns:
+            dict: Decoded token claims
+
+        Raises:
+            Exception: The verification error (possibly cached)
+        """
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+        revocation_due = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now >= entry.expires_at:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry.error is not None:
+                    self._stats["hits"] += 1
+                    cache_lookups.inc("id_token", "hit")
+                    raise entry.error
+                revocation_due = (self.revocation_check_interval > 0 and
+                                  now - entry.checked_at >= self.revocation_check_interval)
+                if not revocation_due:
+                    self._stats["hits"] += 1
+                    cache_lookups.inc("id_token", "hit")
+                    return entry.claims
+            else:
+                self._stats["misses"] += 1
+                cache_lookups.inc("id_token", "miss")
+
+        check_revocation = self.revocation_check_interval > 0
+        try:
+            if check_revocation:
+                claims = self._check_revoked(token)
+            else:
+                claims = self._verify(token)
+        except self.invalid_errors as e:
+            with self._lock:
+                self._stats["rejected"] += 1
+            self._store(key, _Entry(None, e, now + self.invalid_ttl, now))
+            raise
+        except self.transient_errors as e:
+            if not revocation_due:
+                raise
+            # The token was valid when cached; an unreachable backend does not log the user out
+            logger.warning("Token revocation check failed, using cached verification: %s", e)
+            return entry.claims
+
+        if check_revocation:
+            with self._lock:
+                self._stats["revocation_checks"] += 1
+        self._store(key, _Entry(claims, None, float(claims.get('exp', now)), now))
+        return claims
+
+    def _store(self, key, entry):
+        if entry.expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+        stats["revocation_check_interval"] = self.revocation_check_interval
+        stats["signing_keys"] = self.keys.status() if self.keys else None
+        return stats
+
+
+def _error_types(module, *names):
+    # Exception classes that older SDK versions may not have
+    return tuple(getattr(module, name) for name in names if isinstance(getattr(module, name, None), type))
+
+
+def create_firebase_token_cache(auth, project_id=None):
+    """
+    Build the token cache used by the app.
+
+    Tokens are verified locally against proactively refreshed Google keys
+    when google-auth is installed and the project id is known; otherwise
+    each cache miss goes through auth.verify_id_token.
+
+    Args:
+        auth: The firebase_admin.auth module
+        project_id: Firebase project id (optional)
+
+    Returns:
+        TokenVerificationCache: The cache
+    """
+    # Revoked tokens are InvalidIdTokenErrors; disabled accounts raise UserDisabledError
+    invalid_errors = (InvalidTokenError, auth.InvalidIdTokenError) + _error_types(auth, 'UserDisabledError')
+    transient_errors = (requests.RequestException,) + _error_types(auth, 'CertificateFetchError')
+    try:
+        from firebase_admin import exceptions as firebase_exceptions
+        transient_errors += _error_types(firebase_exceptions, 'UnavailableError', 'DeadlineExceededError')
+    except ImportError:
+        pass
+
+    def check_revoked(token):
+        return auth.verify_id_token(token, check_revoked=True)
+
+    keys = None
+    if google_auth_available and project_id:
+        keys = PublicKeySet()
+        keys.start()
+        verify = FirebaseTokenVerifier(project_id, keys)
+        logger.info("Verifying ID tokens locally for project %s", project_id)
+    else:
+        verify = auth.verify_id_token
+        logger.info("Verifying ID tokens through the Firebase Admin SDK")
+
+    return TokenVerificationCache(verify, check_revoked=check_revoked, invalid_errors=invalid_errors,
+                                  transient_errors=transient_errors, keys=keys)
@@ -0,0 +1,241 @@
+"""
+Single-pass lexical statistics of a URL.
+
+Feature extraction, the NLP features, the suspicious pattern check and the
+rule-based fallback all count characters of the same URL. The scanner
+classifies every character once with a per-byte class table (str.translate
+runs in C), derives all counts for the whole URL, its host and its path from
+the class strings, and caches the result per URL so every caller shares one
+scan.
+
+Non-ASCII input keeps the exact semantics of str.isdigit / str.isalpha /
+str.lower: only its non-ASCII characters are classified one by one.
+"""
+import os
+import re
+import math
+from operator import mul
+from collections import Counter
+from functools import lru_cache
+from typing import NamedTuple
+from urllib.parse import urlparse
+
+# URLs and hosts whose scans are kept
+LEXER_CACHE_SIZE = int(os.environ.get('LEXER_CACHE_SIZE', 4096))
+
+SPECIAL_CHARS = '!@#$%^&*()_+-={}[]|\\:;"\'<>,.?/'
+VOWELS = 'aeiou'
+CONSONANTS = 'bcdfghjklmnpqrstvwxyz'
+COMMON_ENGLISH_BIGRAMS = ("th", "he", "in", "er", "an", "re", "on", "at", "en", "nd", "ti", "es", "or")
+
+# Every keyword any of the URL checks looks for; callers filter by their own list
+URL_KEYWORDS = ('login', 'signin', 'verify', 'secure', 'account', 'update', 'confirm', 'password',
+                'credential', 'wallet', 'authenticate', 'verification', 'banking', 'security', 'alert',
+                'suspended', 'unusual', 'payment', 'ebay', 'paypal')
+
+# Character classes: d digit, v vowel, c consonant, s special, o anything else (ASCII only;
+# non-ASCII characters pass through translate unchanged)
+DIGIT, VOWEL, CONSONANT, SPECIAL, OTHER = 'd', 'v', 'c', 's', 'o'
+
+
+def _class_of(code):
+    char = chr(code)
+    if char.isdigit():
+        return DIGIT
+    if char.lower() in VOWELS and char.isalpha():
+        return VOWEL
+    if char.isalpha():
+        return CONSONANT
+    if char in SPECIAL_CHARS:
+        return SPECIAL
+    return OTHER
+
+
+CLASS_TABLE = str.maketrans({code: _class_of(code) for code in range(128)})
+
+_REPEATED_CHARS = re.compile(r'(.)\1{2,}')
+# Zero-width lookahead finds every position a bigram starts at; no bigram repeats a
+# character, so this equals the sum of the per-bigram str.count() results
+_BIGRAMS = re.compile('(?=(?:' + '|'.join(COMMON_ENGLISH_BIGRAMS) + '))')
+_WORDS = re.compile(r'[a-zA-Z]+')
+_IP_HOST = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
+_IP_PREFIX = re.compile(r'\d+\.\d+\.\d+\.\d+')
+
+
+class SectionStats(NamedTuple):
+    """Character counts of one part of a URL"""
+    length: int
+    digits: int
+    letters: int
+    vowels: int
+    consonants: int
+    special: int
+    slashes: int
+
+    @property
+    def digit_percentage(self):
+        return (self.digits / self.length) * 100 if self.length > 0 else 0
+
+    @property
+    def letter_percentage(self):
+        return (self.letters / self.length) * 100 if self.length > 0 else 0
+
+
+class NameStats(NamedTuple):
+    """Language statistics of a domain name without its TLD"""
+    text: str
+    entropy: float
+    vowels: int
+    consonants: int
+    has_digits: bool
+    repeated_chars: bool
+    bigram_count: int
+    word_count: int
+    word_letters: int
+
+
+class HostScan(NamedTuple):
+    host: str
+    stats: SectionStats
+    entropy: float
+    name: NameStats
+    is_ip: bool
+    ip_prefix: bool
+
+
+class URLScan(NamedTuple):
+    url: str
+    lower: str
+    parsed: object
+    whole: SectionStats
+    host: HostScan
+    path: str
+    path_stats: SectionStats
+    numeric_path: bool
+    keywords: frozenset
+
+
+def entropy_from_counts(counts, length):
+    """
+    Shannon entropy from character counts.
+
+    Args:
+        counts: Character -> occurrences, in first-occurrence order
+        length: Length of the string counted
+
+    Returns:
+        float: Entropy in bits
+    """
+    if not length:
+        return 0
+    frequencies = [count / length for count in counts.values()]
+    return -sum(map(mul, frequencies, map(math.log2, frequencies)))
+
+
+def section_stats(text, classes=None):
+    """
+    Count the character classes of a string in one translate pass.
+
+    Args:
+        text: String to count
+        classes: text already translated with CLASS_TABLE (e.g. a slice of a longer translation)
+
+    Returns:
+        SectionStats: The counts
+    """
+    if classes is None:
+        classes = text.translate(CLASS_TABLE)
+    digits = classes.count(DIGIT)
+    vowels = classes.count(VOWEL)
+    consonants = classes.count(CONSONANT)
+    letters = vowels + consonants
+    if not text.isascii():
+        for char in text:
+            if char.isascii():
+                continue
+            digits += char.isdigit()
+            letters += char.isalpha()
+            lowered = char.lower()
+            vowels += lowered in VOWELS
+            consonants += lowered in CONSONANTS
+    return SectionStats(len(text), digits, letters, vowels, consonants, classes.count(SPECIAL), text.count('/'))
+
+
+def _name_stats(name, classes):
+    stats = section_stats(name, classes)
+    words = _WORDS.findall(name)
+    return NameStats(
+        text=name,
+        entropy=entropy_from_counts(Counter(name), len(name)),
+        vowels=stats.vowels,
+        consonants=stats.consonants,
+        has_digits=stats.digits > 0,
+        repeated_chars=_REPEATED_CHARS.search(name) is not None,
+        bigram_count=len(_BIGRAMS.findall(name.lower())),
+        word_count=len(words),
+        word_letters=sum(len(word) for word in words)
+    )
+
+
+@lru_cache(maxsize=LEXER_CACHE_SIZE)
+def scan_host(host):
+    """
+    Lexical statistics of a host name, including its name without the TLD.
+
+    Args:
+        host: Host name as the caller uses it (extract_features passes it lowercased)
+
+    Returns:
+        HostScan: The statistics
+    """
+    parts = host.split('.')
+    name = '.'.join(parts[:-1]) if len(parts) > 1 else parts[0]
+    # The name is a prefix of the host, so its classes are a prefix of the host's
+    classes = host.translate(CLASS_TABLE)
+    return HostScan(
+        host=host,
+        stats=section_stats(host, classes),
+        entropy=entropy_from_counts(Counter(host), len(host)),
+        name=_name_stats(name, classes[:len(name)]),
+        is_ip=_IP_HOST.match(host) is not None,
+        ip_prefix=_IP_PREFIX.match(host) is not None
+    )
+
+
+@lru_cache(maxsize=LEXER_CACHE_SIZE)
+def scan_url(url):
+    """
+    Lexical statistics of a URL, its lowercased host and its lowercased path.
+
+    Args:
+        url: URL as given to the analysis
+
+    Returns:
+        URLScan: The statistics; shared between callers, do not modify
+    """
+    parsed = urlparse(url)
+    lower = url.lower()
+    path = parsed.path.lower()
+    path_stats = section_stats(path)
+    return URLScan(
+        url=url,
+        lower=lower,
+        parsed=parsed,
+        whole=section_stats(url),
+        host=scan_host(parsed.netloc.lower()),
+        path=path,
+        path_stats=path_stats,
+        numeric_path=bool(path) and _all_digits_or_slashes(path, path_stats),
+        keywords=frozenset(keyword for keyword in URL_KEYWORDS if keyword in lower)
+    )
+
+
+def _all_digits_or_slashes(path, stats):
+    if path.isascii():
+        return stats.digits + stats.slashes == stats.length
+    return all(c.isdigit() or c == '/' for c in path)
+
+
+def cache_info():
+    """Hit and miss counts of the URL and host scan caches"""
+    return {"url": scan_url.cache_info()._asdict(), "host": scan_host.cache_info()._asdict()}